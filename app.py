@@ -5,13 +5,12 @@ import streamlit as st
 import streamlit.components.v1 as components
 import sys
 import os
-import json
 import random
 import time
 import uuid
 import base64
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Mapping
 
 # servicesディレクトリをパスに追加
 sys.path.append(os.path.join(os.path.dirname(__file__), 'services'))
@@ -21,6 +20,10 @@ from services.video_helper import display_video, ensure_video_directories  # noq
 from services.quiz_helper import load_quiz_data  # noqa: E402
 from services.store import log_player_session  # noqa: E402
 from services.image_helper import get_image_path  # noqa: E402
+from services.board_repository import load_board  # noqa: E402
+from services.board_routing import MAX_SPIN  # noqa: E402
+from services.board_effects import apply_effects  # noqa: E402
+from services.config import get_config_service  # noqa: E402
 
 # pagesモジュールから関数をインポート
 from pages import (
@@ -371,135 +374,10 @@ def staff_access_enabled() -> bool:
 
 
 def apply_tooth_effects(game_state, landing_cell, feedback):
-    """ボードイベントに応じた歯の状態変化を適用"""
+    """ボードイベントに応じた歯の状態変化を適用（マスの effects を順に呼ぶ）"""
     teeth_service.ensure_tooth_state(game_state)
     tooth_messages = feedback.setdefault('tooth_messages', [])
-    title = landing_cell.get('title', '')
-    action = landing_cell.get('action')
-    effect_applied = False
-
-    if title == "虫歯クイズ":
-        if teeth_service.upgrade_to_adult(game_state):
-            # 抜けていた歯も含めて完全に28本にリセット
-            teeth_service.reset_all_teeth_to_healthy(game_state)
-            teeth_service.sync_teeth_count(game_state)
-            game_state['teeth_count'] = 28
-            game_state['teeth_max'] = 28
-            game_state['teeth_missing'] = 0
-            st.session_state.teeth_count = 28
-            tooth_messages.append(('success', '✨ 大人の歯が ぜんぶ生えそろったよ！28本になったね。'))
-            effect_applied = True
-    if title == "初めて乳歯が抜けた" or title == "歯が抜けた":
-        # 現在の歯の数を確認
-        teeth_data = teeth_service.load_teeth_json()
-        max_tooth_number = max(int(k) for k in teeth_data["UR"].keys())
-        
-        if max_tooth_number <= 5:
-            # 乳歯（20本）の場合は永久歯（28本）に移行
-            new_teeth = teeth_service.transition_to_adult_teeth()
-            st.session_state.teeth_data = new_teeth
-            tooth_messages.append(('success', '✨ 大人の歯に生え変わったよ！全部で28本になったね。'))
-            effect_applied = True
-        else:
-            # すでに永久歯の場合は通常の歯の喪失処理
-            lost = teeth_service.lose_primary_tooth(game_state, count=1)
-            if lost:
-                tooth_messages.append(('info', '👶 乳歯が1本ぬけたよ。大人の歯がはえてくるまでまっていよう！'))
-                effect_applied = True
-            # teeth.jsonも更新
-            teeth_service.update_tooth_status_random("E", count=1)
-            st.session_state.teeth_data = teeth_service.load_teeth_json()
-    if title == "虫歯ができた" or title == "むし歯治療":
-        damaged = teeth_service.damage_random_tooth(
-            game_state,
-            kinds=(
-                "first_premolar",
-                "second_premolar",
-                "first_molar",
-                "second_molar",
-                "primary_first_molar",
-                "primary_second_molar",
-            ),
-        )
-        if damaged:
-            if title == "むし歯治療":
-                # 治療マスの場合は、治療ボタンを表示するフラグをセット
-                tooth_messages.append(('warning', '🦷 むし歯ができちゃった！治療を受けよう！'))
-                st.session_state.needs_caries_treatment = True
-            else:
-                tooth_messages.append(('warning', '⚠️ 虫歯ができちゃった…定期検診でなおそう！'))
-            effect_applied = True
-        # teeth.jsonも更新
-        teeth_service.update_tooth_status_random("C", count=1)
-        st.session_state.teeth_data = teeth_service.load_teeth_json()
-    if title == "ジュースをおねだり" or title == "ジュース":
-        stained = teeth_service.stain_teeth(game_state, count=3)
-        if stained:
-            tooth_messages.append(('warning', '🥤 ジュースばかりで歯がすこし黄ばんできたよ。'))
-            effect_applied = True
-        # teeth.jsonも更新
-        teeth_service.update_tooth_status_random("S", count=3)
-        st.session_state.teeth_data = teeth_service.load_teeth_json()
-    if title == "むし歯を放置" or title == "抜歯":
-        # ランダムに1本の歯を失う
-        lost = teeth_service.lose_random_teeth(game_state, count=1, permanent=True)
-        if lost:
-            tooth_messages.append(('error', '😢 むし歯を放っておいたら歯を1本失ってしまった…'))
-            effect_applied = True
-        # teeth.jsonも更新
-        teeth_service.update_tooth_status_random("E", count=1)
-        st.session_state.teeth_data = teeth_service.load_teeth_json()
-    if title == "バイクで大事故" or title == "バイク事故":
-        lost = teeth_service.lose_specific_teeth(game_state, ["UL1", "UR1"], permanent=True)
-        if lost:
-            tooth_messages.append(('error', '😢 バイク事故で前歯を2本失ってしまった…'))
-            effect_applied = True
-        # teeth.jsonも更新（前歯2本）
-        teeth_data = teeth_service.load_teeth_json()
-        teeth_data["UL"]["1"] = "E"
-        teeth_data["UR"]["1"] = "E"
-        teeth_service.save_teeth_json(teeth_data)
-        st.session_state.teeth_data = teeth_data
-    if title == "茶渋除去" or title == "茶渋" or title == "お茶":
-        if "除去" in title or "クリーニング" in title:
-            cleaned = teeth_service.whiten_teeth(game_state)
-            if cleaned:
-                tooth_messages.append(('success', '✨ 茶渋をきれいにして歯がピカピカになったよ！'))
-                effect_applied = True
-            # teeth.jsonも更新（S→N）
-            teeth_service.restore_stained_teeth()
-            st.session_state.teeth_data = teeth_service.load_teeth_json()
-        else:
-            stained = teeth_service.stain_teeth(game_state, count=3)
-            if stained:
-                tooth_messages.append(('warning', '☕ お茶で茶渋がついてしまった…'))
-                effect_applied = True
-            # teeth.jsonも更新
-            teeth_service.update_tooth_status_random("S", count=3)
-            st.session_state.teeth_data = teeth_service.load_teeth_json()
-    if title == "入れ歯作成" or title == "入れ歯":
-        added = teeth_service.add_prosthetics(game_state, count=2)
-        if added:
-            tooth_messages.append(('info', '🦷 入れ歯でなくなった歯がもどったよ。'))
-            effect_applied = True
-        # teeth.jsonも更新（E→R）
-        teeth_service.restore_missing_teeth(count=2)
-        st.session_state.teeth_data = teeth_service.load_teeth_json()
-    if (landing_cell.get('type') == 'stop' and '検診' in title) or title == "クリーニング":
-        repaired = teeth_service.repair_damaged_teeth(game_state)
-        cleaned = teeth_service.whiten_teeth(game_state)
-        
-        # メッセージを表示（治療がなくても表示）
-        if repaired or cleaned:
-            tooth_messages.append(('success', '🪥 定期検診で歯がきれいになったよ！'))
-        else:
-            tooth_messages.append(('info', '🪥 お口をきれいにしてもらったよ！'))
-        effect_applied = True
-        
-        # teeth.jsonも更新（C→R, S→N）
-        teeth_service.restore_damaged_teeth()
-        teeth_service.restore_stained_teeth()
-        st.session_state.teeth_data = teeth_service.load_teeth_json()
+    effect_applied = apply_effects(landing_cell.get('effects'), game_state, st.session_state, tooth_messages)
 
     teeth_service.sync_teeth_count(game_state)
     st.session_state.teeth_count = game_state.get('teeth_count', st.session_state.get('teeth_count', 0))
@@ -917,13 +795,8 @@ def show_game_board_page():
         """アクション完了後の次のマス計算"""
         board_file = get_board_file_for_age(st.session_state.participant_age)
         try:
-            with open(board_file, 'r', encoding='utf-8') as f:
-                board_data = json.load(f)
-            max_position_index = max(len(board_data) - 1, 0)
-            distance_to_goal = max(0, max_position_index - position)
-            if distance_to_goal <= 0:
-                return []
-            max_reachable = min(3, distance_to_goal)
+            routing = load_board(board_file).routing
+            max_reachable = min(MAX_SPIN, routing.distance_to_goal(position))
             return list(range(1, max_reachable + 1))
         except Exception as e:
             debug_log(f"🔍 DEBUG [compute_allowed_numbers]: Error loading board - {e}")
@@ -955,80 +828,31 @@ def show_game_board_page():
     board_data = []
     current_cell = None
     max_position_index = 0
-    forced_stop_indices = []
-    required_stop_titles = {"虫歯クイズ", "歯周病クイズ", "お仕事体験"}
+    routing = None
     try:
         board_file = get_board_file_for_age(st.session_state.participant_age)
-        with open(board_file, 'r', encoding='utf-8') as f:
-            board_data = json.load(f)
-        max_position_index = max(len(board_data) - 1, 0)
-        if 0 <= current_position < len(board_data) and isinstance(board_data[current_position], dict):
+        board_data = load_board(board_file)
+        max_position_index = board_data.max_position
+        routing = board_data.routing
+        if isinstance(board_data.cell_at(current_position), Mapping):
             current_cell = board_data[current_position]
-        forced_stop_indices = [
-            idx for idx, cell in enumerate(board_data)
-            if isinstance(cell, dict) and (
-                cell.get('type') == 'stop'
-                or cell.get('must_stop')
-                or cell.get('force_stop')
-                or cell.get('title') in required_stop_titles
-            )
-        ]
-    except (FileNotFoundError, json.JSONDecodeError):
+    except (FileNotFoundError, ValueError) as e:
         board_data = []
         current_cell = None
         st.error("ボードデータの読み込みに失敗しました")
+        debug_log(f"🔍 DEBUG [board]: {e}")
 
     # ステージ補正
     if stage not in {'card', 'roulette'}:
         stage = st.session_state.game_board_stage = 'card'
 
     def compute_allowed_numbers(position: int):
-        distance_to_goal = max(0, max_position_index - position)
-        if distance_to_goal <= 0:
-            return [], None, distance_to_goal
-
-        # 現在のセル情報を取得
-        current_cell = None
-        if 0 <= position < len(board_data):
-            current_cell = board_data[position]
-        
-        if current_cell is None:
-            return [], None, distance_to_goal
-        
-        max_spin = 3
-        max_reachable = min(max_spin, distance_to_goal)
-        
-        # 現在のセルタイプを取得
-        cell_type = current_cell.get('type', 'normal')
-        
-        # 分岐ルート(branch_fail or branch_pass)の場合、同じタイプのセルにのみ進める
-        if cell_type in ['branch_fail', 'branch_pass']:
-            allowed = []
-            for offset in range(1, max_reachable + 1):
-                next_pos = position + offset
-                if next_pos >= len(board_data):
-                    break
-                next_cell = board_data[next_pos]
-                # 同じタイプのセルのみ許可
-                if next_cell.get('type') == cell_type:
-                    allowed.append(offset)
-            return allowed, None, distance_to_goal
-        
-        # 通常のセルは既存のロジックを使用
-        next_stop_distance = None
-        for stop_pos in forced_stop_indices:
-            if stop_pos > position:
-                next_stop_distance = stop_pos - position
-                break
-
-        if next_stop_distance is not None and next_stop_distance > 0:
-            limit = min(max_reachable, next_stop_distance)
-        else:
-            limit = max_reachable
-
-        allowed = list(range(1, limit + 1))
-
-        return allowed, next_stop_distance, distance_to_goal
+        """出してよい数・次の強制停止マスまでの距離・ゴールまでの距離（ボードの移動ルール表を引く）"""
+        if routing is None:
+            return [], None, max(0, max_position_index - position)
+        return (list(routing.allowed_moves(position)),
+                routing.next_stop_distance(position),
+                routing.distance_to_goal(position))
 
     def render_cell_media(position: int, cell_info: dict) -> None:
         try:
@@ -1073,6 +897,8 @@ def show_game_board_page():
         if forced_next is not None:
             new_position = forced_next
         else:
+            if routing is not None and not routing.is_allowed(old_position, result_value):
+                debug_log(f"🔍 DEBUG [process_spin_result]: {result_value} is not allowed at {old_position} (allowed={routing.allowed_moves(old_position)})")
             new_position = min(old_position + result_value, max_position_index)
         
         old_label = get_display_label(old_position)
@@ -1547,7 +1373,7 @@ def show_game_board_page():
                     st.rerun()
 
             def render_chips(active_value):
-                display_numbers = [1, 2, 3]
+                display_numbers = list(range(1, MAX_SPIN + 1))
                 chips = []
                 for num in display_numbers:
                     classes = ["roulette-number-chip"]
@@ -1575,7 +1401,7 @@ def show_game_board_page():
                 if st.button("🎡 ルーレットを回す", key="roulette_spin_button", type="primary"):
                     pool = allowed_numbers or [1]
                     animation_sequence = []
-                    base_sequence = list(range(1, 4))
+                    base_sequence = list(range(1, MAX_SPIN + 1))
                     for _ in range(5):
                         animation_sequence.extend(base_sequence)
                     animation_sequence.extend(pool)
@@ -2149,8 +1975,6 @@ def auto_complete_job_experience(cell_position: int) -> None:
 def show_checkup_page():
     """定期健診ページ"""
     from services.image_helper import display_image
-    import json
-    import os
     
     def resolve_checkup_target() -> str:
         target = st.session_state.get('pending_checkup_target')
@@ -2161,16 +1985,11 @@ def show_checkup_page():
         try:
             game_state = st.session_state.get('game_state', {})
             age = st.session_state.get('participant_age', 5)
-            board_file = get_board_file_for_age(age)
-            board_path = os.path.join(os.getcwd(), board_file)
-            with open(board_path, 'r', encoding='utf-8') as f:
-                board_data = json.load(f)
-            for cell in board_data:
-                cell_id = cell.get('cell')
-                if pending_cell is not None and cell_id == pending_cell:
-                    return cell.get('checkup_target', 'caries_quiz')
-                if cell_id == board_position:
-                    return cell.get('checkup_target', 'caries_quiz')
+            board_data = load_board(get_board_file_for_age(age))
+            cell = board_data.cell_by_id(pending_cell) if pending_cell is not None else None
+            cell = cell or board_data.cell_by_id(board_position)
+            if cell is not None:
+                return cell.get('checkup_target', 'caries_quiz')
         except Exception:
             pass
         return 'perio_quiz' if board_position >= 14 else 'caries_quiz'
@@ -2460,6 +2279,7 @@ def _build_session_record(game_state: dict) -> Dict[str, any]:
         start_time_str = start_time
     return {
         "session_id": session_id,
+        "event_id": load_events_config().get("active_event", "default"),
         "participant_name": participant_name,
         "participant_age": age,
         "age_group": age_group,
@@ -2478,12 +2298,14 @@ def _build_session_record(game_state: dict) -> Dict[str, any]:
 
 def show_goal_page():
     """ゴール・ランキングページ"""
-    from services.store import load_leaderboard, save_score
+    from services.store import load_leaderboard, save_score, get_rank_by_entry_id, get_player_rank
     
     st.markdown("### 🏁 ゲームクリア！")
     
     player_rank = None
     player_score = 0
+    rank_info = None
+    saved_rank_info = None
     
     if 'game_state' in st.session_state:
         game_state = st.session_state.game_state
@@ -2513,31 +2335,54 @@ def show_goal_page():
         st.success("おめでとう！")
         
         # Save to leaderboard if not already saved
+        age_group = "under5" if st.session_state.get('participant_age', 5) < 5 else "5plus"
+        score_entry = st.session_state.setdefault('score_entry', {
+            "entry_id": uuid.uuid4().hex,
+            "timestamp": datetime.now().isoformat(),
+            "event_id": load_events_config().get("active_event", "default"),
+            "age_group": age_group,
+        })
+        # ランキングは同じイベント・年齢グループの今日のプレイで比べる
+        ranking_scope = {
+            "event_id": score_entry.get("event_id", "default"),
+            "age_group": score_entry.get("age_group", age_group),
+            "day": score_entry["timestamp"][:10],
+        }
         if not st.session_state.get('score_saved'):
             player_data = {
                 "player_name": st.session_state.get('participant_name', '匿名'),
                 "participant_age": st.session_state.get('participant_age', 5),
-                "age_group": "under5" if st.session_state.get('participant_age', 5) < 5 else "5plus",
+                "age_group": ranking_scope["age_group"],
+                "event_id": ranking_scope["event_id"],
                 "teeth_count": teeth_count,
                 "tooth_coins": coins,
-                "play_time": "0分0秒"  # Can be calculated if needed
+                "play_time": "0分0秒",  # Can be calculated if needed
+                "entry_id": score_entry["entry_id"],
+                "timestamp": score_entry["timestamp"],
             }
             if save_score(player_data):
                 st.session_state.score_saved = True
         
         # Display leaderboard
         st.markdown("---")
-        st.markdown("### 🏆 トップ10ランキング")
+        age_label = "5さいみまん" if ranking_scope["age_group"] == "under5" else "5さいいじょう"
+        st.markdown(f"### 🏆 きょうの{age_label} トップ10ランキング")
         
-        leaderboard = load_leaderboard(top_n=10)
+        leaderboard = load_leaderboard(top_n=10, **ranking_scope)
+        
+        if st.session_state.get('score_saved'):
+            # 保存待ちでまだ見つからない場合はスコアから順位を見積もる
+            saved_rank_info = get_rank_by_entry_id(score_entry["entry_id"], **ranking_scope)
+            rank_info = saved_rank_info or get_player_rank(player_score, score_entry["timestamp"], **ranking_scope)
         
         if leaderboard:
             # Find player's rank
-            player_name = st.session_state.get('participant_name', '匿名')
             for idx, entry in enumerate(leaderboard):
-                if entry.get('player_name') == player_name and entry.get('score') == player_score:
+                if entry.get('entry_id') == score_entry["entry_id"]:
                     player_rank = idx + 1
                     break
+            if player_rank is None and saved_rank_info and saved_rank_info["rank"] <= len(leaderboard):
+                player_rank = saved_rank_info["rank"]
             
             # Display leaderboard table
             for idx, entry in enumerate(leaderboard):
@@ -2597,6 +2442,12 @@ def show_goal_page():
                     """, unsafe_allow_html=True)
         else:
             st.info("まだだれもゴールしていないよ！")
+        
+        if rank_info:
+            message = f"🎖️ あなたは {rank_info['total']}にんちゅう {rank_info['rank']}い！"
+            if rank_info['rank'] > len(leaderboard):
+                message += f"（じょうい {rank_info['percentile']:g}%）"
+            st.info(message)
     
     st.markdown("---")
     if st.button("📱 LINEページへ", width='stretch', type="secondary"):
@@ -2692,13 +2543,7 @@ def show_staff_management_page():
     st.markdown("### ⚙️ スタッフ管理")
     
     # PINを設定ファイルから読み込み
-    try:
-        with open('data/settings.json', 'r', encoding='utf-8') as f:
-            settings = json.load(f)
-        staff_pin = settings.get("staff_pin", "0418")
-    except Exception as e:
-        debug_log(f"🔍 DEBUG [staff_management]: Error loading settings - {e}")
-        staff_pin = "0418"
+    staff_pin = get_config_service().staff_pin
     
     # PIN認証
     pin = st.text_input("PINコード", type="password")
@@ -2754,12 +2599,44 @@ def show_staff_management_page():
             
         st.markdown("---")
         
-        if st.button("🏆 ランキングリセット", use_container_width=True):
-            from services.store import clear_leaderboard
-            if clear_leaderboard():
-                st.success("ランキングをリセットしました")
+        from pages.staff import show_leaderboard_reset
+        show_leaderboard_reset(events)
+        
+        if st.button("🔁 ランキング集計を作り直す", use_container_width=True):
+            from services.store import rebuild_leaderboard_aggregates
+            with st.spinner("Firestore のスコアを集計しています..."):
+                rebuilt = rebuild_leaderboard_aggregates()
+            if rebuilt >= 0:
+                st.success(f"ランキング集計を作り直しました（{rebuilt}件）")
             else:
-                st.error("ランキングのリセットに失敗しました")
+                st.error("ランキング集計を作り直せませんでした（Firestoreに接続できません）")
+        
+        st.markdown("---")
+        from pages.staff import show_offline_import
+        show_offline_import()
+        
+        st.markdown("---")
+        
+        from services.store import get_pending_write_count, get_outbox_size, retry_outbox_now
+        write_col, outbox_col = st.columns(2)
+        with write_col:
+            st.metric("💾 保存待ちの書き込み", f"{get_pending_write_count()}件")
+        with outbox_col:
+            st.metric("📮 Firestore未送信", f"{get_outbox_size()}件")
+            if st.button("📮 今すぐ再送", key="retry_outbox"):
+                retry_outbox_now()
+                st.success("✅ 再送を開始しました")
+        
+        st.markdown("---")
+        from pages.staff import show_live_ranking
+        show_live_ranking(events, active_event_id)
+        
+        st.markdown("---")
+        from pages.staff import show_session_analytics, show_data_export
+        show_session_analytics()
+        
+        st.markdown("---")
+        show_data_export(events)
     elif pin:
         st.error("❌ PINコードが正しくありません")
     
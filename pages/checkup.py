@@ -2,9 +2,8 @@
 定期健診ページ
 """
 import streamlit as st
-import json
-import os
 from pages.utils import navigate_to, get_board_file_for_age
+from services.board_repository import load_board
 
 
 def show_checkup_page():
@@ -19,16 +18,11 @@ def show_checkup_page():
         board_position = st.session_state.get('game_state', {}).get('current_position', 0)
         try:
             age = st.session_state.get('participant_age', 5)
-            board_file = get_board_file_for_age(age)
-            board_path = os.path.join(os.getcwd(), board_file)
-            with open(board_path, 'r', encoding='utf-8') as f:
-                board_data = json.load(f)
-            for cell in board_data:
-                cell_id = cell.get('cell')
-                if pending_cell is not None and cell_id == pending_cell:
-                    return cell.get('checkup_target', 'caries_quiz')
-                if cell_id == board_position:
-                    return cell.get('checkup_target', 'caries_quiz')
+            board_data = load_board(get_board_file_for_age(age))
+            cell = board_data.cell_by_id(pending_cell) if pending_cell is not None else None
+            cell = cell or board_data.cell_by_id(board_position)
+            if cell is not None:
+                return cell.get('checkup_target', 'caries_quiz')
         except Exception:
             pass
         return 'perio_quiz' if board_position >= 14 else 'caries_quiz'
@@ -6,7 +6,7 @@ import os
 import uuid
 from datetime import datetime
 from typing import Dict
-from pages.utils import navigate_to
+from pages.utils import navigate_to, load_events_config
 from services.store import log_player_session
 
 
@@ -28,6 +28,7 @@ def _build_session_record(game_state: dict) -> Dict[str, any]:
         start_time_str = start_time
     return {
         "session_id": session_id,
+        "event_id": load_events_config().get("active_event", "default"),
         "participant_name": participant_name,
         "participant_age": age,
         "age_group": age_group,
@@ -46,12 +47,14 @@ def _build_session_record(game_state: dict) -> Dict[str, any]:
 
 def show_goal_page():
     """ゴール・ランキングページ"""
-    from services.store import load_leaderboard, save_score
+    from services.store import load_leaderboard, save_score, get_rank_by_entry_id, get_player_rank
     
     st.markdown("### 🏁 ゲームクリア！")
     
     player_rank = None
     player_score = 0
+    rank_info = None
+    saved_rank_info = None
     
     if 'game_state' in st.session_state:
         game_state = st.session_state.game_state
@@ -81,30 +84,53 @@ def show_goal_page():
         st.success("おめでとう！")
         
         # Save to leaderboard if not already saved
+        age_group = "under5" if st.session_state.get('participant_age', 5) < 5 else "5plus"
+        score_entry = st.session_state.setdefault('score_entry', {
+            "entry_id": uuid.uuid4().hex,
+            "timestamp": datetime.now().isoformat(),
+            "event_id": load_events_config().get("active_event", "default"),
+            "age_group": age_group,
+        })
+        # ランキングは同じイベント・年齢グループの今日のプレイで比べる
+        ranking_scope = {
+            "event_id": score_entry.get("event_id", "default"),
+            "age_group": score_entry.get("age_group", age_group),
+            "day": score_entry["timestamp"][:10],
+        }
         if not st.session_state.get('score_saved'):
             player_data = {
                 "player_name": st.session_state.get('participant_name', '匿名'),
                 "participant_age": st.session_state.get('participant_age', 5),
-                "age_group": "under5" if st.session_state.get('participant_age', 5) < 5 else "5plus",
+                "age_group": ranking_scope["age_group"],
+                "event_id": ranking_scope["event_id"],
                 "teeth_count": teeth_count,
                 "tooth_coins": coins,
-                "play_time": "0分0秒"
+                "play_time": "0分0秒",
+                "entry_id": score_entry["entry_id"],
+                "timestamp": score_entry["timestamp"],
             }
             if save_score(player_data):
                 st.session_state.score_saved = True
         
         # Display leaderboard
         st.markdown("---")
-        st.markdown("### 🏆 トップ10ランキング")
+        age_label = "5さいみまん" if ranking_scope["age_group"] == "under5" else "5さいいじょう"
+        st.markdown(f"### 🏆 きょうの{age_label} トップ10ランキング")
         
-        leaderboard = load_leaderboard(top_n=10)
+        leaderboard = load_leaderboard(top_n=10, **ranking_scope)
+        
+        if st.session_state.get('score_saved'):
+            # 保存待ちでまだ見つからない場合はスコアから順位を見積もる
+            saved_rank_info = get_rank_by_entry_id(score_entry["entry_id"], **ranking_scope)
+            rank_info = saved_rank_info or get_player_rank(player_score, score_entry["timestamp"], **ranking_scope)
         
         if leaderboard:
-            player_name = st.session_state.get('participant_name', '匿名')
             for idx, entry in enumerate(leaderboard):
-                if entry.get('player_name') == player_name and entry.get('score') == player_score:
+                if entry.get('entry_id') == score_entry["entry_id"]:
                     player_rank = idx + 1
                     break
+            if player_rank is None and saved_rank_info and saved_rank_info["rank"] <= len(leaderboard):
+                player_rank = saved_rank_info["rank"]
             
             for idx, entry in enumerate(leaderboard):
                 rank = idx + 1
@@ -160,6 +186,12 @@ def show_goal_page():
                     """, unsafe_allow_html=True)
         else:
             st.info("まだだれもゴールしていないよ！")
+        
+        if rank_info:
+            message = f"🎖️ あなたは {rank_info['total']}にんちゅう {rank_info['rank']}い！"
+            if rank_info['rank'] > len(leaderboard):
+                message += f"（じょうい {rank_info['percentile']:g}%）"
+            st.info(message)
     
     st.markdown("---")
     if st.button("📱 LINEページへ", use_container_width=True, type="secondary"):
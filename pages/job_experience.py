@@ -5,7 +5,8 @@ import streamlit as st
 import time
 import random
 from datetime import datetime
-from pages.utils import navigate_to, debug_log, load_settings
+from pages.utils import navigate_to, debug_log
+from services.config import get_config_service
 
 
 def show_job_experience_page():
@@ -168,8 +169,7 @@ def show_job_experience_page():
             start_time = st.session_state.job_timer_start
             elapsed = (datetime.now() - start_time).total_seconds()
             # 設定から読み込み
-            settings = load_settings()
-            game_config = settings.get('game', {})
+            game_config = get_config_service().game
             time_limit = game_config.get('job_experience_timer_seconds', 300)
             remaining = max(0, time_limit - elapsed)
             
@@ -218,8 +218,7 @@ def show_job_experience_page():
                     game_state = st.session_state.game_state
                     
                     # 設定から報酬を取得
-                    settings = load_settings()
-                    rewards = settings.get('game', {}).get('rewards', {})
+                    rewards = get_config_service().game.get('rewards', {})
                     
                     if st.session_state.get('job_force_complete'):
                         reward = rewards.get('job_force_complete', 10)
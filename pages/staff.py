@@ -3,7 +3,9 @@
 """
 import streamlit as st
 import json
-from pages.utils import navigate_to, load_events_config, save_active_event, load_settings
+from datetime import datetime
+from pages.utils import navigate_to, load_events_config, save_active_event
+from services.config import get_config_service
 
 
 def show_staff_management_page():
@@ -16,8 +18,7 @@ def show_staff_management_page():
     active_event_id = events_data.get("active_event", "default")
     
     # 設定ファイルから管理者PINを読み込み
-    settings = load_settings()
-    admin_pin = settings.get("staff_pin", "0418")
+    admin_pin = get_config_service().staff_pin
     
     # PIN認証
     pin = st.text_input("PINコード", type="password", help="イベントPINまたは管理者PIN")
@@ -103,15 +104,291 @@ def show_staff_management_page():
             
         st.markdown("---")
         
-        if st.button("🏆 ランキングリセット", use_container_width=True):
-            from services.store import clear_leaderboard
-            if clear_leaderboard():
-                st.success("ランキングをリセットしました")
+        show_leaderboard_reset(events)
+        
+        if st.button("🔁 ランキング集計を作り直す", use_container_width=True):
+            from services.store import rebuild_leaderboard_aggregates
+            with st.spinner("Firestore のスコアを集計しています..."):
+                rebuilt = rebuild_leaderboard_aggregates()
+            if rebuilt >= 0:
+                st.success(f"ランキング集計を作り直しました（{rebuilt}件）")
             else:
-                st.error("ランキングのリセットに失敗しました")
+                st.error("ランキング集計を作り直せませんでした（Firestoreに接続できません）")
+        
+        st.markdown("---")
+        show_offline_import()
+        
+        st.markdown("---")
+        
+        from services.store import get_pending_write_count, get_outbox_size, retry_outbox_now
+        write_col, outbox_col = st.columns(2)
+        with write_col:
+            st.metric("💾 保存待ちの書き込み", f"{get_pending_write_count()}件")
+        with outbox_col:
+            st.metric("📮 Firestore未送信", f"{get_outbox_size()}件")
+            if st.button("📮 今すぐ再送", key="retry_outbox"):
+                retry_outbox_now()
+                st.success("✅ 再送を開始しました")
+        
+        st.markdown("---")
+        show_live_ranking(events, active_event_id)
+        st.markdown("---")
+        show_session_analytics()
+        
+        st.markdown("---")
+        show_data_export(events)
     
     elif pin:
         st.error("❌ PINコードが正しくありません")
     
     if st.button("🏠 メインページに戻る"):
         navigate_to('reception')
+
+
+def _format_seconds(seconds) -> str:
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    return f"{seconds // 60}分{seconds % 60}秒"
+
+
+def show_session_analytics():
+    """体験ログの集計（スタッフ向けダッシュボード）"""
+    import pandas as pd
+    from services.analytics import get_session_analytics, PLAY_TIME_PERCENTILES
+    
+    st.markdown("#### 📊 体験データ分析")
+    
+    scope = st.radio("集計範囲", ["きょう", "すべて"], horizontal=True)
+    day = datetime.now().strftime("%Y-%m-%d") if scope == "きょう" else None
+    
+    try:
+        stats = get_session_analytics().summary(day=day)
+    except Exception as e:
+        st.error(f"集計エラー: {e}")
+        return
+    
+    if not stats["sessions"]:
+        st.info("まだ体験データがありません")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("体験数", f"{stats['sessions']}件")
+    with col2:
+        st.metric("ゴール率", f"{stats['goal_rate'] * 100:.0f}%")
+    with col3:
+        st.metric("プレイ時間（中央値）", _format_seconds(stats["play_time"][50]))
+    
+    st.markdown("**⏱️ プレイ時間**")
+    st.table(pd.DataFrame(
+        {"プレイ時間": [_format_seconds(stats["play_time"][p]) for p in PLAY_TIME_PERCENTILES]},
+        index=[f"{p}%" for p in PLAY_TIME_PERCENTILES],
+    ))
+    
+    st.markdown("**❓ クイズ正答率**")
+    labels = {"under5": "5さいみまん", "5plus": "5さいいじょう"}
+    st.table(pd.DataFrame(
+        [
+            {
+                "年齢グループ": labels.get(group, group),
+                "体験数": row["sessions"],
+                "むし歯クイズ": "-" if row["caries"] is None else f"{row['caries'] * 100:.0f}%",
+                "歯周病クイズ": "-" if row["perio"] is None else f"{row['perio'] * 100:.0f}%",
+            }
+            for group, row in stats["correctness"].items()
+        ]
+    ).set_index("年齢グループ"))
+    
+    coins = stats["coins"]
+    if coins["counts"]:
+        st.markdown(f"**💰 トゥースコイン**（平均 {coins['mean']:.0f}まい・中央値 {coins['median']:.0f}まい）")
+        st.bar_chart(pd.DataFrame(
+            {"人数": coins["counts"]},
+            index=pd.Index([round(edge) for edge in coins["edges"][:-1]], name="コイン（まい）"),
+        ))
+    
+    st.markdown("**🕒 時間帯別の体験数**")
+    st.bar_chart(pd.DataFrame({"体験数": stats["hourly"]}, index=pd.Index(range(24), name="時")))
+
+
+def show_leaderboard_reset(events):
+    """ランキングのリセット（イベント・期間を指定して一部だけ消すこともできる）"""
+    from services.store import clear_leaderboard
+    
+    event_names = {"すべて": None, **{e["name"]: e["id"] for e in events}}
+    event_id = event_names[st.selectbox("リセットするイベント", list(event_names), key="reset_event")]
+    start_day = end_day = None
+    if st.checkbox("期間を指定する", key="reset_use_days"):
+        today = datetime.now().date()
+        days = st.date_input("リセットする期間", value=(today, today), key="reset_days")
+        if isinstance(days, (tuple, list)):
+            start_day = days[0] if days else None
+            end_day = days[1] if len(days) > 1 else start_day
+        else:
+            start_day = end_day = days
+    
+    if st.button("🏆 ランキングリセット", use_container_width=True):
+        bar = st.progress(0.0, text="スコアを削除しています...")
+        
+        def show_progress(deleted, total):
+            fraction = min(deleted / total, 1.0) if total else 0.0
+            bar.progress(fraction, text=f"{deleted}件 削除しました")
+        
+        if clear_leaderboard(
+            event_id,
+            start_day.isoformat() if start_day else None,
+            end_day.isoformat() if end_day else None,
+            progress=show_progress,
+        ):
+            bar.progress(1.0, text="完了")
+            st.success("ランキングをリセットしました")
+        else:
+            st.error("ランキングのリセットに失敗しました")
+
+
+LIVE_RANKING_INTERVAL = 1.0
+
+
+def show_live_ranking(events, active_event_id):
+    """会場の画面に出すライブランキング（LIVE_RANKING_INTERVAL 秒ごとにこの部分だけ描き直す）
+    
+    Firestore を使っている場合はランキングの写し（リスナーで保つ）から読むので、
+    何台で表示していても Firestore への問い合わせは増えない。
+    """
+    from services.store import get_leaderboard_mirror_status, load_leaderboard
+    
+    st.markdown("#### 📺 ライブランキング")
+    event_names = {e["name"]: e["id"] for e in events} or {"default": "default"}
+    event_ids = list(event_names.values())
+    col1, col2 = st.columns(2)
+    with col1:
+        selected = st.selectbox("イベント", list(event_names), key="live_event",
+                                index=event_ids.index(active_event_id) if active_event_id in event_ids else 0)
+    with col2:
+        age_groups = {"5さいいじょう": "5plus", "5さいみまん": "under5"}
+        age_group = age_groups[st.selectbox("年齢グループ", list(age_groups), key="live_age_group")]
+    event_id = event_names[selected]
+    
+    @st.fragment(run_every=LIVE_RANKING_INTERVAL)
+    def ranking():
+        today = datetime.now().strftime("%Y-%m-%d")
+        leaderboard = load_leaderboard(top_n=10, event_id=event_id, age_group=age_group, day=today)
+        if not leaderboard:
+            st.info("まだ きょうの記録はありません")
+        else:
+            st.dataframe(
+                [{"順位": rank, "なまえ": entry.get("player_name", "匿名"),
+                  "はのかず": entry.get("teeth_count", 0), "コイン": entry.get("tooth_coins", 0),
+                  "スコア": entry.get("score", 0)}
+                 for rank, entry in enumerate(leaderboard, start=1)],
+                hide_index=True, use_container_width=True,
+            )
+        status = get_leaderboard_mirror_status()
+        if status is not None:
+            modes = {"listening": "リアルタイム", "polling": "定期読み込み", "stopped": "停止中"}
+            age = f"（{status['age']:.0f}秒前に更新）" if status["age"] is not None and status["mode"] != "listening" else ""
+            st.caption(f"更新方法: {modes.get(status['mode'], status['mode'])}{age}")
+    
+    ranking()
+
+
+def show_offline_import():
+    """端末ごとに記録したスコア・体験ログのファイルを Firestore に取り込む"""
+    from services.store import import_offline_records
+    
+    st.markdown("#### 📤 オフライン記録の取り込み")
+    uploads = st.file_uploader(
+        "スコア・体験ログのファイル（.json / .jsonl / .jsonl.gz）",
+        type=["json", "jsonl", "gz"],
+        accept_multiple_files=True,
+        key="offline_import_files",
+    )
+    scores_from_sessions = st.checkbox(
+        "体験ログからもスコアを作る", key="offline_import_scores_from_sessions",
+        help="スコアを保存できずに体験ログだけが残った端末のファイルを取り込むとき",
+    )
+    
+    if st.button("📤 取り込む", use_container_width=True, disabled=not uploads):
+        bar = st.progress(0.0, text="書き込んでいます...")
+        
+        def show_progress(written, total):
+            fraction = min(written / total, 1.0) if total else 0.0
+            bar.progress(fraction, text=f"{written}件 書き込みました")
+        
+        try:
+            report = import_offline_records(
+                [(upload.name, upload.getvalue()) for upload in uploads],
+                scores_from_sessions=scores_from_sessions,
+                progress=show_progress,
+            )
+        except Exception as e:
+            st.error(f"取り込みエラー: {e}")
+            return
+        if report is None:
+            st.error("取り込めませんでした（Firestoreに接続できません）")
+            return
+        bar.progress(1.0, text="完了")
+        message = (f"スコア {report.scores}件・体験ログ {report.sessions}件を取り込みました"
+                   f"（{report.elapsed:.1f}秒、{report.per_second:.0f}件/秒）")
+        if report.failed:
+            st.warning(f"{message}。{report.failed}件は書き込めませんでした（もう一度取り込むと続きを書き込みます）")
+        else:
+            st.success(message)
+        if report.skipped:
+            st.info(f"スコア・体験ログのどちらでもない {report.skipped}件は読み飛ばしました")
+
+
+def show_data_export(events):
+    """体験ログ・スコアのダウンロード"""
+    from services.export import (
+        EXPORT_SCORES, EXPORT_SESSIONS, FORMAT_CSV, FORMAT_JSONL, MIME_TYPES,
+        ExportFilter, export_filename, spool_export,
+    )
+    
+    st.markdown("#### 📥 データの書き出し")
+    
+    kinds = {"体験ログ": EXPORT_SESSIONS, "スコア": EXPORT_SCORES}
+    formats = {"CSV": FORMAT_CSV, "JSON Lines": FORMAT_JSONL}
+    col1, col2 = st.columns(2)
+    with col1:
+        kind = kinds[st.selectbox("書き出すデータ", list(kinds))]
+    with col2:
+        fmt = formats[st.selectbox("形式", list(formats))]
+    
+    today = datetime.now().date()
+    days = st.date_input("期間", value=(today, today))
+    event_names = {"すべて": None, **{e["name"]: e["id"] for e in events}}
+    age_groups = {"すべて": None, "5さいみまん": "under5", "5さいいじょう": "5plus"}
+    col1, col2 = st.columns(2)
+    with col1:
+        event_id = event_names[st.selectbox("イベント", list(event_names))]
+    with col2:
+        age_group = age_groups[st.selectbox("年齢グループ", list(age_groups))]
+    
+    # 期間は開始日だけ選んだ状態でも書き出せるようにする
+    if isinstance(days, (tuple, list)):
+        start_day = days[0] if days else None
+        end_day = days[1] if len(days) > 1 else start_day
+    else:
+        start_day = end_day = days
+    filters = ExportFilter(
+        start_day=start_day.isoformat() if start_day else None,
+        end_day=end_day.isoformat() if end_day else None,
+        event_id=event_id,
+        age_group=age_group,
+    )
+    
+    if st.button("📦 ファイルを作成", use_container_width=True):
+        try:
+            spool = spool_export(kind, fmt, filters)
+        except Exception as e:
+            st.error(f"書き出しエラー: {e}")
+            return
+        st.download_button(
+            "⬇️ ダウンロード",
+            data=spool,
+            file_name=export_filename(kind, fmt),
+            mime=MIME_TYPES[fmt],
+            use_container_width=True,
+        )
@@ -2,9 +2,12 @@
 ページ間共通ユーティリティ
 """
 import streamlit as st
-import json
+import copy
 from typing import Dict
 
+from services.atomic_io import update_json
+from services.config import EVENTS_PATH, default_events, get_config_service
+
 
 def navigate_to(page_name: str):
     """ページ遷移"""
@@ -13,42 +16,28 @@ def navigate_to(page_name: str):
 
 
 def load_settings() -> Dict:
-    """設定ファイルを読み込み"""
-    try:
-        with open('data/settings.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {"staff_pin": "0418", "debug_mode": False}
+    """設定ファイルを読み込み（変更してよいコピーを返す）"""
+    return copy.deepcopy(get_config_service().settings)
 
 
 def debug_log(message: str):
     """デバッグモードが有効な場合のみ出力"""
-    settings = load_settings()
-    if settings.get("debug_mode", False):
+    if get_config_service().debug_mode:
         print(message)
 
 
 def load_events_config() -> Dict:
-    """イベント設定を読み込み"""
-    try:
-        with open('data/events.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading events.json: {e}")
-        return {
-            "events": [{"id": "default", "name": "デフォルト", "description": "通常設定",
-                       "board_file": "board_main.json"}],
-            "active_event": "default"
-        }
+    """イベント設定を読み込み（変更してよいコピーを返す）"""
+    return copy.deepcopy(get_config_service().events_config)
 
 
 def save_active_event(event_id: str) -> bool:
     """アクティブイベントを保存"""
     try:
-        events_data = load_events_config()
-        events_data["active_event"] = event_id
-        with open('data/events.json', 'w', encoding='utf-8') as f:
-            json.dump(events_data, f, ensure_ascii=False, indent=2)
+        # 読み込みから書き込みまでロックを保持する（他プロセスの変更を上書きしない）
+        with update_json(EVENTS_PATH, default_events) as events_data:
+            events_data["active_event"] = event_id
+        get_config_service().events_file.invalidate()
         return True
     except Exception as e:
         print(f"Error saving active event: {e}")
@@ -60,20 +49,4 @@ def get_board_file_for_age(age: int) -> str:
     
     Note: 将来的にPINコードでゲーム種類を切り替える機能を追加予定
     """
-    events_data = load_events_config()
-    active_event_id = events_data.get("active_event", "default")
-    events = events_data.get("events", [])
-    
-    # アクティブイベントを検索
-    active_event = None
-    for event in events:
-        if event["id"] == active_event_id:
-            active_event = event
-            break
-    
-    # デフォルトのボードファイル（統一）
-    if not active_event:
-        return "data/board_main.json"
-    
-    # イベント設定のボードを使用
-    return f"data/{active_event.get('board_file', 'board_main.json')}"
+    return get_config_service().board_file
@@ -0,0 +1,104 @@
+"""
+起動時の import にかかる時間のベンチマーク
+
+新しいプロセスで streamlit を読み込んだ後に各モジュールを import する時間を測り（中央値）、
+予算（--budget-ms）に収まっているか、firebase_admin・grpc などの重いモジュールを
+import の時点で読み込んでいないかを確かめる。
+どちらかを満たさなければ終了コード1で終わる。
+
+    python scripts/benchmark_startup.py
+    python scripts/benchmark_startup.py --repeat 10 --budget-ms 200
+    python scripts/benchmark_startup.py --importtime   # 時間のかかっている import を表示
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# app.py の起動時に読み込まれるモジュール
+MODULES = ["services.store", "services.backends", "services.firebase", "pages.staff"]
+# 接続するまで読み込まないはずのモジュール
+LAZY_MODULES = ["firebase_admin", "google.cloud.firestore", "grpc"]
+BASELINE_MODULE = "streamlit"
+DEFAULT_BUDGET_MS = 150.0
+
+_MEASURE = """
+import json, sys, time
+{preload}
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int, preload: str = "") -> dict:
+    """新しいプロセスで module を repeat 回 import し、時間の中央値と読み込まれた重いモジュールを返す
+
+    preload は時間を測る前に import しておくモジュール。
+    """
+    times = []
+    loaded = set()
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _MEASURE.format(module=module, lazy=LAZY_MODULES,
+                                                   preload=f"import {preload}" if preload else "")],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result["ms"])
+        loaded.update(result["loaded"])
+    return {"ms": statistics.median(times), "loaded": sorted(loaded)}
+
+
+def show_importtime(module: str, top: int) -> None:
+    """python -X importtime の結果から累積時間の大きい import を表示する"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        if cumulative.isdigit():
+            rows.append((int(cumulative), name))
+    print(f"\n{module} の import（累積時間の大きい順）")
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>10.1f} ms  {name}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="streamlit を読み込んだ後の、1モジュールあたりの import 時間の上限")
+    parser.add_argument("--importtime", action="store_true", help="時間のかかっている import を表示")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    baseline = measure(BASELINE_MODULE, args.repeat)["ms"]
+    print(f"{'module':<22}{'import(ms)':>12}  lazy modules loaded")
+    print(f"{BASELINE_MODULE:<22}{baseline:>12.1f}")
+    ok = True
+    for module in MODULES:
+        result = measure(module, args.repeat, preload=BASELINE_MODULE)
+        over = result["ms"] > args.budget_ms
+        ok = ok and not over and not result["loaded"]
+        loaded = ", ".join(result["loaded"]) or "-"
+        print(f"{module:<22}{result['ms']:>12.1f}  {loaded}{'  (over budget)' if over else ''}")
+
+    if args.importtime:
+        show_importtime(MODULES[0], args.top)
+
+    print("OK" if ok else f"NG: 予算 {args.budget_ms:.0f}ms を超えたか、重いモジュールを import 時に読み込んでいます")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+保存先（StorageBackend）のベンチマーク
+
+同じ疑似負荷（スコア保存・順位問い合わせ・ランキング取得・参加者加算・体験ログ追記）を
+各保存先にかけて、1操作あたりの時間を表示する。
+
+    python scripts/benchmark_storage.py --ops 2000
+    python scripts/benchmark_storage.py --backends memory sqlite --batch 50
+    python scripts/benchmark_storage.py --backends firestore   # .streamlit/secrets.toml が必要
+    python scripts/benchmark_storage.py --backends fake-firestore fake-firestore+json \
+        --latency 0.02 --failure-rate 0.05 --threads 8   # 認証情報なしで Firestore の代わりを使う
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import fake_firestore  # noqa: E402
+from services.backends import (  # noqa: E402
+    FirestoreBackend, JSONBackend, MemoryBackend, MirroredBackend, SQLiteBackend,
+)
+from services.firebase import FirebaseService  # noqa: E402
+from services.outbox import Outbox  # noqa: E402
+from services.sqlite_store import SQLiteStore  # noqa: E402
+from services.write_queue import WriteBehindQueue  # noqa: E402
+
+BACKEND_CHOICES = [
+    "memory", "json", "sqlite", "firestore", "firestore+json", "fake-firestore", "fake-firestore+json",
+]
+
+
+def build(name: str, workdir: str, queue: WriteBehindQueue, fake: dict = None):
+    """名前から保存先を作る（ファイルは workdir 以下に作成）
+
+    fake は fake-firestore の FakeFirestoreClient に渡す引数（latency / failure_rate など）。
+    """
+    def path(filename):
+        return os.path.join(workdir, filename)
+
+    def json_backend():
+        return JSONBackend(
+            leaderboard_path=path("leaderboard.json"),
+            participants_path=path("participants.json"),
+            sessions_path=path("game_sessions.jsonl"),
+            history_path=path("score_history.jsonl"),
+            settings_path=path("settings.json"),
+        )
+
+    if name == "memory":
+        return MemoryBackend()
+    if name == "json":
+        return json_backend()
+    if name == "sqlite":
+        return SQLiteBackend(SQLiteStore(path("bench.db")), settings_path=path("settings.json"))
+    if name == "firestore":
+        return FirestoreBackend(settings_path=path("settings.json"))
+    if name == "firestore+json":
+        return MirroredBackend(FirestoreBackend(settings_path=path("settings.json")), json_backend(), queue)
+    if name.startswith("fake-firestore"):
+        service = FirebaseService(client=fake_firestore.FakeFirestoreClient(**(fake or {})),
+                                  firestore_module=fake_firestore)
+        backend = FirestoreBackend(service=service, settings_path=path("settings.json"))
+        if name == "fake-firestore+json":
+            # 失敗した書き込みはローカルに保存して Outbox に記録する（store.py と同じ構成）
+            return MirroredBackend(backend, json_backend(), queue, Outbox(path("outbox.db")))
+        return backend
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def synthetic_entries(count: int, rng: random.Random):
+    """ゴール時のスコアに近い分布のエントリを作る"""
+    start = datetime(2025, 1, 1, 9, 0, 0)
+    for i in range(count):
+        teeth = rng.randint(10, 28)
+        coins = rng.randint(0, 30) * 100
+        yield {
+            "entry_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+            "player_name": f"player{i}",
+            "age_group": rng.choice(["under5", "5plus"]),
+            "teeth_count": teeth,
+            "tooth_coins": coins,
+            "play_time": "0分0秒",
+            "score": teeth * 10 + coins,
+            "timestamp": (start + timedelta(seconds=i)).isoformat(),
+        }
+
+
+def timed(label: str, count: int, func, results: dict) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    results[label] = (elapsed, count)
+
+
+def run(name: str, ops: int, batch: int, seed: int, threads: int = 1, fake: dict = None) -> dict:
+    rng = random.Random(seed)
+    entries = list(synthetic_entries(ops, rng))
+    results: dict = {}
+    queue = WriteBehindQueue()
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+        backend = build(name, workdir, queue, fake)
+        errors: dict = {}
+        errors_lock = threading.Lock()
+
+        def call(op: str, *args):
+            # 保存先がエラーを返した分は数えて続ける（fake-firestore の障害注入など）
+            try:
+                getattr(backend, op)(*args)
+            except Exception:
+                with errors_lock:
+                    errors[op] = errors.get(op, 0) + 1
+
+        def add_score_slice(part):
+            for i in range(0, len(part), batch):
+                call("add_scores", part[i:i + batch])
+
+        def add_scores():
+            # threads > 1 のときは同時に保存して競合時の振る舞いを見る
+            workers = [threading.Thread(target=add_score_slice, args=(entries[n::threads],))
+                       for n in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        def rank_lookups():
+            for entry in rng.sample(entries, min(ops, 500)):
+                call("rank_by_entry_id", entry["entry_id"])
+
+        def top_reads():
+            for _ in range(min(ops, 500)):
+                call("top_scores", 10)
+
+        def participants():
+            for i in range(0, ops, batch):
+                call("add_participants", {"2025-01-01": min(batch, ops - i)})
+
+        def sessions():
+            records = [{"timestamp": e["timestamp"], "session_id": e["entry_id"]} for e in entries]
+            for i in range(0, len(records), batch):
+                call("append_sessions", records[i:i + batch])
+
+        timed("add_scores", ops, add_scores, results)
+        timed("rank_by_entry_id", min(ops, 500), rank_lookups, results)
+        timed("top_scores(10)", min(ops, 500), top_reads, results)
+        timed("add_participants", ops, participants, results)
+        timed("append_sessions", ops, sessions, results)
+        if isinstance(backend, MirroredBackend):
+            # 非同期の複製が終わるまでの時間も計測する
+            timed("mirror flush", 0, lambda: queue.flush(timeout=120), results)
+        client = getattr(getattr(getattr(backend, "primary", backend), "service", None), "db", None)
+        if isinstance(client, fake_firestore.FakeFirestoreClient):
+            print(f"{name}: {client.stats}")
+        if errors:
+            print(f"{name}: errors {errors}")
+        queue.shutdown()
+        # JSON の遅延書き出しタイマーが一時ディレクトリ削除後に動かないよう書き出しておく
+        leaderboard = getattr(getattr(backend, "mirror", backend), "_leaderboard", None)
+        if leaderboard is not None:
+            leaderboard.flush()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="StorageBackend benchmark")
+    parser.add_argument("--backends", nargs="+", default=["memory", "json", "sqlite"], choices=BACKEND_CHOICES)
+    parser.add_argument("--ops", type=int, default=1000, help="スコア・参加者・体験ログそれぞれの件数")
+    parser.add_argument("--batch", type=int, default=1, help="1回の呼び出しでまとめる件数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=1, help="スコアを同時に保存するスレッド数")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake-firestore の1通信あたりの遅延（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fake-firestore の通信が失敗する割合")
+    args = parser.parse_args()
+    fake = {"latency": args.latency, "failure_rate": args.failure_rate, "seed": args.seed}
+
+    print(f"ops={args.ops} batch={args.batch}")
+    print(f"{'backend':<22}{'operation':<20}{'total(s)':>10}{'per op(ms)':>12}")
+    for name in args.backends:
+        for label, (elapsed, count) in run(name, args.ops, args.batch, args.seed, args.threads, fake).items():
+            per_op = f"{elapsed / count * 1000:.3f}" if count else "-"
+            print(f"{name:<22}{label:<20}{elapsed:>10.3f}{per_op:>12}")
+
+
+if __name__ == "__main__":
+    main()
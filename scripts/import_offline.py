@@ -0,0 +1,67 @@
+"""
+端末ごとにオフラインで記録したスコア・体験ログを Firestore に取り込む
+
+leaderboard.json / score_history.jsonl / game_sessions.jsonl(.gz) や、スタッフ画面で
+書き出した JSON Lines を読み、バッチ書き込みでまとめて保存する。entry_id / session_id を
+ドキュメントIDにするので、同じファイルを何度取り込んでも二重にならない。
+
+    python scripts/import_offline.py tablet1/game_sessions.jsonl tablet1/score_history.jsonl
+    python scripts/import_offline.py --scores-from-sessions tablet2/*.jsonl*   # 体験ログからもスコアを作る
+    python scripts/import_offline.py --fake --latency 0.02 data/*.jsonl   # 認証情報なしで Firestore の代わりに書く
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import fake_firestore  # noqa: E402
+from services.bulk_write import DEFAULT_WORKERS  # noqa: E402
+from services.firebase import FirebaseService, get_firebase_service  # noqa: E402
+from services.ingest import INGEST_CHUNK_SIZE, ingest_files  # noqa: E402
+
+
+def read_files(paths):
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield os.path.basename(path), f.read()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="取り込むファイル（.json / .jsonl / .jsonl.gz）")
+    parser.add_argument("--scores-from-sessions", action="store_true", help="体験ログからもスコアを作る")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="並行にコミットするバッチの数")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE,
+                        help="集計ドキュメントをまとめて更新する件数")
+    parser.add_argument("--fake", action="store_true", help="Firestore の代わり（プロセス内）に書く（速度の確認用）")
+    parser.add_argument("--latency", type=float, default=0.0, help="--fake の1回の通信にかかる秒数")
+    args = parser.parse_args()
+
+    if args.fake:
+        service = FirebaseService(client=fake_firestore.FakeFirestoreClient(latency=args.latency),
+                                  firestore_module=fake_firestore)
+    else:
+        service = get_firebase_service()
+    if not service.initialize():
+        print("Firestore に接続できませんでした")
+        return 1
+
+    def show_progress(written, total):
+        print(f"\r{written}/{total} 件", end="", flush=True)
+
+    report = ingest_files(service, read_files(args.paths), scores_from_sessions=args.scores_from_sessions,
+                          chunk_size=args.chunk_size, workers=args.workers, progress=show_progress)
+    print()
+    print(f"スコア {report.scores}件・体験ログ {report.sessions}件を取り込みました"
+          f"（{report.elapsed:.2f}秒、{report.per_second:.0f}件/秒）")
+    if report.skipped:
+        print(f"スコア・体験ログのどちらでもない {report.skipped}件は読み飛ばしました")
+    if report.failed:
+        print(f"{report.failed}件は書き込めませんでした（もう一度実行すると続きを書き込みます）")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""
+Firestore のランキング集計ドキュメント（leaderboard/top100_*）を作り直す
+
+scores コレクションの全件を読み、イベント・年齢グループごと（とその日別）の
+上位スコアを書き直す。集計を導入する前のデータがある場合や、集計がずれた場合に使う。
+
+    python scripts/rebuild_leaderboard.py   # .streamlit/secrets.toml が必要
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.firebase import get_firebase_service  # noqa: E402
+
+
+def main() -> int:
+    rebuilt = get_firebase_service().rebuild_leaderboard_aggregates()
+    if rebuilt < 0:
+        print("Firestore に接続できませんでした")
+        return 1
+    print(f"{rebuilt} 件の集計ドキュメントを作り直しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+ボードファイル（data/board_*.json）をスキーマで検証する
+
+すべての誤りを一覧表示し、1つでもあれば終了コード1で終わる。
+
+    python scripts/validate_boards.py                       # data/board_*.json をすべて検証
+    python scripts/validate_boards.py data/board_main.json
+"""
+import glob
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from services.board_schema import validate_cells  # noqa: E402
+
+
+def main() -> int:
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(ROOT, "data", "board_*.json")))
+    ok = True
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                _, errors = validate_cells(json.load(f))
+        except (OSError, ValueError) as e:
+            errors = [str(e)]
+        ok = ok and not errors
+        print(f"{os.path.relpath(path)}: {'OK' if not errors else f'{len(errors)} 件の誤り'}")
+        for error in errors:
+            print(f"  {error}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+体験ログの集計（スタッフ向け統計）
+
+体験ログを列ごとの NumPy 配列に変換して .npz にキャッシュし、
+前回の続き（新しく追記された行）だけを取り込む。集計はすべて配列演算で行う。
+ローカル保存先が JSON ならセッションログ（JSON Lines）を読み、それ以外（SQLite など）なら
+保存先の iter_sessions() を取り込み済みの件数から読む。
+"""
+import io
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from services.atomic_io import atomic_write_bytes, file_lock
+from services.backends import BACKEND_JSON, StorageBackend
+from services.session_log import SESSION_LOG_FILE, SessionLog, get_session_log, iter_segment
+
+ANALYTICS_CACHE_FILE = "data/analytics_sessions.npz"
+# JSON 以外の保存先ごとのキャッシュ
+BACKEND_CACHE_FILE = "data/analytics_sessions_{backend}.npz"
+QUIZ_FILE = "data/quiz_{quiz}_{age_group}.json"
+
+# 年齢グループは小さな整数で持つ（-1 = 不明）
+AGE_GROUPS = ("under5", "5plus")
+QUIZZES = ("caries", "perio")
+
+# 列名と型（欠損値は -1 / NaT）
+COLUMNS = {
+    "timestamp": "datetime64[s]",
+    "age_group": np.int8,
+    "participant_age": np.int16,
+    "turn_count": np.int32,
+    "play_seconds": np.int32,
+    "caries_correct": np.int16,
+    "perio_correct": np.int16,
+    "teeth_count": np.int16,
+    "tooth_coins": np.int32,
+    "final_position": np.int16,
+    "reached_goal": np.bool_,
+}
+
+PLAY_TIME_PERCENTILES = (25, 50, 75, 90)
+
+_PLAY_TIME_PATTERN = re.compile(r"(?:(\d+)分)?(?:(\d+)秒)?")
+
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+def _empty_cursor() -> Dict:
+    # segments: 取り込み済みの圧縮セグメント名 → 件数
+    # active_offset / active_lines: 現在のセグメントの取り込み済みバイト数と件数
+    # rows: 保存先（SQLite など）から取り込み済みの件数
+    return {"segments": {}, "active_offset": 0, "active_lines": 0, "rows": 0}
+
+
+def _int(value, default: int = -1) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _parse_time(value) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _play_seconds(record: Dict) -> int:
+    """プレイ時間（「5分9秒」形式）を秒に変換（無ければ開始・終了時刻から求める）"""
+    play_time = record.get("play_time")
+    if isinstance(play_time, str) and play_time and play_time != "0分0秒":
+        match = _PLAY_TIME_PATTERN.fullmatch(play_time.strip())
+        if match and any(match.groups()):
+            minutes, seconds = (int(g) if g else 0 for g in match.groups())
+            return minutes * 60 + seconds
+    start, end = _parse_time(record.get("start_time")), _parse_time(record.get("timestamp"))
+    if start and end and end >= start:
+        return int((end - start).total_seconds())
+    return -1
+
+
+def records_to_columns(records: Iterable[Dict]) -> Dict[str, np.ndarray]:
+    """セッションレコードを列ごとの配列に変換する"""
+    rows = {name: [] for name in COLUMNS}
+    for record in records:
+        timestamp = _parse_time(record.get("timestamp"))
+        rows["timestamp"].append(timestamp.replace(tzinfo=None, microsecond=0) if timestamp else None)
+        age_group = record.get("age_group")
+        rows["age_group"].append(AGE_GROUPS.index(age_group) if age_group in AGE_GROUPS else -1)
+        rows["participant_age"].append(_int(record.get("participant_age")))
+        rows["turn_count"].append(_int(record.get("turn_count")))
+        rows["play_seconds"].append(_play_seconds(record))
+        rows["caries_correct"].append(_int(record.get("caries_correct"), 0))
+        rows["perio_correct"].append(_int(record.get("perio_correct"), 0))
+        rows["teeth_count"].append(_int(record.get("teeth_count")))
+        rows["tooth_coins"].append(_int(record.get("tooth_coins")))
+        rows["final_position"].append(_int(record.get("final_position")))
+        rows["reached_goal"].append(bool(record.get("reached_goal", False)))
+    columns = {}
+    for name, dtype in COLUMNS.items():
+        if name == "timestamp":
+            columns[name] = np.array(
+                [np.datetime64(v, 's') if v else np.datetime64('NaT') for v in rows[name]],
+                dtype=dtype,
+            )
+        else:
+            columns[name] = np.array(rows[name], dtype=dtype)
+    return columns
+
+
+class SessionAnalytics:
+    """体験ログの列指向キャッシュと集計
+
+    source を渡すとセッションログの代わりにその保存先の iter_sessions() を取り込む。
+    """
+
+    def __init__(self, log: Optional[SessionLog] = None,
+                 cache_path: str = ANALYTICS_CACHE_FILE,
+                 quiz_file: str = QUIZ_FILE,
+                 source: Optional[StorageBackend] = None):
+        self.log = log or get_session_log(SESSION_LOG_FILE)
+        self.source = source
+        self.cache_path = cache_path
+        self.quiz_file = quiz_file
+        self._columns: Dict[str, np.ndarray] = _empty_columns()
+        self._cursor: Dict = _empty_cursor()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._question_counts: Optional[Dict] = None
+
+    # ------------------------------------------------------------------
+    # キャッシュ
+    # ------------------------------------------------------------------
+    def _load_cache(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                columns = {name: data[name] for name in COLUMNS}
+                cursor = json.loads(str(data["cursor"]))
+        except Exception as e:
+            # 壊れている・列が変わった場合は作り直す
+            print(f"Analytics cache ignored: {e}")
+            return
+        self._columns = columns
+        self._cursor = cursor
+
+    def _save_cache(self) -> None:
+        buffer = io.BytesIO()
+        np.savez(buffer, cursor=np.array(json.dumps(self._cursor)), **self._columns)
+        atomic_write_bytes(self.cache_path, buffer.getvalue())
+
+    def _reset(self) -> None:
+        self._columns = _empty_columns()
+        self._cursor = _empty_cursor()
+
+    # ------------------------------------------------------------------
+    # 取り込み
+    # ------------------------------------------------------------------
+    def _read_log(self) -> tuple:
+        """セッションログの未取り込みのレコードと、キャッシュを書き直すかを返す"""
+        self.log.migrate_legacy()
+        cursor = self._cursor
+        with file_lock(self.log.path):
+            rotated = [p for p in self.log.segments() if p.endswith(".gz")]
+            names = {os.path.basename(p) for p in rotated}
+            new_rotated = [p for p in rotated if os.path.basename(p) not in cursor["segments"]]
+            active_size = os.path.getsize(self.log.path) if os.path.exists(self.log.path) else 0
+            # 取り込み済みのセグメントが消えた・現在のセグメントが縮んだ（リセット）なら作り直す
+            stale = (any(name not in names for name in cursor["segments"])
+                     or (not new_rotated and active_size < cursor["active_offset"]))
+            if stale:
+                self._reset()
+                cursor = self._cursor
+                new_rotated = rotated
+            # 前回読んだ現在のセグメントは、ローテーション後は最初の新しい圧縮セグメントになっている
+            skip = cursor["active_lines"] if new_rotated else 0
+            offset = 0 if new_rotated else cursor["active_offset"]
+            active_records, active_offset = self.log.read_current(offset)
+
+        records: List[Dict] = []
+        for index, segment in enumerate(new_rotated):
+            segment_records = list(iter_segment(segment))
+            records.extend(segment_records[skip if index == 0 else 0:])
+            cursor["segments"][os.path.basename(segment)] = len(segment_records)
+        records.extend(active_records)
+
+        changed = bool(records or new_rotated or stale or active_offset != cursor["active_offset"])
+        if new_rotated:
+            cursor["active_lines"] = 0
+        cursor["active_lines"] += len(active_records)
+        cursor["active_offset"] = active_offset
+        return records, changed
+
+    def _read_source(self) -> tuple:
+        """保存先の未取り込みのレコードと、キャッシュを書き直すかを返す"""
+        done = self._cursor.get("rows", 0)
+        records: List[Dict] = []
+        total = 0
+        for record in self.source.iter_sessions():
+            if total >= done:
+                records.append(record)
+            total += 1
+        stale = total < done
+        if stale:
+            # 体験ログが消された（リセット）なら作り直す
+            self._reset()
+            records = list(self.source.iter_sessions())
+            total = len(records)
+        self._cursor["rows"] = total
+        return records, bool(records or stale)
+
+    def ingest(self) -> int:
+        """体験ログに追記された行を取り込み、追加した件数を返す"""
+        with self._lock:
+            self._load_cache()
+            records, changed = self._read_source() if self.source is not None else self._read_log()
+            if records:
+                new_columns = records_to_columns(records)
+                self._columns = {
+                    name: np.concatenate([self._columns[name], new_columns[name]])
+                    for name in COLUMNS
+                }
+            if changed:
+                self._save_cache()
+            return len(records)
+
+    def columns(self, refresh: bool = True) -> Dict[str, np.ndarray]:
+        """列ごとの配列（refresh=True なら先に新しい行を取り込む）"""
+        if refresh:
+            self.ingest()
+        with self._lock:
+            self._load_cache()
+            return dict(self._columns)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load_cache()
+            return len(self._columns["timestamp"])
+
+    # ------------------------------------------------------------------
+    # 集計
+    # ------------------------------------------------------------------
+    def _questions(self, quiz: str, age_group: str) -> int:
+        """クイズの問題数（ファイルが無ければ 0）"""
+        if self._question_counts is None:
+            counts = {}
+            for q in QUIZZES:
+                for group in AGE_GROUPS:
+                    try:
+                        with open(self.quiz_file.format(quiz=q, age_group=group), 'r', encoding='utf-8') as f:
+                            counts[(q, group)] = len(json.load(f).get("questions", []))
+                    except (OSError, json.JSONDecodeError, AttributeError):
+                        counts[(q, group)] = 0
+            self._question_counts = counts
+        return self._question_counts.get((quiz, age_group), 0)
+
+    def summary(self, day: Optional[str] = None, refresh: bool = True) -> Dict:
+        """スタッフ画面用の集計（day を "YYYY-MM-DD" で指定するとその日だけ）"""
+        cols = self.columns(refresh)
+        if day is not None:
+            mask = cols["timestamp"].astype('datetime64[D]') == np.datetime64(day, 'D')
+            cols = {name: values[mask] for name, values in cols.items()}
+        return {
+            "sessions": int(len(cols["timestamp"])),
+            "goal_rate": _rate(cols["reached_goal"]),
+            "play_time": play_time_percentiles(cols),
+            "correctness": self.correctness_by_age_group(cols),
+            "coins": coin_distribution(cols),
+            "hourly": hourly_throughput(cols),
+        }
+
+    def correctness_by_age_group(self, cols: Dict[str, np.ndarray]) -> Dict[str, Dict]:
+        """年齢グループごとのクイズ正答率（正解数 ÷ 問題数の平均）"""
+        result = {}
+        for code, group in enumerate(AGE_GROUPS):
+            mask = cols["age_group"] == code
+            count = int(mask.sum())
+            stats = {"sessions": count}
+            for quiz in QUIZZES:
+                questions = self._questions(quiz, group)
+                correct = cols[f"{quiz}_correct"][mask]
+                stats[quiz] = (round(float(correct.mean()) / questions, 3)
+                               if count and questions else None)
+            result[group] = stats
+        return result
+
+    def clear(self) -> None:
+        """キャッシュを消す（次回の取り込みで全件読み直す）"""
+        with self._lock:
+            self._reset()
+            self._loaded = True
+            try:
+                os.remove(self.cache_path)
+            except FileNotFoundError:
+                pass
+
+
+def _rate(flags: np.ndarray) -> Optional[float]:
+    return round(float(flags.mean()), 3) if len(flags) else None
+
+
+def play_time_percentiles(cols: Dict[str, np.ndarray]) -> Dict[int, Optional[float]]:
+    """プレイ時間（秒）のパーセンタイル"""
+    seconds = cols["play_seconds"]
+    seconds = seconds[seconds >= 0]
+    if not len(seconds):
+        return {p: None for p in PLAY_TIME_PERCENTILES}
+    values = np.percentile(seconds, PLAY_TIME_PERCENTILES)
+    return {p: float(v) for p, v in zip(PLAY_TIME_PERCENTILES, values)}
+
+
+def coin_distribution(cols: Dict[str, np.ndarray], bins: int = 10) -> Dict:
+    """トゥースコインの分布（ヒストグラムと平均・中央値）"""
+    coins = cols["tooth_coins"]
+    coins = coins[coins >= 0]
+    if not len(coins):
+        return {"counts": [], "edges": [], "mean": None, "median": None}
+    counts, edges = np.histogram(coins, bins=bins)
+    return {
+        "counts": counts.tolist(),
+        "edges": edges.tolist(),
+        "mean": float(coins.mean()),
+        "median": float(np.median(coins)),
+    }
+
+
+def hourly_throughput(cols: Dict[str, np.ndarray]) -> List[int]:
+    """時間帯（0〜23時）ごとのセッション数"""
+    timestamps = cols["timestamp"]
+    timestamps = timestamps[~np.isnat(timestamps)]
+    hours = (timestamps.astype('datetime64[h]') - timestamps.astype('datetime64[D]')).astype(np.int64)
+    return np.bincount(hours, minlength=24).tolist()
+
+
+# グローバルインスタンス（セッションログ用と、JSON 以外の保存先ごと）
+_analytics = SessionAnalytics()
+_backend_analytics: Dict[str, SessionAnalytics] = {}
+_backend_analytics_lock = threading.Lock()
+
+
+def get_session_analytics(backend: Optional[StorageBackend] = None) -> SessionAnalytics:
+    """集計サービスのインスタンスを取得
+
+    体験ログを書いているローカル保存先（省略時は現在の設定の保存先）に合わせて、
+    JSON ならセッションログを、それ以外ならその保存先を集計する。
+    """
+    if backend is None:
+        from services.store import get_local_backend
+        backend = get_local_backend()
+    if backend.name == BACKEND_JSON:
+        return _analytics
+    with _backend_analytics_lock:
+        analytics = _backend_analytics.get(backend.name)
+        if analytics is None:
+            analytics = _backend_analytics[backend.name] = SessionAnalytics(
+                cache_path=BACKEND_CACHE_FILE.format(backend=backend.name), source=backend,
+            )
+        # 設定の変更で作り直された保存先に差し替える
+        analytics.source = backend
+        return analytics
@@ -0,0 +1,153 @@
+"""
+データファイルの安全な書き込み
+
+一時ファイルに書いて fsync してから rename することで、途中で落ちても
+壊れたファイルが残らないようにする。読み取り→更新→書き込みは
+fcntl のアドバイザリロック（待ち時間に上限あり）で複数プロセス間でも直列化する。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # Windows など fcntl が無い環境ではプロセス内のロックのみ
+    fcntl = None
+
+# ロック取得の最大待ち時間（秒）
+LOCK_TIMEOUT_SECONDS = 5.0
+
+
+class FileLockTimeout(TimeoutError):
+    """ロックを時間内に取得できなかった"""
+
+
+_thread_locks: dict = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    with _thread_locks_guard:
+        lock = _thread_locks.get(path)
+        if lock is None:
+            lock = _thread_locks[path] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = LOCK_TIMEOUT_SECONDS) -> Iterator[None]:
+    """path に対応する排他ロック（ロックファイルは path + ".lock"）"""
+    lock_path = os.path.abspath(path) + ".lock"
+    if fcntl is None:
+        lock = _thread_lock(lock_path)
+        if not lock.acquire(timeout=timeout):
+            raise FileLockTimeout(f"Timed out waiting for lock: {lock_path}")
+        try:
+            yield
+        finally:
+            lock.release()
+        return
+
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise FileLockTimeout(f"Timed out waiting for lock: {lock_path}")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    """一時ファイル + fsync + rename でテキストを書き込む"""
+    atomic_write_bytes(path, text.encode('utf-8'))
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    """一時ファイル + fsync + rename でバイト列を書き込む"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(directory)
+
+
+def fsync_directory(directory: str) -> None:
+    """rename をディスクに確定させる（対応していないOSでは何もしない）"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path: str, data: Any) -> None:
+    """JSONをアトミックに書き込む（ロックは取らない）"""
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def write_json(path: str, data: Any, timeout: float = LOCK_TIMEOUT_SECONDS) -> None:
+    """ロックを取ってJSONをアトミックに書き込む"""
+    with file_lock(path, timeout):
+        atomic_write_json(path, data)
+
+
+def ensure_json_file(path: str, default_factory: Callable[[], Any],
+                     timeout: float = LOCK_TIMEOUT_SECONDS) -> None:
+    """ファイルが無ければ初期値で作成する（他プロセスが作成済みなら何もしない）"""
+    if os.path.exists(path):
+        return
+    with file_lock(path, timeout):
+        if not os.path.exists(path):
+            atomic_write_json(path, default_factory())
+
+
+@contextmanager
+def update_json(path: str, default_factory: Callable[[], Any],
+                timeout: float = LOCK_TIMEOUT_SECONDS) -> Iterator[Any]:
+    """ロックを保持したまま読み込んだデータを渡し、ブロックを抜けたら書き戻す
+
+    ファイルが無い場合は default_factory() の値から始める。
+    読み込みに失敗した（壊れている）場合は例外をそのまま送出し、上書きしない。
+    """
+    with file_lock(path, timeout):
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        else:
+            data = default_factory()
+        yield data
+        atomic_write_json(path, data)
@@ -0,0 +1,630 @@
+"""
+保存先（バックエンド）の共通インターフェースと実装
+
+スコア・参加者数・体験ログ・設定の読み書きを StorageBackend として抽象化し、
+インメモリ / JSONファイル / SQLite / Firestore の各実装と、
+優先先に書いてから別の保存先へ非同期で複製する MirroredBackend を提供する。
+どれを使うかは data/settings.json の storage セクションで選ぶ（build_backend）。
+"""
+import copy
+import json
+import os
+import uuid
+from typing import Dict, Iterator, List, Optional, Protocol
+
+from services.atomic_io import ensure_json_file, update_json, write_json
+from services.bulk_write import ProgressCallback
+from services.leaderboard import LEADERBOARD_CAPACITY, get_leaderboard_index
+from services.outbox import OUTBOX_FILE, Outbox, OutboxItem, OutboxReplayer, get_outbox
+from services.rank_index import (
+    ALL, ALL_SCORES, SCORE_HISTORY_FILE, Partition, PartitionedLeaderboard, ScoreRange,
+    get_rank_index,
+)
+from services.session_log import SESSION_LOG_FILE, get_session_log
+from services.sqlite_store import SQLITE_FILE, SQLiteStore, get_sqlite_store
+from services.write_queue import WriteBehindQueue, get_write_queue
+
+# データファイルのパス
+LEADERBOARD_FILE = "data/leaderboard.json"
+PARTICIPANTS_FILE = "data/participants.json"
+SETTINGS_FILE = "data/settings.json"
+
+# storage.backend / storage.primary に書ける名前
+BACKEND_MEMORY = "memory"
+BACKEND_JSON = "json"
+BACKEND_SQLITE = "sqlite"
+BACKEND_FIRESTORE = "firestore"
+LOCAL_BACKENDS = (BACKEND_MEMORY, BACKEND_JSON, BACKEND_SQLITE)
+
+DEFAULT_SETTINGS = {"staff_pin": "0418", "current_board": "5plus"}
+
+
+class BackendUnavailable(RuntimeError):
+    """保存先に接続できない・書き込めなかった"""
+
+
+class BackendNotConfigured(BackendUnavailable):
+    """保存先が設定されていない（再試行しても無駄なもの）"""
+
+
+class StorageBackend(Protocol):
+    """保存先が実装するメソッド"""
+
+    name: str
+
+    # スコア
+    def add_scores(self, entries: List[Dict]) -> None: ...
+    def top_scores(self, limit: int, partition: Partition = ALL) -> List[Dict]: ...
+    def rank_of(self, score: int, timestamp: str, partition: Partition = ALL) -> Optional[Dict]: ...
+    def rank_by_entry_id(self, entry_id: str, partition: Partition = ALL) -> Optional[Dict]: ...
+    def iter_scores(self) -> Iterator[Dict]: ...
+    def clear_scores(self, scope: ScoreRange = ALL_SCORES,
+                     progress: Optional[ProgressCallback] = None) -> None: ...
+
+    # 参加者数
+    def add_participants(self, day_counts: Dict[str, int],
+                         idempotency_key: Optional[str] = None) -> int: ...
+    def participant_counts(self) -> Dict[str, int]: ...
+    def reset_participants(self) -> None: ...
+
+    # 体験ログ
+    def append_sessions(self, entries: List[Dict]) -> None: ...
+    def iter_sessions(self) -> Iterator[Dict]: ...
+
+    # 設定
+    def load_settings(self) -> Dict: ...
+    def save_settings(self, settings: Dict) -> None: ...
+
+
+def _empty_participants() -> Dict:
+    return {"total_count": 0, "daily_counts": {}}
+
+
+class _SettingsFileMixin:
+    """設定は保存先の選択そのものを含むため、どの保存先でもファイルに置く"""
+
+    settings_path: str = SETTINGS_FILE
+
+    def load_settings(self) -> Dict:
+        ensure_json_file(self.settings_path, lambda: dict(DEFAULT_SETTINGS))
+        with open(self.settings_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_settings(self, settings: Dict) -> None:
+        write_json(self.settings_path, settings)
+
+
+# ----------------------------------------------------------------------
+# インメモリ
+# ----------------------------------------------------------------------
+class MemoryBackend:
+    """プロセス内だけで保持する保存先（テスト・ベンチマーク用）"""
+
+    name = BACKEND_MEMORY
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self._scores = PartitionedLeaderboard()
+        self._score_log: List[Dict] = []
+        self._daily_counts: Dict[str, int] = {}
+        self._sessions: List[Dict] = []
+        self._settings = dict(settings or DEFAULT_SETTINGS)
+
+    def add_scores(self, entries: List[Dict]) -> None:
+        for entry in entries:
+            if self._scores.contains(entry.get("entry_id")):
+                continue
+            self._scores.add(dict(entry))
+            self._score_log.append(dict(entry))
+
+    def top_scores(self, limit: int, partition: Partition = ALL) -> List[Dict]:
+        return [dict(e) for e in self._scores.top(partition, limit)]
+
+    def rank_of(self, score: int, timestamp: str, partition: Partition = ALL) -> Optional[Dict]:
+        return self._scores.rank_of(partition, score, timestamp)
+
+    def rank_by_entry_id(self, entry_id: str, partition: Partition = ALL) -> Optional[Dict]:
+        return self._scores.rank_by_entry_id(partition, entry_id)
+
+    def iter_scores(self) -> Iterator[Dict]:
+        return iter([dict(e) for e in self._score_log])
+
+    def clear_scores(self, scope: ScoreRange = ALL_SCORES,
+                     progress: Optional[ProgressCallback] = None) -> None:
+        self._score_log = [e for e in self._score_log if not scope.matches(e)]
+        self._scores.load(self._score_log)
+
+    def add_participants(self, day_counts: Dict[str, int],
+                         idempotency_key: Optional[str] = None) -> int:
+        for day, count in day_counts.items():
+            self._daily_counts[day] = self._daily_counts.get(day, 0) + count
+        return sum(self._daily_counts.values())
+
+    def participant_counts(self) -> Dict[str, int]:
+        return dict(self._daily_counts)
+
+    def reset_participants(self) -> None:
+        self._daily_counts = {}
+
+    def append_sessions(self, entries: List[Dict]) -> None:
+        self._sessions.extend(dict(e) for e in entries)
+
+    def iter_sessions(self) -> Iterator[Dict]:
+        return iter([dict(e) for e in self._sessions])
+
+    def load_settings(self) -> Dict:
+        return copy.deepcopy(self._settings)
+
+    def save_settings(self, settings: Dict) -> None:
+        self._settings = copy.deepcopy(settings)
+
+
+# ----------------------------------------------------------------------
+# JSONファイル
+# ----------------------------------------------------------------------
+class JSONBackend(_SettingsFileMixin):
+    """data/ 以下の JSON / JSON Lines ファイルに保存"""
+
+    name = BACKEND_JSON
+
+    def __init__(self, leaderboard_path: str = LEADERBOARD_FILE,
+                 participants_path: str = PARTICIPANTS_FILE,
+                 sessions_path: str = SESSION_LOG_FILE,
+                 history_path: str = SCORE_HISTORY_FILE,
+                 settings_path: str = SETTINGS_FILE):
+        self.leaderboard_path = leaderboard_path
+        self.participants_path = participants_path
+        self.settings_path = settings_path
+        self._leaderboard = get_leaderboard_index(leaderboard_path)
+        # 履歴がまだ無い場合は既存のリーダーボードから順位インデックスを作る
+        self._ranks = get_rank_index(
+            history_path, seed_loader=lambda: self._leaderboard.top(LEADERBOARD_CAPACITY)
+        )
+        self._sessions = get_session_log(sessions_path)
+
+    def add_scores(self, entries: List[Dict]) -> None:
+        # 全スコアの順位インデックスに追記（登録済みの entry_id は無視される）
+        new_entries = self._ranks.add_many(entries)
+        # 上位100件のインメモリインデックスに挿入（ファイル書き出しは遅延してまとめる）
+        for entry in new_entries:
+            self._leaderboard.add(entry)
+
+    def top_scores(self, limit: int, partition: Partition = ALL) -> List[Dict]:
+        if partition.is_all:
+            return self._leaderboard.top(limit)
+        # 全体以外のランキングはスコア履歴から作ったパーティション別インデックスを使う
+        return self._ranks.top(limit, partition)
+
+    def rank_of(self, score: int, timestamp: str, partition: Partition = ALL) -> Optional[Dict]:
+        return self._ranks.rank_of(score, timestamp, partition)
+
+    def rank_by_entry_id(self, entry_id: str, partition: Partition = ALL) -> Optional[Dict]:
+        return self._ranks.rank_by_entry_id(entry_id, partition)
+
+    def iter_scores(self) -> Iterator[Dict]:
+        # 上位100件だけでなく全スコアの履歴から返す
+        return self._ranks.iter_records()
+
+    def clear_scores(self, scope: ScoreRange = ALL_SCORES,
+                     progress: Optional[ProgressCallback] = None) -> None:
+        self._ranks.clear(scope)
+        self._leaderboard.clear()
+        if not scope.is_all:
+            # 範囲外のスコアで上位100件を作り直す
+            for entry in self._ranks.top(LEADERBOARD_CAPACITY):
+                self._leaderboard.add(entry)
+
+    def add_participants(self, day_counts: Dict[str, int],
+                         idempotency_key: Optional[str] = None) -> int:
+        # 他プロセスの加算を取りこぼさないようロックを保持したまま読み書きする
+        with update_json(self.participants_path, _empty_participants) as data:
+            for day, count in day_counts.items():
+                data["total_count"] += count
+                data["daily_counts"][day] = data["daily_counts"].get(day, 0) + count
+        return data["total_count"]
+
+    def participant_counts(self) -> Dict[str, int]:
+        if not os.path.exists(self.participants_path):
+            return {}
+        with open(self.participants_path, 'r', encoding='utf-8') as f:
+            return dict(json.load(f).get("daily_counts", {}))
+
+    def reset_participants(self) -> None:
+        write_json(self.participants_path, _empty_participants())
+
+    def append_sessions(self, entries: List[Dict]) -> None:
+        self._sessions.append_many(entries)
+
+    def iter_sessions(self) -> Iterator[Dict]:
+        return self._sessions.iter_records()
+
+
+# ----------------------------------------------------------------------
+# SQLite
+# ----------------------------------------------------------------------
+class SQLiteBackend(_SettingsFileMixin):
+    """SQLite（WAL）に保存"""
+
+    name = BACKEND_SQLITE
+
+    def __init__(self, store: Optional[SQLiteStore] = None, settings_path: str = SETTINGS_FILE):
+        self.store = store or get_sqlite_store(SQLITE_FILE)
+        self.settings_path = settings_path
+
+    def add_scores(self, entries: List[Dict]) -> None:
+        self.store.add_scores(entries)
+
+    def top_scores(self, limit: int, partition: Partition = ALL) -> List[Dict]:
+        return self.store.top_scores(limit, partition)
+
+    def rank_of(self, score: int, timestamp: str, partition: Partition = ALL) -> Optional[Dict]:
+        return self.store.rank_of(score, timestamp, partition)
+
+    def rank_by_entry_id(self, entry_id: str, partition: Partition = ALL) -> Optional[Dict]:
+        return self.store.rank_by_entry_id(entry_id, partition)
+
+    def iter_scores(self) -> Iterator[Dict]:
+        return self.store.iter_scores()
+
+    def clear_scores(self, scope: ScoreRange = ALL_SCORES,
+                     progress: Optional[ProgressCallback] = None) -> None:
+        self.store.clear_scores(scope)
+
+    def add_participants(self, day_counts: Dict[str, int],
+                         idempotency_key: Optional[str] = None) -> int:
+        total = sum(self.store.participant_counts().values())
+        for day, count in day_counts.items():
+            total = self.store.increment_participants(day, by=count)
+        return total
+
+    def participant_counts(self) -> Dict[str, int]:
+        return self.store.participant_counts()
+
+    def reset_participants(self) -> None:
+        self.store.reset_participants()
+
+    def append_sessions(self, entries: List[Dict]) -> None:
+        self.store.append_sessions(entries)
+
+    def iter_sessions(self) -> Iterator[Dict]:
+        return self.store.iter_sessions()
+
+    def import_from(self, source: StorageBackend) -> None:
+        """別の保存先（初回切り替え時のローカルJSON）からデータを取り込む
+
+        スコアは上位100件だけでなく、全スコアの履歴を取り込む。
+        """
+        self.store.import_json(
+            source.iter_scores(),
+            source.participant_counts(),
+            source.iter_sessions(),
+        )
+
+
+# ----------------------------------------------------------------------
+# Firestore
+# ----------------------------------------------------------------------
+class FirestoreBackend(_SettingsFileMixin):
+    """FirebaseService 経由で Firestore に保存（接続できなければ BackendUnavailable）"""
+
+    name = BACKEND_FIRESTORE
+
+    def __init__(self, service=None, settings_path: str = SETTINGS_FILE,
+                 leaderboard_cache_ttl: Optional[float] = None):
+        if service is None:
+            from services.firebase import get_firebase_service
+            service = get_firebase_service()
+        self.service = service
+        self.settings_path = settings_path
+        if leaderboard_cache_ttl is not None:
+            service.leaderboard_cache.configure(ttl=float(leaderboard_cache_ttl))
+
+    def _require(self) -> None:
+        if self.service.initialize():
+            return
+        if self.service.configured is False:
+            raise BackendNotConfigured("Firestore is not configured")
+        # 接続できずブレーカーが開いている（書き込みは Outbox から後で再送する）
+        raise BackendUnavailable("Firestore circuit is open")
+
+    def add_scores(self, entries: List[Dict]) -> None:
+        self._require()
+        if len(entries) > 1:
+            # まとめて届いた分（書き込みキュー・Outbox の再送・取り込み）はバッチで書く
+            if self.service.import_scores(entries) < 0:
+                raise BackendUnavailable(f"Failed to save {len(entries)} scores to Firestore")
+            return
+        failed = [e for e in entries if not self.service.save_player_score(e)]
+        if failed:
+            raise BackendUnavailable(f"Failed to save {len(failed)} scores to Firestore")
+
+    def top_scores(self, limit: int, partition: Partition = ALL) -> List[Dict]:
+        self._require()
+        return self.service.get_leaderboard(limit=limit, partition=partition)
+
+    def rank_of(self, score: int, timestamp: str, partition: Partition = ALL) -> Optional[Dict]:
+        self._require()
+        return self.service.get_player_rank(score, timestamp, partition)
+
+    def rank_by_entry_id(self, entry_id: str, partition: Partition = ALL) -> Optional[Dict]:
+        self._require()
+        return self.service.get_rank_by_entry_id(entry_id, partition)
+
+    def iter_scores(self) -> Iterator[Dict]:
+        self._require()
+        return self.service.iter_scores()
+
+    def clear_scores(self, scope: ScoreRange = ALL_SCORES,
+                     progress: Optional[ProgressCallback] = None) -> None:
+        self._require()
+        if not self.service.clear_leaderboard(scope, progress):
+            raise BackendUnavailable("Failed to clear Firestore leaderboard")
+
+    def add_participants(self, day_counts: Dict[str, int],
+                         idempotency_key: Optional[str] = None) -> int:
+        self._require()
+        total = 0
+        for day, count in day_counts.items():
+            total = self.service.increment_participant_count(
+                day=day, by=count, idempotency_key=idempotency_key)
+            if total <= 0:
+                raise BackendUnavailable("Failed to increment Firestore participant count")
+        return total
+
+    def participant_counts(self) -> Dict[str, int]:
+        self._require()
+        return dict(self.service.get_participant_stats().get("daily_counts", {}))
+
+    def reset_participants(self) -> None:
+        self._require()
+        if not self.service.reset_participant_count():
+            raise BackendUnavailable("Failed to reset Firestore participant count")
+
+    def append_sessions(self, entries: List[Dict]) -> None:
+        self._require()
+        if not self.service.append_sessions(entries):
+            raise BackendUnavailable("Failed to save sessions to Firestore")
+
+    def iter_sessions(self) -> Iterator[Dict]:
+        self._require()
+        return self.service.iter_sessions()
+
+
+# ----------------------------------------------------------------------
+# 優先先 + 非同期複製
+# ----------------------------------------------------------------------
+# 複製先にも同期で反映する操作（後から読む側とずれると困るもの）
+_SYNC_MIRROR_OPS = ("clear_scores", "reset_participants", "save_settings")
+
+# 優先先への再送を送信待ち箱（Outbox）に記録する操作と、1件ごとの重複防止キー
+_OUTBOX_KEYS = {
+    "add_scores": "entry_id",
+    "append_sessions": "session_id",
+}
+
+
+class MirroredBackend:
+    """優先先に同期で書き、複製先にはキュー経由で非同期に複製する
+
+    優先先への書き込みに失敗した場合は複製先に同期で書き込み、
+    優先先への書き込みはキューで再試行する。outbox を渡すと再試行分は
+    メモリ上のキューではなく Outbox（SQLite）に記録し、再起動後も再送する。
+    読み込みは優先先から行い、失敗したか結果が空のときは複製先から読む。
+    """
+
+    def __init__(self, primary: StorageBackend, mirror: StorageBackend,
+                 queue: Optional[WriteBehindQueue] = None,
+                 outbox: Optional[Outbox] = None):
+        self.primary = primary
+        self.mirror = mirror
+        self.name = f"{primary.name}+{mirror.name}"
+        self._queue = queue
+        self.outbox = outbox
+        self._mirror_kind = f"mirror:{self.name}"
+        self._retry_kind = f"retry:{self.name}"
+        if queue is not None:
+            queue.register_handler(self._mirror_kind, lambda batch: self._replay(self.mirror, batch))
+            queue.register_handler(self._retry_kind, lambda batch: self._replay(self.primary, batch))
+
+    @staticmethod
+    def _replay(backend: StorageBackend, batch: List[Dict]) -> List[Dict]:
+        failed = []
+        for item in batch:
+            try:
+                getattr(backend, item["op"])(*item["args"])
+            except Exception as e:
+                print(f"{backend.name} {item['op']} failed: {e}")
+                failed.append(item)
+        return failed
+
+    def _queue_retry(self, op: str, args: tuple) -> None:
+        if self.outbox is not None:
+            self.outbox.add(op, self._outbox_items(op, args))
+        elif self._queue is not None:
+            self._queue.submit(self._retry_kind, {"op": op, "args": args})
+
+    @staticmethod
+    def _outbox_items(op: str, args: tuple) -> List[tuple]:
+        """再送する操作を (重複防止キー, payload) の組に分ける"""
+        if op == "add_participants":
+            # 加算は再送で二重に数えないよう、キーを付けて上書きで書く
+            key = args[1] if len(args) > 1 and args[1] else f"{op}:{uuid.uuid4().hex}"
+            return [(key, {"day_counts": args[0]})]
+        id_field = _OUTBOX_KEYS[op]
+        return [(f"{op}:{entry.get(id_field) or uuid.uuid4().hex}", entry) for entry in args[0]]
+
+    def replay_outbox(self, op: str, items: List[OutboxItem]) -> List[OutboxItem]:
+        """Outbox に記録した操作を優先先へ送り、失敗した行を返す"""
+        if op == "add_participants":
+            failed = []
+            for item in items:
+                try:
+                    self.primary.add_participants(item.payload["day_counts"], idempotency_key=item.key)
+                except Exception as e:
+                    print(f"{self.primary.name} {op} failed: {e}")
+                    failed.append(item)
+            return failed
+        # スコア・体験ログは ID をドキュメントIDにして書くので、まとめて送り直してよい
+        try:
+            getattr(self.primary, op)([item.payload for item in items])
+        except Exception as e:
+            print(f"{self.primary.name} {op} failed: {e}")
+            return items
+        return []
+
+    def _mirror_write(self, op: str, args: tuple) -> None:
+        if self._queue is None:
+            getattr(self.mirror, op)(*args)
+        else:
+            self._queue.submit(self._mirror_kind, {"op": op, "args": args})
+
+    def _write(self, op: str, *args):
+        try:
+            result = getattr(self.primary, op)(*args)
+        except Exception as e:
+            print(f"⚠ {self.primary.name} {op} failed, using {self.mirror.name}: {e}")
+            result = getattr(self.mirror, op)(*args)
+            if op not in _SYNC_MIRROR_OPS and not isinstance(e, BackendNotConfigured):
+                # 一時的な失敗なら優先先への書き込みを後で再試行する
+                self._queue_retry(op, args)
+            return result
+        if op in _SYNC_MIRROR_OPS:
+            getattr(self.mirror, op)(*args)
+        else:
+            self._mirror_write(op, args)
+        return result
+
+    def _iter(self, op: str) -> Iterator[Dict]:
+        """優先先から順に読む（最初の1件までに失敗したら複製先から読む）"""
+        try:
+            records = iter(getattr(self.primary, op)())
+            first = next(records, None)
+        except Exception as e:
+            print(f"⚠ {self.primary.name} {op} failed, using {self.mirror.name}: {e}")
+            yield from getattr(self.mirror, op)()
+            return
+        if first is None:
+            yield from getattr(self.mirror, op)()
+            return
+        yield first
+        yield from records
+
+    def _read(self, op: str, *args):
+        try:
+            result = getattr(self.primary, op)(*args)
+            if result:
+                return result
+        except Exception as e:
+            print(f"⚠ {self.primary.name} {op} failed, using {self.mirror.name}: {e}")
+        return getattr(self.mirror, op)(*args)
+
+    def add_scores(self, entries: List[Dict]) -> None:
+        self._write("add_scores", entries)
+
+    def top_scores(self, limit: int, partition: Partition = ALL) -> List[Dict]:
+        return self._read("top_scores", limit, partition)
+
+    def rank_of(self, score: int, timestamp: str, partition: Partition = ALL) -> Optional[Dict]:
+        return self._read("rank_of", score, timestamp, partition)
+
+    def rank_by_entry_id(self, entry_id: str, partition: Partition = ALL) -> Optional[Dict]:
+        return self._read("rank_by_entry_id", entry_id, partition)
+
+    def iter_scores(self) -> Iterator[Dict]:
+        return self._iter("iter_scores")
+
+    def clear_scores(self, scope: ScoreRange = ALL_SCORES,
+                     progress: Optional[ProgressCallback] = None) -> None:
+        # 未送信のスコアが後から再送されてランキングに戻らないよう先に捨てる
+        if self.outbox is not None:
+            self.outbox.discard("add_scores", scope.matches)
+        self._write("clear_scores", scope, progress)
+
+    def add_participants(self, day_counts: Dict[str, int],
+                         idempotency_key: Optional[str] = None) -> int:
+        return self._write("add_participants", day_counts, idempotency_key)
+
+    def participant_counts(self) -> Dict[str, int]:
+        return self._read("participant_counts")
+
+    def reset_participants(self) -> None:
+        if self.outbox is not None:
+            self.outbox.clear("add_participants")
+        self._write("reset_participants")
+
+    def append_sessions(self, entries: List[Dict]) -> None:
+        self._write("append_sessions", entries)
+
+    def iter_sessions(self) -> Iterator[Dict]:
+        # 優先先（Firestore）はページ単位で読むので全件でも一度にメモリに載せない
+        return self._iter("iter_sessions")
+
+    def load_settings(self) -> Dict:
+        return self.mirror.load_settings()
+
+    def save_settings(self, settings: Dict) -> None:
+        self._write("save_settings", settings)
+
+
+# ----------------------------------------------------------------------
+# 設定からの組み立て
+# ----------------------------------------------------------------------
+def build_local_backend(storage: Dict) -> StorageBackend:
+    """storage.backend で選ばれたローカル保存先を作る"""
+    name = storage.get("backend", BACKEND_JSON)
+    if name == BACKEND_MEMORY:
+        return MemoryBackend()
+    if name == BACKEND_SQLITE:
+        backend = SQLiteBackend(get_sqlite_store(storage.get("sqlite_path", SQLITE_FILE)))
+        if not backend.store.json_imported():
+            # 初めてSQLiteに切り替えたときにローカルJSONのデータを取り込む
+            # （取り込み済みを記録するので、リセットで空になっても取り込み直さない）
+            try:
+                if backend.store.is_empty():
+                    backend.import_from(JSONBackend())
+                    print(f"✓ Imported local JSON data into {backend.store.path}")
+                else:
+                    # 記録を始める前の版で取り込み済み
+                    backend.store.mark_json_imported()
+            except Exception as e:
+                print(f"SQLite import error: {e}")
+        return backend
+    return JSONBackend()
+
+
+def build_backend(storage: Dict, queue: Optional[WriteBehindQueue] = None) -> StorageBackend:
+    """storage セクションから保存先を組み立てる
+
+    storage.primary に "firestore" を指定すると Firestore を優先先、
+    storage.backend のローカル保存先を複製先とする MirroredBackend になる。
+    """
+    local = build_local_backend(storage)
+    primary = storage.get("primary", BACKEND_FIRESTORE)
+    if primary == BACKEND_FIRESTORE:
+        firestore = FirestoreBackend(leaderboard_cache_ttl=storage.get("leaderboard_cache_ttl"))
+        if storage.get("leaderboard_mirror", True):
+            # ランキングは集計ドキュメントのリスナーで保つ写しから読む（全セッション共有）
+            firestore.service.start_leaderboard_mirror()
+        outbox = get_outbox(storage.get("outbox_path", OUTBOX_FILE))
+        backend = MirroredBackend(firestore, local, queue or get_write_queue(), outbox)
+        start_outbox_replayer(backend)
+        return backend
+    return local
+
+
+_replayer: Optional[OutboxReplayer] = None
+
+
+def start_outbox_replayer(backend: MirroredBackend) -> OutboxReplayer:
+    """Outbox の再送ワーカーを backend 向けに（作り直して）起動する"""
+    global _replayer
+    if _replayer is not None:
+        _replayer.stop(timeout=1.0)
+    _replayer = OutboxReplayer(backend.outbox, backend.replay_outbox)
+    _replayer.start()
+    return _replayer
+
+
+def get_outbox_replayer() -> Optional[OutboxReplayer]:
+    """起動中の Outbox 再送ワーカー（Firestore を使っていなければ None）"""
+    return _replayer
+
@@ -0,0 +1,220 @@
+"""
+マスに止まったときの歯の変化（ボードの effects）
+
+ボードの各マスに effects として歯の変化を並べて書く。
+
+    "effects": [{"op": "lose_specific", "ids": ["UL1", "UR1"]}, {"op": "stain", "count": 3}]
+
+ボードを読み込むときに op ごとの関数へ引数を結び付けた呼び出し可能オブジェクトの
+tuple にしておく（compile_effects）。止まったときはそれを順に呼ぶだけで、
+マスのタイトルで処理を選ぶ必要はない。新しい変化は @effect で登録する。
+
+各変化は (game_state, session, messages) を受け取る。session は st.session_state
+（teeth_data などの表示用の状態）、messages には (tone, 文言) を追加する。
+歯の状態（game_state の tooth_chart）と data/teeth.json の両方を更新し、
+何か変化があれば True を返す。
+"""
+from functools import partial
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Sequence, Tuple
+
+from services import teeth as teeth_service
+
+Messages = List[Tuple[str, str]]
+Effect = Callable[[Dict, MutableMapping, Messages], bool]
+
+# op → (関数, 引数名 → 型)
+_EFFECTS: Dict[str, Tuple[Callable[..., bool], Dict[str, type]]] = {}
+
+CAVITY_KINDS = (
+    "first_premolar",
+    "second_premolar",
+    "first_molar",
+    "second_molar",
+    "primary_first_molar",
+    "primary_second_molar",
+)
+
+
+def effect(op: str, **params: type):
+    """op の変化として登録する（params は JSON で指定できる引数とその型）"""
+    def register(func):
+        _EFFECTS[op] = (func, params)
+        return func
+    return register
+
+
+def compile_effects(specs: Any) -> Tuple[Tuple[Effect, ...], List[str]]:
+    """effects の指定を (呼び出し可能オブジェクトの tuple, 誤りのリスト) にする"""
+    if not isinstance(specs, list):
+        return (), ["effects は配列である必要があります"]
+    compiled = []
+    errors = []
+    for index, spec in enumerate(specs):
+        where = f"effects[{index}]"
+        if not isinstance(spec, dict) or not isinstance(spec.get("op"), str):
+            errors.append(f"{where}: op を持つオブジェクトである必要があります")
+            continue
+        op = spec["op"]
+        if op not in _EFFECTS:
+            errors.append(f"{where}: 不明な op {op!r}")
+            continue
+        func, types = _EFFECTS[op]
+        kwargs = {}
+        for name, value in spec.items():
+            if name == "op":
+                continue
+            if name not in types:
+                errors.append(f"{where}: {op} に不明な引数 {name!r}")
+            elif not isinstance(value, types[name]) or (types[name] is int and isinstance(value, bool)):
+                errors.append(f"{where}: {op} の {name} は {types[name].__name__} である必要があります（{value!r}）")
+            else:
+                kwargs[name] = tuple(value) if isinstance(value, list) else value
+        compiled.append(partial(func, **kwargs))
+    return tuple(compiled), errors
+
+
+def apply_effects(effects: Optional[Sequence[Effect]], game_state: Dict,
+                  session: MutableMapping, messages: Messages) -> bool:
+    """マスの変化を順に適用する（どれかが変化を起こせば True）"""
+    applied = False
+    for func in effects or ():
+        applied = func(game_state, session, messages) or applied
+    return applied
+
+
+def _reload_teeth_json(session: MutableMapping) -> None:
+    session['teeth_data'] = teeth_service.load_teeth_json()
+
+
+@effect("adult_teeth")
+def adult_teeth(game_state, session, messages) -> bool:
+    """大人の歯に生えそろう（抜けていた歯も含めて28本にする）"""
+    if not teeth_service.upgrade_to_adult(game_state):
+        return False
+    teeth_service.reset_all_teeth_to_healthy(game_state)
+    teeth_service.sync_teeth_count(game_state)
+    game_state['teeth_count'] = 28
+    game_state['teeth_max'] = 28
+    game_state['teeth_missing'] = 0
+    session['teeth_count'] = 28
+    messages.append(('success', '✨ 大人の歯が ぜんぶ生えそろったよ！28本になったね。'))
+    return True
+
+
+@effect("lose_primary")
+def lose_primary(game_state, session, messages) -> bool:
+    """乳歯が抜ける（乳歯20本のときは永久歯28本に生え変わる）"""
+    teeth_data = teeth_service.load_teeth_json()
+    if max(int(k) for k in teeth_data["UR"].keys()) <= 5:
+        session['teeth_data'] = teeth_service.transition_to_adult_teeth()
+        messages.append(('success', '✨ 大人の歯に生え変わったよ！全部で28本になったね。'))
+        return True
+    applied = False
+    if teeth_service.lose_primary_tooth(game_state, count=1):
+        messages.append(('info', '👶 乳歯が1本ぬけたよ。大人の歯がはえてくるまでまっていよう！'))
+        applied = True
+    teeth_service.update_tooth_status_random("E", count=1)
+    _reload_teeth_json(session)
+    return applied
+
+
+@effect("cavity", kinds=list, treatment=bool)
+def cavity(game_state, session, messages, kinds: Sequence[str] = CAVITY_KINDS,
+           treatment: bool = False) -> bool:
+    """奥歯が1本むし歯になる（treatment なら治療ボタンを出す）"""
+    applied = False
+    if teeth_service.damage_random_tooth(game_state, kinds=kinds):
+        if treatment:
+            messages.append(('warning', '🦷 むし歯ができちゃった！治療を受けよう！'))
+            session['needs_caries_treatment'] = True
+        else:
+            messages.append(('warning', '⚠️ 虫歯ができちゃった…定期検診でなおそう！'))
+        applied = True
+    teeth_service.update_tooth_status_random("C", count=1)
+    _reload_teeth_json(session)
+    return applied
+
+
+@effect("stain", count=int, message=str)
+def stain(game_state, session, messages, count: int = 3,
+          message: str = '🥤 ジュースばかりで歯がすこし黄ばんできたよ。') -> bool:
+    """count 本に着色がつく"""
+    applied = False
+    if teeth_service.stain_teeth(game_state, count=count):
+        messages.append(('warning', message))
+        applied = True
+    teeth_service.update_tooth_status_random("S", count=count)
+    _reload_teeth_json(session)
+    return applied
+
+
+@effect("whiten", message=str)
+def whiten(game_state, session, messages,
+           message: str = '✨ 茶渋をきれいにして歯がピカピカになったよ！') -> bool:
+    """着色を落とす"""
+    applied = False
+    if teeth_service.whiten_teeth(game_state):
+        messages.append(('success', message))
+        applied = True
+    teeth_service.restore_stained_teeth()
+    _reload_teeth_json(session)
+    return applied
+
+
+@effect("lose_random", count=int, message=str)
+def lose_random(game_state, session, messages, count: int = 1,
+                message: str = '😢 むし歯を放っておいたら歯を1本失ってしまった…') -> bool:
+    """ランダムに count 本の歯を失う"""
+    applied = False
+    if teeth_service.lose_random_teeth(game_state, count=count, permanent=True):
+        messages.append(('error', message))
+        applied = True
+    teeth_service.update_tooth_status_random("E", count=count)
+    _reload_teeth_json(session)
+    return applied
+
+
+@effect("lose_specific", ids=list, message=str)
+def lose_specific(game_state, session, messages, ids: Sequence[str] = (),
+                  message: str = '😢 歯を失ってしまった…') -> bool:
+    """指定した歯（"UL1" のような ID）を失う"""
+    applied = False
+    if teeth_service.lose_specific_teeth(game_state, list(ids), permanent=True):
+        messages.append(('error', message))
+        applied = True
+    teeth_data = teeth_service.load_teeth_json()
+    for tooth_id in ids:
+        section, number = tooth_id[:2], tooth_id[2:]
+        if section in teeth_data:
+            teeth_data[section][number] = "E"
+    teeth_service.save_teeth_json(teeth_data)
+    session['teeth_data'] = teeth_data
+    return applied
+
+
+@effect("prosthetics", count=int, message=str)
+def prosthetics(game_state, session, messages, count: int = 2,
+                message: str = '🦷 入れ歯でなくなった歯がもどったよ。') -> bool:
+    """なくなった歯を count 本まで入れ歯にする"""
+    applied = False
+    if teeth_service.add_prosthetics(game_state, count=count):
+        messages.append(('info', message))
+        applied = True
+    teeth_service.restore_missing_teeth(count=count)
+    _reload_teeth_json(session)
+    return applied
+
+
+@effect("checkup")
+def checkup(game_state, session, messages) -> bool:
+    """定期検診・クリーニング（むし歯を治して着色を落とす）"""
+    repaired = teeth_service.repair_damaged_teeth(game_state)
+    cleaned = teeth_service.whiten_teeth(game_state)
+    if repaired or cleaned:
+        messages.append(('success', '🪥 定期検診で歯がきれいになったよ！'))
+    else:
+        messages.append(('info', '🪥 お口をきれいにしてもらったよ！'))
+    teeth_service.restore_damaged_teeth()
+    teeth_service.restore_stained_teeth()
+    _reload_teeth_json(session)
+    return True
@@ -0,0 +1,117 @@
+"""
+ボードデータ（data/board_*.json）の読み込み
+
+各ボードファイルはプロセスで一度だけ読み込んで解析し、全セッションで共有する。
+ファイルの mtime とサイズが変わったときだけ読み直すので、ボードを差し替えても再起動は要らない。
+マスは読み込み時にスキーマで検証した、変更できない Cell（board_schema）になる。
+移動ルールの表（board_routing.RoutingIndex）も読み込み時に作る。
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from services.board_routing import RoutingIndex
+from services.board_schema import Cell, compile_cells
+
+
+class Board:
+    """読み込み済みのボード（マスの並び）"""
+
+    __slots__ = ("path", "cells", "routing", "_by_id")
+
+    def __init__(self, path: str, cells: Tuple[Cell, ...]):
+        self.path = path
+        self.cells = cells
+        # マス番号（cell）→ マス
+        self._by_id: Dict[Any, Cell] = {cell.cell: cell for cell in cells}
+        self.routing = RoutingIndex(cells)
+
+    @classmethod
+    def from_json(cls, path: str, data: Any) -> "Board":
+        """JSON のマスの配列から作る（スキーマに合わなければ BoardSchemaError）"""
+        return cls(path, compile_cells(path, data))
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def __getitem__(self, position):
+        return self.cells[position]
+
+    def __iter__(self) -> Iterator[Cell]:
+        return iter(self.cells)
+
+    def __bool__(self) -> bool:
+        return bool(self.cells)
+
+    @property
+    def max_position(self) -> int:
+        """ゴールの位置（最後のマスの添字）"""
+        return max(len(self.cells) - 1, 0)
+
+    def cell_at(self, position: int) -> Optional[Cell]:
+        """位置のマス（範囲外なら None）"""
+        if 0 <= position < len(self.cells):
+            return self.cells[position]
+        return None
+
+    def cell_by_id(self, cell_id) -> Optional[Cell]:
+        """マス番号（cell）のマス"""
+        return self._by_id.get(cell_id)
+
+
+class _Cached(NamedTuple):
+    mtime_ns: int
+    size: int
+    board: Board
+
+
+class BoardRepository:
+    """ボードファイルごとに解析済みの Board を持つ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards: Dict[str, _Cached] = {}
+
+    def get(self, path: str) -> Board:
+        """path のボード（前回読んだときから mtime・サイズが変わっていなければ読み直さない）
+
+        ファイルが無い・JSON として読めない・スキーマに合わない場合は
+        FileNotFoundError / json.JSONDecodeError / BoardSchemaError（後の2つは ValueError の派生）。
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        cached = self._boards.get(key)
+        if cached is not None and (cached.mtime_ns, cached.size) == (stat.st_mtime_ns, stat.st_size):
+            return cached.board
+
+        with self._lock:
+            cached = self._boards.get(key)
+            if cached is not None and (cached.mtime_ns, cached.size) == (stat.st_mtime_ns, stat.st_size):
+                return cached.board
+            with open(key, 'r', encoding='utf-8') as f:
+                board = Board.from_json(path, json.load(f))
+            self._boards[key] = _Cached(stat.st_mtime_ns, stat.st_size, board)
+            return board
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """path（省略時はすべて）の解析結果を捨てる"""
+        with self._lock:
+            if path is None:
+                self._boards.clear()
+            else:
+                self._boards.pop(os.path.abspath(path), None)
+
+
+# グローバルインスタンス
+_repository = BoardRepository()
+
+
+def get_board_repository() -> BoardRepository:
+    """ボードリポジトリを取得"""
+    return _repository
+
+
+def load_board(path: str) -> Board:
+    """path のボードを共有のリポジトリから取得"""
+    return _repository.get(path)
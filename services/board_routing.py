@@ -0,0 +1,116 @@
+"""
+ボードの移動ルール（ルーティング表）
+
+ボードを読み込んだときに一度だけ、位置ごとの次の強制停止マス・分岐ルートの区間・
+ゴールまでの距離・ルーレットで出してよい数（1〜MAX_SPIN）を表にしておく。
+ルーレットの「出せる数」や移動の確認は、毎回ボードを走査せずに表を引くだけで済む。
+"""
+from typing import Mapping, Optional, Sequence, Tuple
+
+MAX_SPIN = 3
+
+# 止まらなければならないマスのタイトル
+REQUIRED_STOP_TITLES = frozenset({"虫歯クイズ", "歯周病クイズ", "お仕事体験"})
+# 分岐ルート（同じタイプのマスにしか進めない）
+BRANCH_TYPES = frozenset({"branch_fail", "branch_pass"})
+
+
+def is_forced_stop(cell: Mapping) -> bool:
+    """通り過ぎずに止まらなければならないマスか"""
+    return (
+        cell.get('type') == 'stop'
+        or bool(cell.get('must_stop'))
+        or bool(cell.get('force_stop'))
+        or cell.get('title') in REQUIRED_STOP_TITLES
+    )
+
+
+class RoutingIndex:
+    """位置ごとの移動ルールの表
+
+    next_stop[p]      p より先で最初の強制停止マスの位置（無ければ None）
+    segment_id[p]     p が分岐ルートなら区間の番号（ルートでなければ None）
+    segment_end[p]    p を含む分岐ルートの区間の最後の位置（ルートでなければ None）
+    distance[p]       ゴールまでのマス数
+    allowed[p]        p から出してよい数（昇順）
+    """
+
+    __slots__ = ("max_position", "next_stop", "segment_id", "segment_end", "distance", "allowed")
+
+    def __init__(self, cells: Sequence[Mapping], max_spin: int = MAX_SPIN):
+        size = len(cells)
+        self.max_position = max(size - 1, 0)
+        types = [cell.get('type', 'normal') if isinstance(cell, Mapping) else None for cell in cells]
+
+        next_stop = [None] * size
+        upcoming = None
+        for position in range(size - 1, -1, -1):
+            next_stop[position] = upcoming
+            cell = cells[position]
+            if isinstance(cell, Mapping) and is_forced_stop(cell):
+                upcoming = position
+
+        segment_id = [None] * size
+        segment_end = [None] * size
+        segment = -1
+        for position, cell_type in enumerate(types):
+            if cell_type not in BRANCH_TYPES:
+                continue
+            if position == 0 or types[position - 1] != cell_type:
+                segment += 1
+            segment_id[position] = segment
+        for position in range(size - 1, -1, -1):
+            if segment_id[position] is None:
+                continue
+            following = position + 1
+            if following < size and segment_id[following] == segment_id[position]:
+                segment_end[position] = segment_end[following]
+            else:
+                segment_end[position] = position
+
+        distance = [self.max_position - position for position in range(size)]
+
+        allowed = []
+        for position, cell_type in enumerate(types):
+            reachable = min(max_spin, distance[position])
+            if cell_type is None or reachable <= 0:
+                allowed.append(())
+            elif cell_type in BRANCH_TYPES:
+                # 分岐ルートでは同じタイプのマスにしか進めない
+                allowed.append(tuple(
+                    offset for offset in range(1, reachable + 1)
+                    if types[position + offset] == cell_type
+                ))
+            else:
+                stop = next_stop[position]
+                limit = reachable if stop is None else min(reachable, stop - position)
+                allowed.append(tuple(range(1, limit + 1)))
+
+        self.next_stop: Tuple[Optional[int], ...] = tuple(next_stop)
+        self.segment_id: Tuple[Optional[int], ...] = tuple(segment_id)
+        self.segment_end: Tuple[Optional[int], ...] = tuple(segment_end)
+        self.distance: Tuple[int, ...] = tuple(distance)
+        self.allowed: Tuple[Tuple[int, ...], ...] = tuple(allowed)
+
+    def __len__(self) -> int:
+        return len(self.allowed)
+
+    def allowed_moves(self, position: int) -> Tuple[int, ...]:
+        """position から出してよい数（範囲外なら空）"""
+        if 0 <= position < len(self.allowed):
+            return self.allowed[position]
+        return ()
+
+    def is_allowed(self, position: int, spin: int) -> bool:
+        """position で spin が出たとき、そのまま進んでよいか"""
+        return spin in self.allowed_moves(position)
+
+    def distance_to_goal(self, position: int) -> int:
+        return max(0, self.max_position - position)
+
+    def next_stop_distance(self, position: int) -> Optional[int]:
+        """次の強制停止マスまでのマス数（分岐ルート上・停止マスが無い場合は None）"""
+        if not 0 <= position < len(self.next_stop) or self.segment_id[position] is not None:
+            return None
+        stop = self.next_stop[position]
+        return None if stop is None else stop - position
@@ -0,0 +1,212 @@
+"""
+ボードのマス定義（スキーマ）と検証
+
+board_*.json の各マスをスキーマで検証し、変更できない Cell（__slots__）にする。
+マスのタイプとアクションは列挙型（CellType / CellAction）になる。
+項目名の誤り・型の誤り・存在しないマスへの参照などは、読み込み時にまとめて
+BoardSchemaError（すべての誤りの一覧を持つ）として報告する。
+
+Cell は読み取り専用の Mapping としても使えるので、cell.get('type') のような
+既存の書き方はそのまま動く（Mapping として読んだ値は JSON と同じ。effects だけは
+変換済みの呼び出し可能オブジェクトの tuple）。
+"""
+from collections.abc import Mapping
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Tuple
+
+from services.board_effects import compile_effects
+
+
+class CellType(str, Enum):
+    START = "start"
+    NORMAL = "normal"
+    EVENT = "event"
+    STOP = "stop"
+    QUIZ = "quiz"
+    BRANCH_FAIL = "branch_fail"
+    BRANCH_PASS = "branch_pass"
+    GOAL = "goal"
+
+
+class CellAction(str, Enum):
+    DRINK_WATER = "drink_water"
+    FIRST_WORDS = "first_words"
+    JUMP = "jump"
+    JUMP_EXERCISE = "jump_exercise"
+    OUTDOOR_PLAY = "outdoor_play"
+    SMILE = "smile"
+    FLOSS = "floss"
+    BITE_CHECK = "bite_check"
+    TOOTH_LOSS = "tooth_loss"
+    DICE_TOOTH_LOSS = "dice_tooth_loss"
+    SELF_INTRODUCTION = "self_introduction"
+    JOB_EXPERIENCE = "job_experience"
+
+
+QUIZ_TYPES = frozenset({"caries", "perio"})
+
+# 項目名 → (型, 必須か)
+FIELDS: Dict[str, Tuple[type, bool]] = {
+    "cell": (int, True),
+    "type": (str, True),
+    "title": (str, True),
+    "display_label": (str, True),
+    "desc": (str, False),
+    "image": (str, False),
+    "caption": (str, False),
+    "audio_id": (str, False),
+    "action": (str, False),
+    "quiz_type": (str, False),
+    "next_action": (str, False),
+    "route": (str, False),
+    "checkup_target": (str, False),
+    "coupon_url": (str, False),
+    "tooth_delta": (int, False),
+    "teeth_delta": (int, False),
+    "initial_teeth": (int, False),
+    "initial_tooth": (int, False),
+    "force_stop": (bool, False),
+    "must_stop": (bool, False),
+    "next_cell": (int, False),
+    "branch_fail": (int, False),
+    "branch_pass": (int, False),
+    "effects": (list, False),
+}
+# 他のマス番号を指す項目
+REFERENCE_FIELDS = ("next_cell", "branch_fail", "branch_pass")
+
+_MISSING = object()
+
+
+class BoardSchemaError(ValueError):
+    """ボードがスキーマに合わない（errors にすべての誤り）"""
+
+    def __init__(self, path: str, errors: List[str]):
+        self.path = path
+        self.errors = errors
+        super().__init__(f"{path}: ボードに {len(errors)} 件の誤りがあります\n" + "\n".join(errors))
+
+
+class Cell(Mapping):
+    """1マス（変更できない）
+
+    項目は属性として読める（無い項目は None）。type は CellType、action は CellAction、
+    effects は止まったときの歯の変化（board_effects.compile_effects の結果）。
+    """
+
+    __slots__ = tuple(FIELDS) + ("_keys",)
+
+    def __init__(self, **values: Any):
+        for name in FIELDS:
+            object.__setattr__(self, name, values.get(name))
+        object.__setattr__(self, "_keys", tuple(name for name in FIELDS if name in values))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Cell は変更できません")
+
+    def __delattr__(self, name):
+        raise AttributeError("Cell は変更できません")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._keys:
+            raise KeyError(key)
+        value = getattr(self, key)
+        return value.value if isinstance(value, Enum) else value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self._keys:
+            return default
+        value = getattr(self, key)
+        return value.value if isinstance(value, Enum) else value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __repr__(self) -> str:
+        return f"Cell({dict(self)!r})"
+
+
+def _check_value(name: str, value: Any, errors: List[str], where: str) -> Any:
+    """項目の値を検証し、列挙型の項目は変換して返す"""
+    expected, _ = FIELDS[name]
+    # bool は int の派生なので、数値の項目に true/false が入っているのも誤り
+    if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+        errors.append(f"{where}: {name} は {expected.__name__} である必要があります（{value!r}）")
+        return _MISSING
+    if name == "type":
+        try:
+            return CellType(value)
+        except ValueError:
+            errors.append(f"{where}: 不明な type {value!r}")
+            return _MISSING
+    if name == "action":
+        if value == "":
+            return _MISSING
+        try:
+            return CellAction(value)
+        except ValueError:
+            errors.append(f"{where}: 不明な action {value!r}")
+            return _MISSING
+    if name == "effects":
+        effects, effect_errors = compile_effects(value)
+        errors.extend(f"{where}: {error}" for error in effect_errors)
+        return _MISSING if effect_errors else effects
+    if name == "quiz_type" and value not in QUIZ_TYPES:
+        errors.append(f"{where}: 不明な quiz_type {value!r}")
+        return _MISSING
+    return value
+
+
+def validate_cells(data: Any) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """マスの配列を検証し、(変換済みの項目のリスト, 誤りのリスト) を返す"""
+    if not isinstance(data, list):
+        return [], ["ボードはマスの配列である必要があります"]
+
+    errors: List[str] = []
+    rows: List[Dict[str, Any]] = []
+    for position, raw in enumerate(data):
+        where = f"[{position}]"
+        if not isinstance(raw, dict):
+            errors.append(f"{where}: マスはオブジェクトである必要があります")
+            rows.append({})
+            continue
+        row: Dict[str, Any] = {}
+        for name, value in raw.items():
+            if name not in FIELDS:
+                errors.append(f"{where}: 不明な項目 {name!r}")
+                continue
+            value = _check_value(name, value, errors, where)
+            if value is not _MISSING:
+                row[name] = value
+        for name, (_, required) in FIELDS.items():
+            if required and name not in raw:
+                errors.append(f"{where}: 必須の項目 {name!r} がありません")
+        rows.append(row)
+
+    ids = [row.get("cell") for row in rows]
+    seen = set()
+    for position, cell_id in enumerate(ids):
+        if cell_id is None:
+            continue
+        if cell_id in seen:
+            errors.append(f"[{position}]: cell {cell_id} が重複しています")
+        seen.add(cell_id)
+    for position, row in enumerate(rows):
+        for name in REFERENCE_FIELDS:
+            target = row.get(name)
+            if isinstance(target, int) and target not in seen:
+                errors.append(f"[{position}]: {name} が存在しないマス {target} を指しています")
+
+    return rows, errors
+
+
+def compile_cells(path: str, data: Any) -> Tuple[Cell, ...]:
+    """マスの配列を検証して Cell の tuple にする（誤りがあれば BoardSchemaError）"""
+    rows, errors = validate_cells(data)
+    if errors:
+        raise BoardSchemaError(path, errors)
+    return tuple(Cell(**row) for row in rows)
+
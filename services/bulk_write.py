@@ -0,0 +1,86 @@
+"""
+Firestore へのまとめての書き込み・削除
+
+書き込み対象は page_size 件ずつのバッチにまとめ、スレッドプールで並行にコミットする。
+コミット待ちのバッチ数には上限を設けるので、件数が多くても読み込み（や組み立て）だけが
+先に進んでメモリを使い切ることはない。
+進み具合は progress(処理済み件数, 全体の件数 or None) で呼び出し元のスレッドに知らせる。
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+# Firestore のバッチは500件まで
+DEFAULT_PAGE_SIZE = 400
+DEFAULT_WORKERS = 4
+
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+def _commit(batch, size: int) -> int:
+    batch.commit()
+    return size
+
+
+def bulk_write(db, items: Iterable, apply: Callable[[Any, Any], None],
+               page_size: int = DEFAULT_PAGE_SIZE, workers: int = DEFAULT_WORKERS,
+               progress: Optional[ProgressCallback] = None, total: Optional[int] = None,
+               thread_name_prefix: str = "bulk-write") -> int:
+    """items を apply(batch, item) でバッチに積んでコミットし、処理した件数を返す
+
+    いずれかのバッチのコミットに失敗した場合は新しいバッチを出さずに例外を送出する
+    （それまでにコミットしたバッチの書き込みは残る）。
+    """
+    written = 0
+    pending: Set[Future] = set()
+
+    def collect(done: Set[Future]) -> None:
+        nonlocal written
+        for future in done:
+            written += future.result()
+        if progress is not None:
+            progress(written, total)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix) as pool:
+        try:
+            batch, size = db.batch(), 0
+            for item in items:
+                apply(batch, item)
+                size += 1
+                if size < page_size:
+                    continue
+                pending.add(pool.submit(_commit, batch, size))
+                batch, size = db.batch(), 0
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            if size:
+                pending.add(pool.submit(_commit, batch, size))
+            if pending:
+                done, pending = wait(pending)
+                collect(done)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+    return written
+
+
+def bulk_delete(db, docs: Iterable, page_size: int = DEFAULT_PAGE_SIZE,
+                workers: int = DEFAULT_WORKERS, progress: Optional[ProgressCallback] = None,
+                total: Optional[int] = None) -> int:
+    """docs（DocumentSnapshot の列）を削除し、削除した件数を返す"""
+    return bulk_write(db, docs, lambda batch, doc: batch.delete(doc.reference),
+                      page_size=page_size, workers=workers, progress=progress, total=total,
+                      thread_name_prefix="bulk-delete")
+
+
+def bulk_set(db, writes: Iterable[Tuple[Any, Dict]], page_size: int = DEFAULT_PAGE_SIZE,
+             workers: int = DEFAULT_WORKERS, progress: Optional[ProgressCallback] = None,
+             total: Optional[int] = None) -> int:
+    """writes（(DocumentReference, データ) の列）を上書きで書き、書いた件数を返す
+
+    ドキュメントIDを呼び出し側で決めておけば、同じ内容を何度書いても1件のまま。
+    """
+    return bulk_write(db, writes, lambda batch, write: batch.set(*write),
+                      page_size=page_size, workers=workers, progress=progress, total=total,
+                      thread_name_prefix="bulk-set")
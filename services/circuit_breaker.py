@@ -0,0 +1,128 @@
+"""
+サーキットブレーカー（接続先が落ちている間は呼び出しを止める）
+
+CLOSED（通常）で一定時間内に失敗が続くと OPEN になり、その間の呼び出しは
+すぐに失敗させてローカル保存先へ回す。待ち時間（指数バックオフ）が過ぎると
+HALF_OPEN にしてバックグラウンドで1回だけ疎通確認（probe）を行い、
+成功すれば CLOSED に戻し、失敗すれば待ち時間を延ばして OPEN に戻す。
+疎通確認はリクエストを処理するスレッドでは行わない。
+"""
+import random
+import threading
+import time
+from typing import Callable, List, Optional
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_FAILURE_WINDOW = 30.0
+DEFAULT_BASE_BACKOFF = 5.0
+DEFAULT_MAX_BACKOFF = 300.0
+
+
+class CircuitBreaker:
+    """接続先ごとのサーキットブレーカー"""
+
+    def __init__(self, probe: Optional[Callable[[], bool]] = None,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 failure_window: float = DEFAULT_FAILURE_WINDOW,
+                 base_backoff: float = DEFAULT_BASE_BACKOFF,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 clock: Callable[[], float] = time.monotonic,
+                 name: str = "circuit"):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.name = name
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._failures: List[float] = []
+        self._open_count = 0
+        self._retry_at = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    @property
+    def retry_at(self) -> float:
+        """次に疎通確認する時刻（clock の値、CLOSED なら 0）"""
+        with self._lock:
+            return self._retry_at if self._state != STATE_CLOSED else 0.0
+
+    def allow(self) -> bool:
+        """呼び出してよいか（OPEN の間は False。待ち時間が過ぎていれば裏で疎通確認を始める）"""
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_OPEN and self._clock() >= self._retry_at:
+                self._state = STATE_HALF_OPEN
+                start_probe = True
+            else:
+                start_probe = False
+        if start_probe:
+            self._start_probe()
+        return False
+
+    def record_success(self) -> None:
+        """成功したので CLOSED に戻す"""
+        with self._lock:
+            if self._state != STATE_CLOSED:
+                print(f"✓ {self.name} recovered")
+            self._state = STATE_CLOSED
+            self._failures = []
+            self._open_count = 0
+            self._retry_at = 0.0
+            self.last_error = None
+
+    def record_failure(self, error: object = None) -> None:
+        """失敗を記録する（failure_window 秒以内に failure_threshold 回で OPEN）"""
+        with self._lock:
+            now = self._clock()
+            if error is not None:
+                self.last_error = str(error)
+            if self._state != STATE_CLOSED:
+                # OPEN 中は疎通確認の結果だけで状態を変える
+                return
+            self._failures = [t for t in self._failures if now - t < self.failure_window]
+            self._failures.append(now)
+            if len(self._failures) >= self.failure_threshold:
+                self._trip(now)
+
+    def trip(self, error: object = None) -> None:
+        """回数に関係なくすぐに OPEN にする（設定が無いなど再試行しても直らない失敗用）"""
+        with self._lock:
+            if error is not None:
+                self.last_error = str(error)
+            self._trip(self._clock())
+
+    def _trip(self, now: float) -> None:
+        backoff = min(self.max_backoff, self.base_backoff * (2 ** self._open_count))
+        self._open_count += 1
+        self._state = STATE_OPEN
+        self._failures = []
+        self._retry_at = now + backoff * random.uniform(0.8, 1.2)
+        print(f"⚠ {self.name} circuit open for {backoff:.0f}s: {self.last_error}")
+
+    def _start_probe(self) -> None:
+        thread = threading.Thread(target=self._run_probe, name=f"{self.name}-probe", daemon=True)
+        thread.start()
+
+    def _run_probe(self) -> None:
+        try:
+            ok = bool(self.probe()) if self.probe is not None else True
+        except Exception as e:
+            ok = False
+            self.last_error = str(e)
+        if ok:
+            self.record_success()
+        else:
+            with self._lock:
+                self._trip(self._clock())
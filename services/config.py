@@ -0,0 +1,164 @@
+"""
+設定ファイル（data/settings.json・data/events.json）の読み込み
+
+各ファイルはプロセスで一度だけ読み込んで全セッションで共有する。
+変更の確認（ファイルの mtime・サイズを見る）は check_interval 秒に1回までなので、
+debug_log のように頻繁に呼ばれる箇所でも毎回ディスクを読まない。
+スタッフ画面などで書き換えた場合は invalidate() で次の読み出しから反映する
+（他のプロセスでの変更も check_interval 秒以内に反映される）。
+
+返す dict は共有しているので変更しないこと（変更する場合は pages.utils の
+load_settings / load_events_config のようにコピーを使う）。
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+SETTINGS_PATH = "data/settings.json"
+EVENTS_PATH = "data/events.json"
+# 変更を確かめる間隔（秒）
+CONFIG_CHECK_INTERVAL = 1.0
+
+DEFAULT_STAFF_PIN = "0418"
+DEFAULT_BOARD_FILE = "board_main.json"
+
+
+def default_settings() -> Dict:
+    return {"staff_pin": DEFAULT_STAFF_PIN, "debug_mode": False}
+
+
+def default_events() -> Dict:
+    return {
+        "events": [{"id": "default", "name": "デフォルト", "description": "通常設定",
+                    "board_file": DEFAULT_BOARD_FILE}],
+        "active_event": "default"
+    }
+
+
+class ConfigFile:
+    """1つの JSON 設定ファイルの、共有される解析結果"""
+
+    def __init__(self, path: str, default: Callable[[], Dict],
+                 check_interval: float = CONFIG_CHECK_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self.default = default
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data: Optional[Dict] = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+
+    def get(self) -> Dict:
+        """解析済みの内容（前回の確認から check_interval 秒以内ならファイルを見ない）
+
+        読み込めない場合は、前回読めた内容（一度も読めていなければ既定値）を返す。
+        """
+        data = self._data
+        if data is not None and self._clock() - self._checked_at < self.check_interval:
+            return data
+
+        with self._lock:
+            now = self._clock()
+            if self._data is not None and now - self._checked_at < self.check_interval:
+                return self._data
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                signature = None
+            if self._data is not None and signature == self._signature:
+                return self._data
+            self._signature = signature
+            self._data = self._load()
+            return self._data
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("JSON object expected")
+            return data
+        except Exception as e:
+            print(f"Error loading {self.path}: {e}")
+            return self._data if self._data is not None else self.default()
+
+    def invalidate(self) -> None:
+        """次の get() でファイルを読み直す"""
+        with self._lock:
+            self._data = None
+            self._signature = None
+
+
+class ConfigService:
+    """settings.json・events.json の値を読む"""
+
+    def __init__(self, settings_path: str = SETTINGS_PATH, events_path: str = EVENTS_PATH,
+                 check_interval: float = CONFIG_CHECK_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self.settings_file = ConfigFile(settings_path, default_settings, check_interval, clock)
+        self.events_file = ConfigFile(events_path, default_events, check_interval, clock)
+
+    def invalidate(self) -> None:
+        self.settings_file.invalidate()
+        self.events_file.invalidate()
+
+    # ------------------------------------------------------------------
+    # settings.json
+    # ------------------------------------------------------------------
+    @property
+    def settings(self) -> Dict:
+        return self.settings_file.get()
+
+    @property
+    def debug_mode(self) -> bool:
+        return bool(self.settings.get("debug_mode", False))
+
+    @property
+    def staff_pin(self) -> str:
+        return str(self.settings.get("staff_pin", DEFAULT_STAFF_PIN))
+
+    @property
+    def game(self) -> Dict:
+        """game セクション（タイマー・報酬・初期値）"""
+        return self.settings.get("game", {})
+
+    # ------------------------------------------------------------------
+    # events.json
+    # ------------------------------------------------------------------
+    @property
+    def events_config(self) -> Dict:
+        return self.events_file.get()
+
+    @property
+    def events(self) -> List[Dict]:
+        return self.events_config.get("events", [])
+
+    @property
+    def active_event_id(self) -> str:
+        return self.events_config.get("active_event", "default")
+
+    @property
+    def active_event(self) -> Optional[Dict]:
+        active_event_id = self.active_event_id
+        return next((event for event in self.events if event.get("id") == active_event_id), None)
+
+    @property
+    def board_file(self) -> str:
+        """アクティブイベントのボードファイルのパス"""
+        event = self.active_event
+        if not event:
+            return f"data/{DEFAULT_BOARD_FILE}"
+        return f"data/{event.get('board_file', DEFAULT_BOARD_FILE)}"
+
+
+# グローバルインスタンス
+_config_service = ConfigService()
+
+
+def get_config_service() -> ConfigService:
+    """設定サービスを取得"""
+    return _config_service
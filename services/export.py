@@ -0,0 +1,145 @@
+"""
+体験ログ・スコアの書き出し（CSV / JSON Lines）
+
+保存先から1件ずつ読み、絞り込みと整形をしながら少しずつ文字列を返すので、
+件数が増えてもメモリ使用量は一定。画面からのダウンロード用には
+一時ファイルに書き出してから渡す（全体を文字列として組み立てない）。
+"""
+import codecs
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime
+from typing import IO, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+from services.rank_index import DEFAULT_EVENT_ID
+
+EXPORT_SESSIONS = "sessions"
+EXPORT_SCORES = "scores"
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+
+# CSVの列（この順で出力し、それ以外の項目は出力しない）
+SESSION_FIELDS = (
+    "timestamp", "session_id", "event_id", "participant_name", "participant_age",
+    "age_group", "board", "teeth_count", "tooth_coins", "turn_count", "play_time",
+    "start_time", "reached_goal", "caries_correct", "perio_correct", "final_position",
+)
+SCORE_FIELDS = (
+    "timestamp", "entry_id", "event_id", "player_name", "participant_age", "age_group",
+    "teeth_count", "tooth_coins", "score", "play_time",
+)
+EXPORT_FIELDS = {EXPORT_SESSIONS: SESSION_FIELDS, EXPORT_SCORES: SCORE_FIELDS}
+
+# Excel で文字化けしないよう CSV は BOM 付き UTF-8
+EXPORT_ENCODINGS = {FORMAT_CSV: "utf-8-sig", FORMAT_JSONL: "utf-8"}
+MIME_TYPES = {FORMAT_CSV: "text/csv", FORMAT_JSONL: "application/jsonl"}
+
+# 何行ずつまとめて文字列にするか
+CHUNK_ROWS = 500
+
+
+class ExportFilter(NamedTuple):
+    """書き出す範囲（None はすべて）"""
+    start_day: Optional[str] = None  # YYYY-MM-DD（この日を含む）
+    end_day: Optional[str] = None    # YYYY-MM-DD（この日を含む）
+    event_id: Optional[str] = None
+    age_group: Optional[str] = None
+
+    def matches(self, record: Dict) -> bool:
+        day = str(record.get("timestamp") or "")[:10]
+        if self.start_day is not None and day < self.start_day:
+            return False
+        if self.end_day is not None and day > self.end_day:
+            return False
+        if self.event_id is not None and (record.get("event_id") or DEFAULT_EVENT_ID) != self.event_id:
+            return False
+        if self.age_group is not None and (record.get("age_group") or "") != self.age_group:
+            return False
+        return True
+
+
+def iter_csv(records: Iterable[Dict], fields: Sequence[str]) -> Iterator[str]:
+    """ヘッダー行に続けて CHUNK_ROWS 行ずつ CSV 文字列を返す"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    rows = 0
+    for record in records:
+        writer.writerow(record)
+        rows += 1
+        if rows % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl(records: Iterable[Dict]) -> Iterator[str]:
+    """CHUNK_ROWS 行ずつ JSON Lines 文字列を返す"""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        if len(lines) >= CHUNK_ROWS:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def iter_export(records: Iterable[Dict], kind: str, fmt: str,
+                filters: ExportFilter = ExportFilter()) -> Iterator[str]:
+    """絞り込んだレコードを指定形式の文字列として少しずつ返す"""
+    if kind not in EXPORT_FIELDS:
+        raise ValueError(f"Unknown export kind: {kind}")
+    matched = (record for record in records if filters.matches(record))
+    if fmt == FORMAT_CSV:
+        return iter_csv(matched, EXPORT_FIELDS[kind])
+    if fmt == FORMAT_JSONL:
+        return iter_jsonl(matched)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def iter_source(kind: str, backend=None) -> Iterator[Dict]:
+    """保存先（省略時は現在の保存先）から体験ログまたはスコアを1件ずつ読む"""
+    if backend is None:
+        from services.store import flush_pending_writes, get_storage_backend
+        # 保存待ちの書き込みも含めて書き出す
+        flush_pending_writes()
+        backend = get_storage_backend()
+    if kind == EXPORT_SESSIONS:
+        return backend.iter_sessions()
+    if kind == EXPORT_SCORES:
+        return backend.iter_scores()
+    raise ValueError(f"Unknown export kind: {kind}")
+
+
+def spool_export(kind: str, fmt: str, filters: ExportFilter = ExportFilter(),
+                 backend=None) -> IO[bytes]:
+    """書き出した内容を一時ファイルに書き、先頭に戻して返す（閉じると削除される）
+
+    st.download_button がそのまま受け取れるよう、バッファなしの io.FileIO を返す。
+    """
+    encoder = codecs.getincrementalencoder(EXPORT_ENCODINGS[fmt])()
+    spool = tempfile.TemporaryFile(buffering=0)
+    try:
+        for chunk in iter_export(iter_source(kind, backend), kind, fmt, filters):
+            _write_all(spool, encoder.encode(chunk))
+        _write_all(spool, encoder.encode("", final=True))
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _write_all(raw: IO[bytes], data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[raw.write(view):]
+
+
+def export_filename(kind: str, fmt: str, now: Optional[datetime] = None) -> str:
+    """ダウンロード時のファイル名（例: sessions_20250131-1830.csv）"""
+    return f"{kind}_{(now or datetime.now()).strftime('%Y%m%d-%H%M')}.{fmt}"
@@ -0,0 +1,609 @@
+"""
+プロセス内で動く Firestore の代わり（テスト・ベンチマーク用）
+
+services/firebase.py が使う範囲（コレクション・ドキュメントの読み書き、
+where / order_by / limit / start_after / select / count のクエリ、on_snapshot の購読、
+バッチ、トランザクション、collection_group、Increment / SERVER_TIMESTAMP）だけを実装する。
+このモジュール自体を firestore モジュールの代わりとして FirebaseService に渡す。
+
+    from services import fake_firestore
+    client = fake_firestore.FakeFirestoreClient(latency=0.02, failure_rate=0.1)
+    service = FirebaseService(client=client, firestore_module=fake_firestore)
+
+latency / jitter で1回の通信ごとの遅延を、failure_rate・fail_next()・offline で
+ServiceUnavailable の発生を指定できる。トランザクションは読んだドキュメントが
+コミットまでに書き換えられていれば Aborted にして最初からやり直す（本物と同じ楽観的排他）。
+"""
+import copy
+import functools
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# トランザクションをやり直す最大回数（本物の既定値と同じ）
+MAX_TRANSACTION_ATTEMPTS = 5
+# バッチ1回で書ける件数の上限
+MAX_BATCH_WRITES = 500
+
+
+class ServiceUnavailable(Exception):
+    """注入した通信エラー（google.api_core.exceptions.ServiceUnavailable と同じ名前）"""
+
+
+class Aborted(Exception):
+    """トランザクションの競合（やり直しても解消しなかった場合に送出）"""
+
+
+class ReadAfterWriteError(ValueError):
+    """トランザクションで書き込みの後に読み込んだ"""
+
+
+class _ServerTimestamp:
+    def __repr__(self) -> str:
+        return "SERVER_TIMESTAMP"
+
+
+SERVER_TIMESTAMP = _ServerTimestamp()
+
+
+class Increment:
+    """サーバー側での加算"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _apply_transforms(data: Dict, current: Optional[Dict]) -> Dict:
+    """SERVER_TIMESTAMP / Increment を実際の値に置き換える"""
+    result = {}
+    for key, value in data.items():
+        if value is SERVER_TIMESTAMP:
+            value = datetime.now(timezone.utc)
+        elif isinstance(value, Increment):
+            base = (current or {}).get(key)
+            value = (base if isinstance(base, (int, float)) and not isinstance(base, bool) else 0) + value.value
+        elif isinstance(value, dict):
+            nested = (current or {}).get(key)
+            value = _apply_transforms(value, nested if isinstance(nested, dict) else None)
+        else:
+            value = copy.deepcopy(value)
+        result[key] = value
+    return result
+
+
+def _merge(current: Dict, data: Dict) -> Dict:
+    """merge=True の set（入れ子の辞書も項目ごとに上書き）"""
+    merged = dict(current)
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+# 値の種類ごとの並び順（Firestore と同じく null < 真偽値 < 数値 < 日時 < 文字列）
+def _type_rank(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    return 5
+
+
+def _compare(a, b) -> int:
+    ra, rb = _type_rank(a), _type_rank(b)
+    if ra != rb:
+        return -1 if ra < rb else 1
+    if ra == 5:
+        a, b = repr(a), repr(b)
+    return (a > b) - (a < b)
+
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) == 0,
+    "!=": lambda a, b: not (_type_rank(a) == _type_rank(b) and _compare(a, b) == 0),
+    "<": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) < 0,
+    "<=": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) <= 0,
+    ">": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) > 0,
+    ">=": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) >= 0,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+_MISSING = object()
+
+
+def _field(data: Dict, field_path: str):
+    """ドット区切りの項目を取り出す（無ければ _MISSING）"""
+    value: Any = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+# ----------------------------------------------------------------------
+# 読み込み結果
+# ----------------------------------------------------------------------
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", data: Optional[Dict]):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        value = _field(self._data or {}, field_path)
+        return None if value is _MISSING else copy.deepcopy(value)
+
+
+class AggregationResult:
+    def __init__(self, alias: str, value: int):
+        self.alias = alias
+        self.value = value
+
+
+class AggregationQuery:
+    def __init__(self, query: "Query", alias: str):
+        self._query = query
+        self._alias = alias
+
+    def get(self, transaction=None) -> List[List[AggregationResult]]:
+        client = self._query._client
+        client._rpc("count")
+        return [[AggregationResult(self._alias, len(self._query._matching()))]]
+
+
+# ----------------------------------------------------------------------
+# クエリ・参照
+# ----------------------------------------------------------------------
+class Query:
+    """where / order_by / limit / start_after / select を重ねたクエリ"""
+
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, client: "FakeFirestoreClient", parent_path: str, all_descendants: bool = False,
+                 filters: Tuple = (), orders: Tuple = (), limit: Optional[int] = None,
+                 cursor: Optional[Tuple] = None, fields: Optional[Tuple[str, ...]] = None):
+        self._client = client
+        self._parent_path = parent_path
+        self._all_descendants = all_descendants
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes) -> "Query":
+        values = dict(
+            filters=self._filters, orders=self._orders, limit=self._limit,
+            cursor=self._cursor, fields=self._fields,
+        )
+        values.update(changes)
+        return Query(self._client, self._parent_path, self._all_descendants, **values)
+
+    def where(self, field_path: str, op_string: str, value) -> "Query":
+        if op_string not in _OPERATORS:
+            raise ValueError(f"Unsupported operator: {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "Query":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields) -> "Query":
+        """直前のページの最後のドキュメント（スナップショット）の次から読む"""
+        if isinstance(document_fields, DocumentSnapshot):
+            path = document_fields.reference.path
+            data = document_fields._data or {}
+        else:
+            path, data = None, document_fields
+        values = tuple(path if field == "__name__" else _field(data, field) for field, _ in self._orders)
+        return self._copy(cursor=(values, path))
+
+    def select(self, field_paths) -> "Query":
+        return self._copy(fields=tuple(field_paths))
+
+    def count(self, alias: str = "count") -> AggregationQuery:
+        return AggregationQuery(self, alias)
+
+    def _in_scope(self, path: str) -> bool:
+        parts = path.split("/")
+        if self._all_descendants:
+            return parts[-2] == self._parent_path
+        return "/".join(parts[:-1]) == self._parent_path
+
+    def _sort_key(self, path: str, data: Dict):
+        keys = []
+        for field, direction in self._orders:
+            keys.append((path if field == "__name__" else _field(data, field), direction))
+        if not any(field == "__name__" for field, _ in self._orders):
+            keys.append((path, self._orders[-1][1] if self._orders else self.ASCENDING))
+        return keys
+
+    @staticmethod
+    def _compare_keys(a, b) -> int:
+        for (va, direction), (vb, _) in zip(a, b):
+            result = _compare(va, vb)
+            if result:
+                return -result if direction == Query.DESCENDING else result
+        return 0
+
+    def _matching(self) -> List[Tuple[str, Dict]]:
+        with self._client._lock:
+            docs = [(path, data) for path, data in self._client._docs.items() if self._in_scope(path)]
+        matched = []
+        for path, data in docs:
+            if all(self._matches_filter(data, f) for f in self._filters) and \
+                    all(field == "__name__" or _field(data, field) is not _MISSING for field, _ in self._orders):
+                matched.append((path, data))
+        matched.sort(key=functools.cmp_to_key(
+            lambda a, b: self._compare_keys(self._sort_key(*a), self._sort_key(*b))
+        ))
+        if self._cursor is not None:
+            values, cursor_path = self._cursor
+            cursor_key = [(value, direction) for value, (_, direction) in zip(values, self._orders)]
+            if not any(field == "__name__" for field, _ in self._orders):
+                cursor_key.append((cursor_path, self._orders[-1][1] if self._orders else self.ASCENDING))
+            matched = [doc for doc in matched if self._compare_keys(self._sort_key(*doc), cursor_key) > 0]
+        if self._limit is not None:
+            matched = matched[:self._limit]
+        return matched
+
+    @staticmethod
+    def _matches_filter(data: Dict, condition) -> bool:
+        field, op, value = condition
+        actual = _field(data, field)
+        if actual is _MISSING:
+            return False
+        return _OPERATORS[op](actual, value)
+
+    def stream(self, transaction=None) -> Iterator[DocumentSnapshot]:
+        self._client._rpc("query")
+        results = self._matching()
+        self._client._count_reads(max(len(results), 1))
+        for path, data in results:
+            if self._fields is not None:
+                data = {field: _field(data, field) for field in self._fields
+                        if _field(data, field) is not _MISSING}
+            yield DocumentSnapshot(self._client.document(path), copy.deepcopy(data))
+
+    def get(self, transaction=None) -> List[DocumentSnapshot]:
+        return list(self.stream(transaction))
+
+    def on_snapshot(self, callback: Callable) -> "Watch":
+        """結果が変わるたびに callback(全件のスナップショット, 変更, 読み取り時刻) を呼ぶ"""
+        self._client._rpc("listen")
+        return self._client._add_watch(Watch(self, callback))
+
+
+class CollectionReference(Query):
+    def __init__(self, client: "FakeFirestoreClient", path: str):
+        super().__init__(client, path)
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.split("/")[-1]
+
+    def document(self, document_id: Optional[str] = None) -> "DocumentReference":
+        return DocumentReference(self._client, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, document_data: Dict, document_id: Optional[str] = None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return datetime.now(timezone.utc), ref
+
+
+class DocumentReference:
+    def __init__(self, client: "FakeFirestoreClient", path: str):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.split("/")[-1]
+
+    @property
+    def parent(self) -> CollectionReference:
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, collection_id: str) -> CollectionReference:
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction: Optional["Transaction"] = None) -> DocumentSnapshot:
+        if transaction is not None:
+            return transaction._read(self)
+        self._client._rpc("get")
+        self._client._count_reads(1)
+        return DocumentSnapshot(self, self._client._read_doc(self.path)[0])
+
+    def set(self, document_data: Dict, merge: bool = False) -> None:
+        self._client._rpc("set")
+        self._client._commit_writes([("set", self.path, document_data, merge)])
+
+    def update(self, field_updates: Dict) -> None:
+        self._client._rpc("update")
+        self._client._commit_writes([("update", self.path, field_updates, True)])
+
+    def delete(self) -> None:
+        self._client._rpc("delete")
+        self._client._commit_writes([("delete", self.path, None, False)])
+
+
+# ----------------------------------------------------------------------
+# 購読（on_snapshot）
+# ----------------------------------------------------------------------
+class Watch:
+    """on_snapshot の購読（本物の Watch と同じく is_active / unsubscribe を持つ）
+
+    最初に全件を届け、以降は対象のドキュメントが書き換えられるたびに別スレッドから
+    callback を呼ぶ。client.offline になると接続が切れたものとして購読を終える
+    （本物と同じく callback にはエラーを知らせないので、呼び出し側は is_active で確かめる）。
+    """
+
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, query: Query, callback: Callable):
+        self._query = query
+        self._callback = callback
+        self._changed = threading.Event()
+        self._changed.set()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="fake-firestore-watch", daemon=True)
+
+    @property
+    def is_active(self) -> bool:
+        return not self._closed.is_set()
+
+    def unsubscribe(self) -> None:
+        self._closed.set()
+        self._changed.set()
+        self._query._client._remove_watch(self)
+
+    close = unsubscribe
+
+    def _notify(self, path: str) -> None:
+        if self._query._in_scope(path):
+            self._changed.set()
+
+    def _run(self) -> None:
+        client = self._query._client
+        while not self._closed.is_set():
+            changed = self._changed.wait(self.POLL_INTERVAL)
+            if self._closed.is_set():
+                return
+            if client.offline:
+                self.unsubscribe()
+                return
+            if not changed:
+                continue
+            self._changed.clear()
+            docs = [DocumentSnapshot(client.document(path), copy.deepcopy(data))
+                    for path, data in self._query._matching()]
+            client._count_reads(max(len(docs), 1))
+            try:
+                self._callback(docs, [], datetime.now(timezone.utc))
+            except Exception as e:
+                print(f"Fake Firestore watch callback error: {e}")
+
+
+# ----------------------------------------------------------------------
+# バッチ・トランザクション
+# ----------------------------------------------------------------------
+class WriteBatch:
+    def __init__(self, client: "FakeFirestoreClient"):
+        self._client = client
+        self._writes: List[Tuple] = []
+
+    def _add(self, write: Tuple) -> None:
+        if len(self._writes) >= MAX_BATCH_WRITES:
+            raise ValueError(f"A batch can contain at most {MAX_BATCH_WRITES} writes")
+        self._writes.append(write)
+
+    def set(self, reference: DocumentReference, document_data: Dict, merge: bool = False) -> None:
+        self._add(("set", reference.path, document_data, merge))
+
+    def update(self, reference: DocumentReference, field_updates: Dict) -> None:
+        self._add(("update", reference.path, field_updates, True))
+
+    def delete(self, reference: DocumentReference) -> None:
+        self._add(("delete", reference.path, None, False))
+
+    def commit(self) -> List:
+        self._client._rpc("commit")
+        writes, self._writes = self._writes, []
+        self._client._commit_writes(writes)
+        return writes
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+
+class Transaction(WriteBatch):
+    """読んだドキュメントの版を覚えておき、コミット時に変わっていれば Aborted"""
+
+    def __init__(self, client: "FakeFirestoreClient"):
+        super().__init__(client)
+        self._read_versions: Dict[str, int] = {}
+
+    def _begin(self) -> None:
+        self._writes = []
+        self._read_versions = {}
+
+    def _read(self, reference: DocumentReference) -> DocumentSnapshot:
+        if self._writes:
+            raise ReadAfterWriteError("Attempted read after write in a transaction")
+        self._client._rpc("get")
+        self._client._count_reads(1)
+        data, version = self._client._read_doc(reference.path)
+        self._read_versions.setdefault(reference.path, version)
+        return DocumentSnapshot(reference, data)
+
+    def _commit(self) -> None:
+        self._client._rpc("commit")
+        writes, self._writes = self._writes, []
+        self._client._commit_writes(writes, expected_versions=self._read_versions)
+
+
+def transactional(func: Callable) -> Callable:
+    """func(transaction, ...) を競合時にやり直しながら実行する"""
+
+    @functools.wraps(func)
+    def wrapper(transaction: Transaction, *args, **kwargs):
+        for _ in range(MAX_TRANSACTION_ATTEMPTS):
+            transaction._begin()
+            result = func(transaction, *args, **kwargs)
+            try:
+                transaction._commit()
+                return result
+            except Aborted:
+                transaction._client._count("aborted")
+        raise Aborted(f"Transaction failed after {MAX_TRANSACTION_ATTEMPTS} attempts")
+
+    return wrapper
+
+
+# ----------------------------------------------------------------------
+# クライアント
+# ----------------------------------------------------------------------
+class FakeFirestoreClient:
+    """メモリ上にドキュメントを持つ Firestore クライアント"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.offline = False
+        self._rng = random.Random(seed)
+        self._fail_next = 0
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Dict] = {}
+        self._versions: Dict[str, int] = {}
+        self._watches: List[Watch] = []
+        self.stats: Dict[str, int] = {"rpcs": 0, "reads": 0, "writes": 0, "aborted": 0, "failures": 0}
+
+    # ------------------------------------------------------------------
+    # 障害・遅延の注入
+    # ------------------------------------------------------------------
+    def fail_next(self, count: int = 1) -> None:
+        """次の count 回の通信を ServiceUnavailable にする"""
+        with self._lock:
+            self._fail_next += count
+
+    def _count(self, key: str, by: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += by
+
+    def _count_reads(self, count: int) -> None:
+        self._count("reads", count)
+
+    def _rpc(self, name: str) -> None:
+        """1回の通信（遅延を入れ、指定に応じて失敗させる）"""
+        with self._lock:
+            self.stats["rpcs"] += 1
+            fail = self.offline or self._fail_next > 0 or (
+                self.failure_rate > 0 and self._rng.random() < self.failure_rate
+            )
+            if self._fail_next > 0:
+                self._fail_next -= 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if fail:
+                self.stats["failures"] += 1
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise ServiceUnavailable(f"Injected failure ({name})")
+
+    # ------------------------------------------------------------------
+    # 保存
+    # ------------------------------------------------------------------
+    def _read_doc(self, path: str) -> Tuple[Optional[Dict], int]:
+        with self._lock:
+            data = self._docs.get(path)
+            return (copy.deepcopy(data) if data is not None else None), self._versions.get(path, 0)
+
+    def _commit_writes(self, writes: List[Tuple], expected_versions: Optional[Dict[str, int]] = None) -> None:
+        """書き込みをまとめて反映する（expected_versions と版が違えば何も書かずに Aborted）"""
+        with self._lock:
+            for path, version in (expected_versions or {}).items():
+                if self._versions.get(path, 0) != version:
+                    raise Aborted(f"Document {path} changed during transaction")
+            for kind, path, data, merge in writes:
+                if kind == "update" and path not in self._docs:
+                    raise KeyError(f"No document to update: {path}")
+            for kind, path, data, merge in writes:
+                current = self._docs.get(path)
+                if kind == "delete":
+                    self._docs.pop(path, None)
+                else:
+                    values = _apply_transforms(data, current)
+                    self._docs[path] = _merge(current or {}, values) if merge else values
+                self._versions[path] = self._versions.get(path, 0) + 1
+            self.stats["writes"] += len(writes)
+            watches = list(self._watches)
+        for watch in watches:
+            for _, path, _, _ in writes:
+                watch._notify(path)
+
+    def _add_watch(self, watch: Watch) -> Watch:
+        with self._lock:
+            self._watches.append(watch)
+        watch._thread.start()
+        return watch
+
+    def _remove_watch(self, watch: Watch) -> None:
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    # ------------------------------------------------------------------
+    # firestore.Client と同じ入口
+    # ------------------------------------------------------------------
+    def collection(self, collection_id: str) -> CollectionReference:
+        return CollectionReference(self, collection_id)
+
+    def collection_group(self, collection_id: str) -> Query:
+        return Query(self, collection_id, all_descendants=True)
+
+    def document(self, path: str) -> DocumentReference:
+        return DocumentReference(self, path)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self) -> Transaction:
+        return Transaction(self)
+
+    def reset(self) -> None:
+        """全ドキュメントと統計を消す"""
+        with self._lock:
+            self._docs.clear()
+            self._versions.clear()
+            for key in self.stats:
+                self.stats[key] = 0
@@ -2,54 +2,221 @@
 Firebase Firestoreサービス
 """
 import streamlit as st
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Union
 from datetime import datetime
+import importlib.util
 import json
+import random
 
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
-    FIREBASE_AVAILABLE = True
-except ImportError:
-    FIREBASE_AVAILABLE = False
+from services.bulk_write import ProgressCallback, bulk_delete, bulk_set
+from services.circuit_breaker import CircuitBreaker
+from services.leaderboard_mirror import Aggregates, LeaderboardMirror
+from services.rank_index import (
+    ALL, ALL_SCORES, DEFAULT_EVENT_ID, Partition, ScoreRange, build_rank_info,
+)
+from services.ttl_cache import StaleWhileRevalidateCache
+
+# firebase_admin は grpc・google-cloud を読み込み重いので、ここでは有無だけを調べ、
+# 実際に接続するときに _import_firebase() で読み込む（ローカルだけの端末を速く起動するため）
+FIREBASE_AVAILABLE = importlib.util.find_spec("firebase_admin") is not None
+if not FIREBASE_AVAILABLE:
     print("Warning: firebase-admin not installed. Using local JSON fallback.")
 
+_firebase_modules = None
+
+
+def _import_firebase():
+    """(firebase_admin, credentials, firestore) を初めて使うときに読み込む"""
+    global _firebase_modules
+    if _firebase_modules is None:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        _firebase_modules = (firebase_admin, credentials, firestore)
+    return _firebase_modules
+
+# 全件を読み出すときの1ページの件数
+EXPORT_PAGE_SIZE = 500
+# まとめて削除するときの1ページ（1バッチ）の件数（バッチの上限は500件）
+BULK_DELETE_PAGE_SIZE = 400
+# まとめて書き込むときの1バッチの件数と、並行にコミットするバッチの数
+BULK_WRITE_PAGE_SIZE = 400
+BULK_WRITE_WORKERS = 4
+
+# リーダーボードのキャッシュ期限（秒）。期限切れ後も LEADERBOARD_MAX_STALE 秒までは
+# 古い値を返しながら裏で読み直す（settings.json の storage.leaderboard_cache_ttl で変更可）
+LEADERBOARD_CACHE_TTL = 10.0
+LEADERBOARD_MAX_STALE = 300.0
+
+
+# 参加者数は日ごとに PARTICIPANT_SHARDS 個のシャードに分けて加算し、読むときに合計する
+PARTICIPANT_SHARDS = 10
+PARTICIPANT_SHARD_COLLECTION = 'participant_shards'
+PARTICIPANT_CACHE_TTL = 5.0
+PARTICIPANT_MAX_STALE = 60.0
+
+
+# イベント・年齢グループごと（とその日別）の上位スコアを1つのドキュメントにまとめて持つ
+# （leaderboard/top100_{event_id}_{age_group}[_{day}]）。scores が正で、集計は作り直せる
+LEADERBOARD_COLLECTION = 'leaderboard'
+AGGREGATE_SIZE = 100
+
+
+def _aggregate_partitions(entry: Dict) -> List[Partition]:
+    """スコアを反映する集計ドキュメントのパーティション"""
+    event_id = entry.get("event_id") or DEFAULT_EVENT_ID
+    age_group = entry.get("age_group") or ""
+    return [Partition(event_id, age_group), Partition(event_id, age_group, entry.get("day"))]
+
+
+def _is_aggregated(partition: Partition) -> bool:
+    """集計ドキュメントを持つパーティションか"""
+    return partition.event_id is not None and partition.age_group is not None
+
+
+def _aggregate_doc_id(partition: Partition) -> str:
+    parts = [f"top{AGGREGATE_SIZE}", partition.event_id, partition.age_group or "none"]
+    if partition.day is not None:
+        parts.append(partition.day)
+    return "_".join(parts).replace("/", "-")
+
+
+def _aggregate_partition(data: Dict) -> Partition:
+    """集計ドキュメントの内容からパーティションを復元する"""
+    return Partition(data.get('event_id'), data.get('age_group'), data.get('day'))
+
+
+def _merge_top(entries: List[Dict], entry: Dict, size: int = AGGREGATE_SIZE) -> Optional[List[Dict]]:
+    """上位リストに entry を入れた結果（同じ entry_id が既にあるか上位に入らなければ None）"""
+    entry_id = entry.get("entry_id")
+    if entry_id and any(e.get("entry_id") == entry_id for e in entries):
+        return None
+    merged = sorted(entries + [entry], key=_leaderboard_key)[:size]
+    return merged if any(e is entry for e in merged) else None
+
+
+# 接続の問題とみなす例外（google.api_core.exceptions の名前。これ以外の失敗ではブレーカーを開かない）
+TRANSIENT_ERRORS = frozenset({
+    "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "TooManyRequests",
+    "ResourceExhausted", "GatewayTimeout", "RetryError", "TransportError",
+})
+
+
+def _is_transient(error: Exception) -> bool:
+    """一時的な接続の問題による失敗か"""
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in TRANSIENT_ERRORS
+
+
+def _leaderboard_key(entry: Dict) -> tuple:
+    """Firestore のスコアの並び順（スコア降順、同点は先着順）"""
+    return (-int(entry.get("score", 0) or 0), str(entry.get("client_timestamp") or entry.get("timestamp", "")))
+
 class FirebaseService:
     """Firebase Firestoreサービス"""
     
-    def __init__(self):
-        self.initialized = False
-        self.db = None
+    def __init__(self, client=None, firestore_module=None):
+        """client / firestore_module を渡すと secrets を使わずにそのクライアントで動く
+        
+        （テスト・ベンチマークで services.fake_firestore を使う場合など）
+        """
+        # firestore モジュール（firebase_admin は接続するときに読み込む）
+        self.firestore = firestore_module
+        self.initialized = client is not None
+        self.db = client
+        # 接続設定があるか（None は未確認。False なら再試行しても無駄）
+        self.configured: Optional[bool] = True if client is not None else (None if FIREBASE_AVAILABLE else False)
+        # 接続できない間は initialize() をすぐに False で返し、疎通確認は裏で行う
+        self.breaker = CircuitBreaker(probe=self._probe, name="Firebase")
+        # (limit, partition) → 上位スコアのリスト（全セッション共有）
+        self.leaderboard_cache = StaleWhileRevalidateCache(LEADERBOARD_CACHE_TTL, LEADERBOARD_MAX_STALE)
+        # 日別参加者数（シャードの合計）
+        self.participant_cache = StaleWhileRevalidateCache(PARTICIPANT_CACHE_TTL, PARTICIPANT_MAX_STALE)
+        # 集計ドキュメントの写し（start_leaderboard_mirror() で起動）
+        self.mirror: Optional[LeaderboardMirror] = None
     
     def initialize(self) -> bool:
-        """Firebase接続を初期化"""
-        if not FIREBASE_AVAILABLE:
+        """Firebase接続を初期化（ブレーカーが開いている間は接続を試みずに False）"""
+        if not FIREBASE_AVAILABLE and not self.initialized:
+            return False
+        
+        if not self.breaker.allow():
             return False
             
         if self.initialized:
             return True
             
         try:
-            # Streamlit secrets から Firebase credentials を取得
-            if "firebase" not in st.secrets:
-                print("Firebase secrets not found in .streamlit/secrets.toml")
-                return False
-            
-            # 既に初期化済みかチェック
-            if not firebase_admin._apps:
-                # secrets.toml から credentials を構築
-                firebase_config = dict(st.secrets["firebase"])
-                cred = credentials.Certificate(firebase_config)
-                firebase_admin.initialize_app(cred)
-            
-            self.db = firestore.client()
-            self.initialized = True
-            print("✓ Firebase Firestore initialized successfully")
-            return True
-            
+            self._connect()
         except Exception as e:
             print(f"Firebase initialization error: {e}")
+            # 設定の不足や認証エラーは続けて試しても直らないので、すぐに開く
+            self.breaker.trip(e)
             return False
+        
+        self.breaker.record_success()
+        print("✓ Firebase Firestore initialized successfully")
+        if self.mirror is not None:
+            self.mirror.start()
+        return True
+    
+    def _connect(self) -> None:
+        """Streamlit secrets の credentials で接続する（失敗時は例外）"""
+        if "firebase" not in st.secrets:
+            self.configured = False
+            raise RuntimeError("Firebase secrets not found in .streamlit/secrets.toml")
+        self.configured = True
+        firebase_admin, credentials, firestore = _import_firebase()
+        
+        # 既に初期化済みかチェック
+        if not firebase_admin._apps:
+            # secrets.toml から credentials を構築
+            firebase_config = dict(st.secrets["firebase"])
+            cred = credentials.Certificate(firebase_config)
+            firebase_admin.initialize_app(cred)
+        
+        self.firestore = self.firestore or firestore
+        self.db = firestore.client()
+        self.initialized = True
+    
+    def _probe(self) -> bool:
+        """疎通確認（ブレーカーが開いている間にバックグラウンドで呼ばれる）"""
+        if not self.initialized:
+            self._connect()
+        self.db.collection('stats').document('health').get()
+        return True
+    
+    def _record_error(self, error: Exception) -> None:
+        """接続の問題による失敗ならブレーカーに記録する"""
+        if _is_transient(error):
+            self.breaker.record_failure(error)
+    
+    def _score_doc(self, player_data: Dict) -> Dict:
+        """scores コレクションに保存するデータ"""
+        # スコアを計算
+        score = player_data.get("teeth_count", 0) * 10 + player_data.get("tooth_coins", 0)
+        
+        client_timestamp = player_data.get("timestamp") or datetime.now().isoformat()
+        
+        return {
+            "entry_id": player_data.get("entry_id"),
+            "event_id": player_data.get("event_id") or DEFAULT_EVENT_ID,
+            "player_name": player_data.get("player_name", "匿名"),
+            "participant_age": player_data.get("participant_age"),
+            "age_group": player_data.get("age_group", ""),
+            "teeth_count": player_data.get("teeth_count", 0),
+            "tooth_coins": player_data.get("tooth_coins", 0),
+            "play_time": player_data.get("play_time", "0分0秒"),
+            "score": score,
+            # 同点時の順位判定用（ローカル保存と同じISO形式）
+            "client_timestamp": client_timestamp,
+            # 日別ランキング用
+            "day": client_timestamp[:10],
+            "timestamp": self.firestore.SERVER_TIMESTAMP
+        }
+    
+    def _score_ref(self, entry_id: Optional[str]):
+        """entry_id があればドキュメントIDとして使う"""
+        scores_ref = self.db.collection('scores')
+        return scores_ref.document(entry_id) if entry_id else scores_ref.document()
     
     def save_player_score(self, player_data: Dict) -> bool:
         """プレイヤースコアをFirestoreに保存"""
@@ -57,124 +224,419 @@ class FirebaseService:
             return False
             
         try:
-            # スコアを計算
-            score = player_data.get("teeth_count", 0) * 10 + player_data.get("tooth_coins", 0)
-            
-            # Firestoreに保存するデータ
-            doc_data = {
-                "player_name": player_data.get("player_name", "匿名"),
-                "participant_age": player_data.get("participant_age"),
-                "age_group": player_data.get("age_group", ""),
-                "teeth_count": player_data.get("teeth_count", 0),
-                "tooth_coins": player_data.get("tooth_coins", 0),
-                "play_time": player_data.get("play_time", "0分0秒"),
-                "score": score,
-                "timestamp": firestore.SERVER_TIMESTAMP
-            }
+            doc_data = self._score_doc(player_data)
+            score_ref = self._score_ref(player_data.get("entry_id"))
+            entry = {**doc_data, "entry_id": score_ref.id, "timestamp": doc_data["client_timestamp"]}
+            self._save_score_transaction(score_ref, doc_data, entry)
             
-            # scores コレクションに追加
-            self.db.collection('scores').add(doc_data)
+            # キャッシュ済みのリーダーボードにも反映（次の読み込みを待たずに表示される）
+            self._add_to_cached_leaderboards(entry)
+            self._add_to_mirror(entry)
             return True
             
         except Exception as e:
             print(f"Firebase save error: {e}")
+            self._record_error(e)
             return False
     
-    def get_leaderboard(self, limit: int = 10) -> List[Dict]:
-        """リーダーボードを取得"""
+    def import_scores(self, entries: List[Dict], progress: Optional[ProgressCallback] = None,
+                      workers: int = BULK_WRITE_WORKERS) -> int:
+        """スコアをまとめて保存し、書いた件数を返す（失敗時は -1）
+        
+        1件ずつトランザクションで書く save_player_score と違い、scores への書き込みは
+        BULK_WRITE_PAGE_SIZE 件ずつのバッチを workers 本まで並行にコミットし、
+        集計ドキュメントは最後に範囲ごとに1回のトランザクションでまとめて更新する。
+        entry_id をドキュメントIDにするので、同じスコアを取り込み直しても二重にならない。
+        途中で失敗した場合は、それまでに書いたスコアは残したまま -1 を返す
+        （集計は更新しないので、もう一度取り込むか集計を作り直す）。
+        """
         if not self.initialize():
-            return []
+            return -1
+            
+        try:
+            imported = []
+            writes = []
+            for player_data in entries:
+                doc_data = self._score_doc(player_data)
+                score_ref = self._score_ref(player_data.get("entry_id"))
+                writes.append((score_ref, doc_data))
+                imported.append({**doc_data, "entry_id": score_ref.id, "timestamp": doc_data["client_timestamp"]})
+            written = bulk_set(self.db, writes, page_size=BULK_WRITE_PAGE_SIZE, workers=workers,
+                               progress=progress, total=len(writes))
+            self._merge_into_aggregates(imported)
+            self.leaderboard_cache.invalidate()
+            return written
+            
+        except Exception as e:
+            print(f"Firebase import scores error: {e}")
+            self._record_error(e)
+            return -1
+    
+    def _merge_into_aggregates(self, entries: List[Dict]) -> None:
+        """複数のスコアを集計ドキュメントに反映する（範囲ごとに1回のトランザクション）"""
+        by_partition: Dict[Partition, List[Dict]] = {}
+        for entry in entries:
+            for partition in _aggregate_partitions(entry):
+                by_partition.setdefault(partition, []).append(entry)
+        
+        for partition, new_entries in by_partition.items():
+            ref = self._aggregate_ref(partition)
+            
+            @self.firestore.transactional
+            def merge(transaction, partition=partition, ref=ref, new_entries=new_entries):
+                snapshot = ref.get(transaction=transaction)
+                top = (snapshot.to_dict() or {}).get('entries', []) if snapshot.exists else []
+                changed = False
+                for entry in new_entries:
+                    merged = _merge_top(top, entry)
+                    if merged is not None:
+                        top, changed = merged, True
+                if changed:
+                    transaction.set(ref, self._aggregate_doc(partition, top))
+            
+            merge(self.db.transaction())
+    
+    def _aggregate_ref(self, partition: Partition):
+        return self.db.collection(LEADERBOARD_COLLECTION).document(_aggregate_doc_id(partition))
+    
+    def _save_score_transaction(self, score_ref, doc_data: Dict, entry: Dict) -> None:
+        """スコアの保存と集計ドキュメントの更新を1つのトランザクションで行う"""
+        aggregates = [(p, self._aggregate_ref(p)) for p in _aggregate_partitions(entry)]
+        
+        @self.firestore.transactional
+        def write(transaction):
+            # トランザクションでは読み込みを書き込みより先に行う
+            snapshots = [ref.get(transaction=transaction) for _, ref in aggregates]
+            transaction.set(score_ref, doc_data)
+            for (partition, ref), snapshot in zip(aggregates, snapshots):
+                entries = (snapshot.to_dict() or {}).get('entries', []) if snapshot.exists else []
+                merged = _merge_top(entries, entry)
+                if merged is not None:
+                    transaction.set(ref, self._aggregate_doc(partition, merged))
+        
+        write(self.db.transaction())
+    
+    def _aggregate_doc(self, partition: Partition, entries: List[Dict]) -> Dict:
+        return {
+            'event_id': partition.event_id,
+            'age_group': partition.age_group,
+            'day': partition.day,
+            'entries': entries,
+            'updated_at': self.firestore.SERVER_TIMESTAMP,
+        }
+    
+    def rebuild_leaderboard_aggregates(self, event_id: Optional[str] = None) -> int:
+        """scores から集計ドキュメントを作り直し、作ったドキュメント数を返す（失敗時は -1）
+        
+        event_id を指定するとそのイベントの集計だけを作り直す。
+        """
+        if not self.initialize():
+            return -1
             
         try:
-            # スコアの高い順に取得
-            scores_ref = self.db.collection('scores')
-            query = scores_ref.order_by('score', direction=firestore.Query.DESCENDING).limit(limit)
-            docs = query.stream()
+            tops: Dict[Partition, List[Dict]] = {}
+            for entry in self.iter_scores():
+                if event_id is not None and (entry.get("event_id") or DEFAULT_EVENT_ID) != event_id:
+                    continue
+                entry.setdefault("day", str(entry.get("timestamp") or "")[:10])
+                for partition in _aggregate_partitions(entry):
+                    merged = _merge_top(tops.get(partition, []), entry)
+                    if merged is not None:
+                        tops[partition] = merged
             
-            leaderboard = []
-            for doc in docs:
-                data = doc.to_dict()
-                # timestamp を文字列に変換
-                if 'timestamp' in data and data['timestamp']:
-                    data['timestamp'] = data['timestamp'].isoformat() if hasattr(data['timestamp'], 'isoformat') else str(data['timestamp'])
-                leaderboard.append(data)
+            # 古い集計を消してから書き直す
+            aggregates = self.db.collection(LEADERBOARD_COLLECTION)
+            if event_id is not None:
+                aggregates = aggregates.where('event_id', '==', event_id)
+            bulk_delete(self.db, aggregates.stream())
+            bulk_set(self.db, [(self._aggregate_ref(partition), self._aggregate_doc(partition, entries))
+                               for partition, entries in tops.items()])
             
-            return leaderboard
+            self.leaderboard_cache.invalidate()
+            print(f"✓ Rebuilt {len(tops)} leaderboard aggregates")
+            return len(tops)
+            
+        except Exception as e:
+            print(f"Firebase rebuild leaderboard error: {e}")
+            self._record_error(e)
+            return -1
+    
+    def _scores_query(self, partition: Partition):
+        """パーティションで絞り込んだ scores クエリ（複合インデックスが必要）"""
+        query = self.db.collection('scores')
+        if partition.event_id is not None:
+            query = query.where('event_id', '==', partition.event_id)
+        if partition.age_group is not None:
+            query = query.where('age_group', '==', partition.age_group)
+        if partition.day is not None:
+            query = query.where('day', '==', partition.day)
+        return query
+    
+    def get_leaderboard(self, limit: int = 10, partition: Partition = ALL) -> List[Dict]:
+        """リーダーボードを取得（集計の写し、無ければTTL付きキャッシュ経由）"""
+        if self.mirror is not None and _is_aggregated(partition) and limit <= AGGREGATE_SIZE:
+            mirrored = self.mirror.top(partition, limit)
+            if mirrored is not None:
+                return mirrored
+        
+        if not self.initialize():
+            return []
+            
+        try:
+            leaderboard = self.leaderboard_cache.get(
+                (limit, partition), lambda: self._fetch_leaderboard(limit, partition)
+            )
+            return [dict(entry) for entry in leaderboard]
             
         except Exception as e:
             print(f"Firebase get leaderboard error: {e}")
+            self._record_error(e)
             return []
+    
+    def _fetch_leaderboard(self, limit: int, partition: Partition) -> List[Dict]:
+        """Firestore からスコアの高い順に取得（失敗時は例外）
+        
+        イベント・年齢グループを指定した範囲は集計ドキュメント1件を読むだけで済ませる。
+        集計がまだ無い場合（作り直す前の古いデータなど）は scores へのクエリで読む。
+        """
+        if _is_aggregated(partition) and limit <= AGGREGATE_SIZE:
+            doc = self._aggregate_ref(partition).get()
+            if doc.exists:
+                return [dict(e) for e in (doc.to_dict() or {}).get('entries', [])[:limit]]
+        
+        scores_ref = self._scores_query(partition)
+        query = scores_ref.order_by('score', direction=self.firestore.Query.DESCENDING).limit(limit)
+        docs = query.stream()
+        
+        leaderboard = []
+        for doc in docs:
+            data = doc.to_dict()
+            # timestamp を文字列に変換
+            if 'timestamp' in data and data['timestamp']:
+                data['timestamp'] = data['timestamp'].isoformat() if hasattr(data['timestamp'], 'isoformat') else str(data['timestamp'])
+            leaderboard.append(data)
+        
+        return leaderboard
+    
+    def _add_to_cached_leaderboards(self, entry: Dict) -> None:
+        """保存したスコアを、該当するキャッシュ済みリーダーボードに挿入する"""
+        def insert(key, leaderboard):
+            limit, partition = key
+            if not partition.matches(entry):
+                return leaderboard
+            # 同じ entry_id が既にあるか上位に入らなかった場合は変更なし
+            updated = _merge_top(leaderboard, entry, limit)
+            return leaderboard if updated is None else updated
+        
+        self.leaderboard_cache.update_all(insert)
+
+    def _add_to_mirror(self, entry: Dict) -> None:
+        """保存したスコアを集計の写しにも反映する（リスナーの通知を待たずに表示される）"""
+        if self.mirror is None:
+            return
+        for partition in _aggregate_partitions(entry):
+            self.mirror.update(partition, lambda entries: _merge_top(entries or [], entry))
+    
+    def start_leaderboard_mirror(self, **options) -> Optional[LeaderboardMirror]:
+        """集計ドキュメントを購読する写しを用意する（Firestore を使わない設定なら None）
+        
+        まだ接続していなければ、最初に接続できたときに購読を始める（接続しない端末では
+        firebase_admin の読み込みもスレッドの起動もしない）。
+        options は LeaderboardMirror にそのまま渡す（poll_interval / max_stale など）。
+        """
+        if self.configured is False:
+            return None
+        if self.mirror is None:
+            self.mirror = LeaderboardMirror(self.watch_leaderboard_aggregates,
+                                            self.fetch_leaderboard_aggregates, **options)
+        if self.initialized:
+            self.mirror.start()
+        return self.mirror
+    
+    def watch_leaderboard_aggregates(self, callback: Callable[[Aggregates], None]):
+        """集計ドキュメントの on_snapshot リスナーを登録し、購読オブジェクトを返す（接続できなければ None）"""
+        if not self.initialize():
+            return None
+        
+        def on_snapshot(docs, changes, read_time):
+            callback([(_aggregate_partition(data), data.get('entries', []))
+                      for data in (doc.to_dict() or {} for doc in docs)])
+        
+        try:
+            return self.db.collection(LEADERBOARD_COLLECTION).on_snapshot(on_snapshot)
+        except Exception as e:
+            self._record_error(e)
+            raise
+    
+    def fetch_leaderboard_aggregates(self) -> Aggregates:
+        """集計ドキュメントを全件読む（失敗時は例外）"""
+        if not self.initialize():
+            raise ConnectionError("Firestore is not available")
+        try:
+            return [(_aggregate_partition(data), data.get('entries', []))
+                    for data in (doc.to_dict() or {} for doc in
+                                 self.db.collection(LEADERBOARD_COLLECTION).stream())]
+        except Exception as e:
+            self._record_error(e)
+            raise
+    
+    def _count(self, query) -> int:
+        """集計クエリで件数を取得（ドキュメントは読み込まない）"""
+        result = query.count().get()
+        return int(result[0][0].value)
+
+    def get_player_rank(self, score: int, timestamp: str, partition: Partition = ALL) -> Optional[Dict]:
+        """スコアと記録時刻からパーティション内の順位を取得（同点は先着が上位）"""
+        if not self.initialize():
+            return None
+            
+        try:
+            scores_ref = self._scores_query(partition)
+            higher = self._count(scores_ref.where('score', '>', score))
+            tied_earlier = self._count(
+                scores_ref.where('score', '==', score).where('client_timestamp', '<', timestamp)
+            )
+            total = self._count(scores_ref)
+            return build_rank_info(higher + tied_earlier + 1, total)
+            
+        except Exception as e:
+            print(f"Firebase get rank error: {e}")
+            self._record_error(e)
+            return None
+    
+    def get_rank_by_entry_id(self, entry_id: str, partition: Partition = ALL) -> Optional[Dict]:
+        """保存済みスコアの順位を取得"""
+        if not self.initialize():
+            return None
+            
+        try:
+            doc = self.db.collection('scores').document(entry_id).get()
+            if not doc.exists:
+                return None
+            data = doc.to_dict()
+            return self.get_player_rank(data.get('score', 0), data.get('client_timestamp', ''), partition)
+            
+        except Exception as e:
+            print(f"Firebase get rank error: {e}")
+            self._record_error(e)
+            return None
 
-    def clear_leaderboard(self) -> bool:
-        """リーダーボードをクリア（全スコア削除）"""
+    def _scores_range_query(self, scope: ScoreRange):
+        """削除範囲の scores クエリ（ページ送りのカーソルに使う項目だけを読む）
+        
+        イベントと日付範囲を両方指定する場合は event_id / day の複合インデックスが必要。
+        """
+        query = self.db.collection('scores')
+        if scope.event_id is not None:
+            query = query.where('event_id', '==', scope.event_id)
+        if scope.start_day is not None:
+            query = query.where('day', '>=', scope.start_day)
+        if scope.end_day is not None:
+            query = query.where('day', '<=', scope.end_day)
+        return query
+    
+    def clear_leaderboard(self, scope: ScoreRange = ALL_SCORES,
+                          progress: Optional[ProgressCallback] = None) -> bool:
+        """リーダーボードをクリア（scope 省略時は全スコア、指定時はそのイベント・期間だけ削除）
+        
+        削除はページ単位で読みながら並行にコミットし、progress(削除済み件数, 全体の件数) で
+        進み具合を知らせる。途中で失敗した場合は、それまでの削除は残したまま False を返す
+        （もう一度実行すれば残りを削除できる）。
+        """
         if not self.initialize():
             return False
             
         try:
-            scores_ref = self.db.collection('scores')
-            # バッチ処理で削除（大量データの場合は再帰的削除が必要だが、今回は簡易実装）
-            docs = scores_ref.stream()
+            query = self._scores_range_query(scope)
+            try:
+                total: Optional[int] = self._count(query)
+            except Exception:
+                total = None
+            if scope.start_day is not None or scope.end_day is not None:
+                # 範囲条件のある項目で並べないとクエリにできない
+                ordered = query.order_by('day').select(['day'])
+            else:
+                ordered = query.order_by('__name__').select([])
+            deleted = bulk_delete(self.db, self._iter_pages(ordered, BULK_DELETE_PAGE_SIZE),
+                                  page_size=BULK_DELETE_PAGE_SIZE, progress=progress, total=total)
             
-            batch = self.db.batch()
-            count = 0
+            if scope.is_all:
+                bulk_delete(self.db, self.db.collection(LEADERBOARD_COLLECTION).stream())
+            else:
+                # 残ったスコアから該当する集計を作り直す
+                self.rebuild_leaderboard_aggregates(scope.event_id)
             
-            for doc in docs:
-                batch.delete(doc.reference)
-                count += 1
-                
-                # Firestoreのバッチ制限は500件
-                if count >= 400:
-                    batch.commit()
-                    batch = self.db.batch()
-                    count = 0
-            
-            if count > 0:
-                batch.commit()
-                
-            print("✓ Firebase leaderboard cleared")
+            self.leaderboard_cache.invalidate()
+            print(f"✓ Firebase leaderboard cleared ({deleted} scores)")
             return True
             
         except Exception as e:
             print(f"Firebase clear leaderboard error: {e}")
+            self._record_error(e)
             return False
     
-    def increment_participant_count(self) -> int:
-        """参加者数をインクリメント"""
+    def _shard_ref(self, day: str, shard: Union[int, str]):
+        return (self.db.collection('participant_days').document(day)
+                .collection(PARTICIPANT_SHARD_COLLECTION).document(str(shard)))
+    
+    def increment_participant_count(self, day: Optional[str] = None, by: int = 1,
+                                    idempotency_key: Optional[str] = None) -> int:
+        """参加者数をインクリメント（day 省略時は今日、by 人分）
+        
+        その日のシャードからランダムに1つ選んでサーバー側で加算するので、
+        受付端末が多くても同じドキュメントへの書き込みが集中しない。
+        idempotency_key を渡すと、そのキーをIDにしたドキュメントに人数を上書きで書く
+        （Outbox からの再送で同じ加算が二重に数えられないようにするため）。
+        戻り値はキャッシュ済みの日別人数に加算した累計（他端末の直近の加算は含まれないことがある）。
+        加算に失敗した場合だけ 0 を返す（加算後の累計が読めなくても失敗にはしない）。
+        """
         if not self.initialize():
             return 0
             
         try:
-            stats_ref = self.db.collection('stats').document('participants')
-            today = datetime.now().strftime("%Y-%m-%d")
-            
-            # トランザクションで安全に更新
-            @firestore.transactional
-            def  update_in_transaction(transaction, stats_ref):
-                snapshot = stats_ref.get(transaction=transaction)
-                
-                if snapshot.exists:
-                    data = snapshot.to_dict()
-                    total_count = data.get('total_count', 0) + 1
-                    daily_counts = data.get('daily_counts', {})
-                    daily_counts[today] = daily_counts.get(today, 0) + 1
-                else:
-                    total_count = 1
-                    daily_counts = {today: 1}
-                
-                transaction.set(stats_ref, {
-                    'total_count': total_count,
-                    'daily_counts': daily_counts
-                })
-                
-                return total_count
-            
-            transaction = self.db.transaction()
-            new_count = update_in_transaction(transaction, stats_ref)
-            return new_count
-            
+            today = day or datetime.now().strftime("%Y-%m-%d")
+            if idempotency_key:
+                self._shard_ref(today, idempotency_key).set({'day': today, 'count': by})
+            else:
+                shard = random.randrange(PARTICIPANT_SHARDS)
+                self._shard_ref(today, shard).set(
+                    {'day': today, 'count': self.firestore.Increment(by)}, merge=True
+                )
         except Exception as e:
             print(f"Firebase increment count error: {e}")
+            self._record_error(e)
             return 0
+        
+        # キャッシュ済みの日別人数にも反映
+        def add(key, daily_counts):
+            return {**daily_counts, today: daily_counts.get(today, 0) + by}
+        self.participant_cache.update_all(add)
+        try:
+            return sum(self._participant_counts().values())
+        except Exception as e:
+            # 加算は済んでいるので、失敗として再送させる（二重に数える）ことはしない
+            print(f"Firebase participant count read error: {e}")
+            self._record_error(e)
+            cached = self.participant_cache.peek("daily_counts")
+            return sum(cached.values()) if cached else by
+    
+    def _participant_counts(self) -> Dict[str, int]:
+        """日別参加者数（キャッシュ経由）"""
+        return self.participant_cache.get("daily_counts", self._fetch_participant_counts)
+    
+    def _fetch_participant_counts(self) -> Dict[str, int]:
+        """全シャードを読んで日別に合計する（旧形式の stats/participants も含める）"""
+        daily_counts: Dict[str, int] = {}
+        legacy = self.db.collection('stats').document('participants').get()
+        if legacy.exists:
+            for day, count in (legacy.to_dict().get('daily_counts') or {}).items():
+                daily_counts[day] = daily_counts.get(day, 0) + int(count)
+        for doc in self.db.collection_group(PARTICIPANT_SHARD_COLLECTION).stream():
+            data = doc.to_dict()
+            day = data.get('day')
+            if day:
+                daily_counts[day] = daily_counts.get(day, 0) + int(data.get('count', 0))
+        return dict(sorted(daily_counts.items()))
     
     def get_participant_stats(self) -> Dict:
         """参加者統計を取得"""
@@ -182,26 +644,94 @@ class FirebaseService:
             return {"total": 0, "today": 0, "daily_counts": {}}
             
         try:
-            stats_ref = self.db.collection('stats').document('participants')
-            doc = stats_ref.get()
-            
-            if doc.exists:
-                data = doc.to_dict()
-                today = datetime.now().strftime("%Y-%m-%d")
-                today_count = data.get('daily_counts', {}).get(today, 0)
-                
-                return {
-                    "total": data.get('total_count', 0),
-                    "today": today_count,
-                    "daily_counts": data.get('daily_counts', {})
-                }
-            else:
-                return {"total": 0, "today": 0, "daily_counts": {}}
+            daily_counts = self._participant_counts()
+            today = datetime.now().strftime("%Y-%m-%d")
+            return {
+                "total": sum(daily_counts.values()),
+                "today": daily_counts.get(today, 0),
+                "daily_counts": dict(daily_counts)
+            }
                 
         except Exception as e:
             print(f"Firebase get stats error: {e}")
+            self._record_error(e)
             return {"total": 0, "today": 0, "daily_counts": {}}
 
+    def reset_participant_count(self) -> bool:
+        """参加者数をリセット（全シャードを削除）"""
+        if not self.initialize():
+            return False
+            
+        try:
+            shards = self.db.collection_group(PARTICIPANT_SHARD_COLLECTION)
+            bulk_delete(self.db, self._iter_pages(shards.order_by('__name__').select([]),
+                                                  BULK_DELETE_PAGE_SIZE))
+            self.db.collection('stats').document('participants').delete()
+            self.participant_cache.invalidate()
+            return True
+            
+        except Exception as e:
+            print(f"Firebase reset count error: {e}")
+            self._record_error(e)
+            return False
+    
+    def append_sessions(self, sessions: List[Dict]) -> bool:
+        """体験ログを sessions コレクションにまとめて保存"""
+        return self.import_sessions(sessions) >= 0
+    
+    def import_sessions(self, sessions: List[Dict], progress: Optional[ProgressCallback] = None,
+                        workers: int = BULK_WRITE_WORKERS) -> int:
+        """体験ログをまとめて保存し、書いた件数を返す（失敗時は -1）"""
+        if not self.initialize():
+            return -1
+            
+        try:
+            sessions_ref = self.db.collection('sessions')
+            writes = []
+            for session in sessions:
+                # session_id があればドキュメントIDにして再送時の重複を防ぐ
+                session_id = session.get('session_id')
+                doc_ref = sessions_ref.document(session_id) if session_id else sessions_ref.document()
+                writes.append((doc_ref, session))
+            return bulk_set(self.db, writes, page_size=BULK_WRITE_PAGE_SIZE, workers=workers,
+                            progress=progress, total=len(writes))
+            
+        except Exception as e:
+            print(f"Firebase save sessions error: {e}")
+            self._record_error(e)
+            return -1
+    
+    def _iter_pages(self, query, page_size: int = EXPORT_PAGE_SIZE) -> Iterator:
+        """order_by 済みのクエリを page_size 件ずつ読み進める（一度に全件は読まない）"""
+        last_doc = None
+        while True:
+            page = query.limit(page_size)
+            if last_doc is not None:
+                page = page.start_after(last_doc)
+            docs = list(page.stream())
+            yield from docs
+            if len(docs) < page_size:
+                return
+            last_doc = docs[-1]
+    
+    def iter_sessions(self, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict]:
+        """体験ログを古い順に1件ずつ返す"""
+        if not self.initialize():
+            return
+        query = self.db.collection('sessions').order_by('timestamp')
+        for doc in self._iter_pages(query, page_size):
+            yield doc.to_dict()
+    
+    def iter_scores(self, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict]:
+        """全スコアを記録順に1件ずつ返す（timestamp はローカル保存と同じISO形式）"""
+        if not self.initialize():
+            return
+        query = self.db.collection('scores').order_by('client_timestamp')
+        for doc in self._iter_pages(query, page_size):
+            data = doc.to_dict()
+            data['timestamp'] = data.get('client_timestamp', '')
+            yield data
+
 # グローバルインスタンス
 firebase_service = FirebaseService()
 
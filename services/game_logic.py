@@ -2,13 +2,13 @@
 ゲームロジックの中核機能
 """
 import random
-import json
 import streamlit as st
-from typing import Dict, Tuple, Optional
+from typing import Dict, Mapping, Optional, Sequence, Tuple
 import uuid
 from datetime import datetime
 
 from . import teeth as teeth_service
+from .board_repository import load_board
 
 def initialize_game_state():
     """ゲーム状態の初期化"""
@@ -70,13 +70,12 @@ def generate_turn_id() -> str:
     """ターンIDを生成（重複防止用）"""
     return str(uuid.uuid4())[:8]
 
-def load_board_data() -> list:
-    """ボードデータを読み込む"""
+def load_board_data() -> Sequence[Mapping]:
+    """ボードデータを読み込む（解析済みのボードを全セッションで共有する）"""
     # Both files are now identical, but keeping the logic for now
     board_file = "data/board_main_under5.json" if st.session_state.age_under_5 else "data/board_main_5plus.json"
     try:
-        with open(board_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_board(board_file)
     except FileNotFoundError:
         st.error(f"ボードファイル {board_file} が見つかりません")
         return []
@@ -204,9 +203,10 @@ def get_current_cell_info() -> Dict:
     board_data = load_board_data()
     current_cell = st.session_state.current_cell
     
-    for cell_info in board_data:
-        if cell_info['cell'] == current_cell:
-            return cell_info
+    cell_info = board_data.cell_by_id(current_cell) if board_data else None
+    if cell_info is not None:
+        # 共有のボードなので呼び出し元が書き換えられるようにコピーを返す
+        return dict(cell_info)
     
     # マス情報が見つからない場合はデフォルト
     return {
@@ -0,0 +1,207 @@
+"""
+オフラインで記録したスコア・体験ログの取り込み
+
+受付端末ごとのファイル（leaderboard.json / score_history.jsonl /
+game_sessions.jsonl(.gz)、スタッフ画面で書き出した JSON Lines など）を読み、
+スコアと体験ログに振り分けて Firestore にまとめて書き込む。
+ドキュメントIDは entry_id / session_id から決めるので、同じファイルを何度取り込んでも
+二重にならない（途中で失敗しても、もう一度取り込めば続きが書かれる）。
+"""
+import gzip
+import hashlib
+import json
+import time
+import uuid
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from services.bulk_write import DEFAULT_WORKERS, ProgressCallback
+
+KIND_SCORE = "score"
+KIND_SESSION = "session"
+
+# import_scores / import_sessions を1回呼ぶ件数（集計ドキュメントはこの単位で更新する）
+INGEST_CHUNK_SIZE = 2000
+
+# session_id から採番するスコアの entry_id の名前空間（値を変えると既存の取り込みと重複する）
+SESSION_SCORE_NAMESPACE = uuid.UUID("6f1c2d0e-8a4b-4f51-9c3e-2b7d5a9e0c11")
+
+
+class IngestReport(NamedTuple):
+    """取り込み結果"""
+    scores: int = 0
+    sessions: int = 0
+    skipped: int = 0   # スコアにも体験ログにも当てはまらなかったレコード
+    failed: int = 0    # 書き込みに失敗したレコード（取り込み直せば書かれる）
+    elapsed: float = 0.0
+
+    @property
+    def written(self) -> int:
+        return self.scores + self.sessions
+
+    @property
+    def per_second(self) -> float:
+        """1秒あたりに書き込んだ件数"""
+        return self.written / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def iter_file_records(name: str, data: bytes) -> Iterator[Dict]:
+    """ファイル名と中身からレコードを1件ずつ返す
+
+    .gz は展開し、.jsonl は1行1件（壊れた行は読み飛ばす）、.json は配列か
+    {"scores": [...], "sessions": [...]} の形、または1件のオブジェクトとして読む。
+    """
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+        name = name[:-3]
+    text = data.decode("utf-8-sig")
+    if name.endswith(".jsonl"):
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict):
+                yield record
+        return
+
+    content = json.loads(text)
+    if isinstance(content, dict) and any(key in content for key in ("scores", "sessions")):
+        for key in ("scores", "sessions"):
+            yield from (r for r in content.get(key) or [] if isinstance(r, dict))
+    elif isinstance(content, list):
+        yield from (r for r in content if isinstance(r, dict))
+    elif isinstance(content, dict):
+        yield content
+
+
+def classify(record: Dict) -> Optional[str]:
+    """スコア（KIND_SCORE）か体験ログ（KIND_SESSION）か（どちらでもなければ None）"""
+    if "entry_id" in record or "score" in record or "player_name" in record:
+        return KIND_SCORE
+    if "session_id" in record or "participant_name" in record:
+        return KIND_SESSION
+    return None
+
+
+def _content_id(record: Dict) -> str:
+    """ID の無いレコードは内容から ID を決める（同じ内容なら同じ ID）"""
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def session_entry_id(session_id: str) -> str:
+    """体験ログから作るスコアの entry_id"""
+    return uuid.uuid5(SESSION_SCORE_NAMESPACE, str(session_id)).hex
+
+
+def normalize_score(record: Dict) -> Dict:
+    """スコアに entry_id を付ける（entry_id → session_id → 内容 の順に決める）"""
+    if record.get("entry_id"):
+        return record
+    if record.get("session_id"):
+        return {**record, "entry_id": session_entry_id(record["session_id"])}
+    return {**record, "entry_id": _content_id(record)}
+
+
+def normalize_session(record: Dict) -> Dict:
+    """体験ログに session_id を付ける（無ければ内容から決める）"""
+    if record.get("session_id"):
+        return record
+    return {**record, "session_id": _content_id(record)}
+
+
+def score_from_session(session: Dict) -> Dict:
+    """体験ログからゴール時のスコアを作る（entry_id は session_id から決める）"""
+    return {
+        "entry_id": session_entry_id(session["session_id"]),
+        "event_id": session.get("event_id"),
+        "player_name": session.get("participant_name") or "匿名",
+        "participant_age": session.get("participant_age"),
+        "age_group": session.get("age_group", ""),
+        "teeth_count": session.get("teeth_count", 0),
+        "tooth_coins": session.get("tooth_coins", 0),
+        "play_time": session.get("play_time", "0分0秒"),
+        "timestamp": session.get("timestamp"),
+    }
+
+
+def split_records(records: Iterable[Dict],
+                  scores_from_sessions: bool = False) -> Tuple[List[Dict], List[Dict], int]:
+    """レコードを (スコア, 体験ログ, 読み飛ばした件数) に振り分ける
+
+    scores_from_sessions=True なら、体験ログからもスコアを作る
+    （スコアを保存できずに体験ログだけが残った端末のため）。
+    """
+    scores: List[Dict] = []
+    sessions: List[Dict] = []
+    skipped = 0
+    for record in records:
+        kind = classify(record)
+        if kind == KIND_SCORE:
+            scores.append(normalize_score(record))
+        elif kind == KIND_SESSION:
+            session = normalize_session(record)
+            sessions.append(session)
+            if scores_from_sessions:
+                scores.append(score_from_session(session))
+        else:
+            skipped += 1
+    return scores, sessions, skipped
+
+
+def _chunks(items: List[Dict], size: int) -> Iterator[List[Dict]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ingest_records(service, records: Iterable[Dict], scores_from_sessions: bool = False,
+                   chunk_size: int = INGEST_CHUNK_SIZE, workers: int = DEFAULT_WORKERS,
+                   progress: Optional[ProgressCallback] = None) -> IngestReport:
+    """レコードを FirebaseService にまとめて書き込み、結果を返す
+
+    chunk_size 件ごとに import_scores / import_sessions を呼び、失敗したかたまりは
+    failed に数えて次に進む。progress(書き込んだ件数, 全体の件数) で進み具合を知らせる。
+    """
+    started = time.perf_counter()
+    scores, sessions, skipped = split_records(records, scores_from_sessions)
+    total = len(scores) + len(sessions)
+    done = 0
+    counts = {KIND_SCORE: 0, KIND_SESSION: 0}
+    failed = 0
+
+    for kind, items, write in ((KIND_SCORE, scores, service.import_scores),
+                               (KIND_SESSION, sessions, service.import_sessions)):
+        for chunk in _chunks(items, chunk_size):
+            offset = done
+
+            def report(written, _total, offset=offset):
+                if progress is not None:
+                    progress(offset + written, total)
+
+            written = write(chunk, progress=report, workers=workers)
+            if written < 0:
+                failed += len(chunk)
+            else:
+                counts[kind] += written
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+
+    return IngestReport(
+        scores=counts[KIND_SCORE],
+        sessions=counts[KIND_SESSION],
+        skipped=skipped,
+        failed=failed,
+        elapsed=time.perf_counter() - started,
+    )
+
+
+def ingest_files(service, files: Iterable[Tuple[str, bytes]], **options) -> IngestReport:
+    """(ファイル名, 中身) の列を読み込んで取り込む（options は ingest_records と同じ）"""
+    records: List[Dict] = []
+    for name, data in files:
+        records.extend(iter_file_records(name, data))
+    return ingest_records(service, records, **options)
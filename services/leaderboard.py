@@ -0,0 +1,205 @@
+"""
+リーダーボードのインメモリ上位K件インデックス
+
+プロセス内で一度だけファイルから読み込み、以降のスコア追加は
+二分探索で挿入位置を求めてソート済み配列に差し込む。
+ファイルへの書き出しはまとめて（遅延して）行う。
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from services.atomic_io import atomic_write_json, file_lock
+
+LEADERBOARD_CAPACITY = 100
+
+# 最後の更新からファイルに書き出すまでの待ち時間（秒）
+FLUSH_DELAY_SECONDS = 1.0
+
+
+def rank_key(entry: Dict) -> Tuple[int, str]:
+    """並び順のキー（スコア降順、同点は先着順）"""
+    return (-int(entry.get("score", 0) or 0), str(entry.get("timestamp", "")))
+
+
+class TopKLeaderboard:
+    """上位K件だけを保持するソート済み配列"""
+
+    def __init__(self, capacity: int = LEADERBOARD_CAPACITY):
+        self.capacity = capacity
+        self._keys: List[Tuple[int, str]] = []
+        self._entries: List[Dict] = []
+
+    def load(self, entries: List[Dict]) -> None:
+        """既存のエントリで初期化"""
+        ordered = sorted((e for e in entries if isinstance(e, dict)), key=rank_key)[:self.capacity]
+        self._entries = [dict(e) for e in ordered]
+        self._keys = [rank_key(e) for e in self._entries]
+
+    def add(self, entry: Dict) -> Optional[int]:
+        """エントリを追加し、0始まりの順位を返す（圏外ならNone）"""
+        key = rank_key(entry)
+        pos = bisect.bisect_right(self._keys, key)
+        if pos >= self.capacity:
+            return None
+        self._keys.insert(pos, key)
+        self._entries.insert(pos, dict(entry))
+        if len(self._entries) > self.capacity:
+            self._keys.pop()
+            self._entries.pop()
+        return pos
+
+    def top(self, n: int) -> List[Dict]:
+        """上位n件のコピーを返す"""
+        return [dict(e) for e in self._entries[:n]]
+
+    def clear(self) -> None:
+        self._keys = []
+        self._entries = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PersistentLeaderboard:
+    """ファイルに遅延書き出しされる上位K件インデックス（プロセス共有）"""
+
+    def __init__(self, path: str, capacity: int = LEADERBOARD_CAPACITY,
+                 flush_delay: float = FLUSH_DELAY_SECONDS):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._index = TopKLeaderboard(capacity)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        # 未書き出しの追加分（他プロセスが更新したファイルに重ねるため）
+        self._pending: List[Dict] = []
+        # 最後に読み書きしたときのファイルの (mtime, size)
+        self._file_sig: Optional[Tuple[int, int]] = None
+
+    def _stat_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _read_file(self) -> List[Dict]:
+        entries: List[Dict] = []
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, list):
+                    entries = data
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Leaderboard load error: {e}")
+        return entries
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            # 他プロセスがファイルを書き換えていたら読み直す（未書き出しの追加がある間は flush 時に合わせる）
+            sig = self._stat_signature()
+            if self._dirty or sig is None or sig == self._file_sig:
+                return
+        self._file_sig = self._stat_signature()
+        self._index.load(self._read_file())
+        self._loaded = True
+
+    def add(self, entry: Dict) -> Optional[int]:
+        """スコアを追加（ファイル書き出しは遅延）"""
+        with self._lock:
+            self._ensure_loaded()
+            pos = self._index.add(entry)
+            if pos is not None:
+                self._pending.append(dict(entry))
+                self._mark_dirty()
+            return pos
+
+    def top(self, n: int) -> List[Dict]:
+        """上位n件を返す（他プロセスが更新していなければファイルは読まない）"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._index.top(n)
+
+    def clear(self) -> None:
+        """全件削除してすぐに書き出す（書き込み失敗時は OSError）"""
+        with self._lock:
+            self._index.clear()
+            self._pending = []
+            self._loaded = True
+            self._dirty = True
+            self._file_sig = None
+            self.flush(merge=False)
+
+    def reload(self) -> None:
+        """次回アクセス時にファイルから読み直す"""
+        with self._lock:
+            self._loaded = False
+            self._dirty = False
+            self._pending = []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self._flush_quietly)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self, merge: bool = True) -> None:
+        """未保存の変更をファイルに書き出す
+
+        他プロセスが先にファイルを更新していた場合は、その内容に
+        このプロセスの未書き出し分を重ねてから書き出す。
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            with file_lock(self.path):
+                if merge and self._stat_signature() != self._file_sig:
+                    self._index.load(self._read_file())
+                    for entry in self._pending:
+                        self._index.add(entry)
+                atomic_write_json(self.path, self._index.top(self._index.capacity))
+                self._file_sig = self._stat_signature()
+            self._pending = []
+            self._dirty = False
+
+    def _flush_quietly(self) -> None:
+        """タイマー・終了時用（例外を外に出さない）"""
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"Leaderboard flush error: {e}")
+
+
+_leaderboards: Dict[str, PersistentLeaderboard] = {}
+_leaderboards_lock = threading.Lock()
+
+
+def get_leaderboard_index(path: str) -> PersistentLeaderboard:
+    """パスごとのリーダーボードインデックスを取得"""
+    with _leaderboards_lock:
+        index = _leaderboards.get(path)
+        if index is None:
+            index = _leaderboards[path] = PersistentLeaderboard(path)
+        return index
+
+
+@atexit.register
+def flush_all_leaderboards() -> None:
+    """プロセス終了時に未保存の変更を書き出す"""
+    with _leaderboards_lock:
+        indexes = list(_leaderboards.values())
+    for index in indexes:
+        index._flush_quietly()
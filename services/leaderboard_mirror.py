@@ -0,0 +1,184 @@
+"""
+Firestore のランキング集計ドキュメントのプロセス内ミラー
+
+leaderboard コレクション（イベント・年齢グループごとの上位スコア）を1つの
+on_snapshot リスナーで購読し、メモリ上の写しを全セッションで共有する。
+ランキングの表示はこの写しを読むだけなので Firestore への問い合わせが要らず、
+他の端末で保存されたスコアも1秒以内に反映される。
+
+リスナーが使えない・切れた間はポーリング（poll_interval 秒ごとに全件読み直し）に
+切り替え、待ち時間を倍々に延ばしながらリスナーをつなぎ直す。
+ポーリングも失敗し続けて写しが max_stale 秒より古くなると、top() は None を返す
+（呼び出し側は従来どおりキャッシュ・クエリで読む）。
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.rank_index import Partition
+
+MIRROR_POLL_INTERVAL = 2.0
+MIRROR_MAX_STALE = 30.0
+# リスナーが動いているかを確かめる間隔（秒）
+MIRROR_CHECK_INTERVAL = 0.5
+MIRROR_BASE_BACKOFF = 1.0
+MIRROR_MAX_BACKOFF = 60.0
+
+MODE_LISTENING = "listening"
+MODE_POLLING = "polling"
+MODE_STOPPED = "stopped"
+
+Aggregates = List[Tuple[Partition, List[Dict]]]
+
+
+class LeaderboardMirror:
+    """ランキング集計ドキュメントの写し
+
+    subscribe(callback) はリスナーを登録して購読オブジェクト（is_active / unsubscribe を持つ）を返し、
+    以降ドキュメントが変わるたびに callback(集計の全件) を呼ぶ。fetch() は集計の全件を一度だけ読む。
+    集計の全件は (パーティション, 上位エントリのリスト) の列。
+    """
+
+    def __init__(self, subscribe: Callable[[Callable[[Aggregates], None]], object],
+                 fetch: Callable[[], Aggregates], poll_interval: float = MIRROR_POLL_INTERVAL,
+                 max_stale: float = MIRROR_MAX_STALE, base_backoff: float = MIRROR_BASE_BACKOFF,
+                 max_backoff: float = MIRROR_MAX_BACKOFF, clock: Callable[[], float] = time.monotonic):
+        self._subscribe = subscribe
+        self._fetch = fetch
+        self.poll_interval = poll_interval
+        self.max_stale = max_stale
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tops: Dict[Partition, List[Dict]] = {}
+        self._updated_at: Optional[float] = None
+        self._version = 0
+        self._watch = None
+        self._backoff = base_backoff
+        self._next_subscribe = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 読み出し
+    # ------------------------------------------------------------------
+    def top(self, partition: Partition, limit: int) -> Optional[List[Dict]]:
+        """写しにあるパーティションの上位 limit 件（写しが無い・古い場合は None）"""
+        with self._lock:
+            if not self._is_fresh():
+                return None
+            entries = self._tops.get(partition)
+            if entries is None:
+                return None
+            return [dict(entry) for entry in entries[:limit]]
+
+    @property
+    def mode(self) -> str:
+        if self._thread is None or self._stop.is_set():
+            return MODE_STOPPED
+        return MODE_LISTENING if self._listening() else MODE_POLLING
+
+    @property
+    def version(self) -> int:
+        """写しが更新されるたびに増える番号"""
+        return self._version
+
+    def status(self) -> Dict:
+        """スタッフ画面表示用の状態"""
+        with self._lock:
+            age = None if self._updated_at is None else max(self._clock() - self._updated_at, 0.0)
+            return {"mode": self.mode, "age": age, "partitions": len(self._tops), "version": self._version}
+
+    def _is_fresh(self) -> bool:
+        if self._updated_at is None:
+            return False
+        return self._listening() or self._clock() - self._updated_at <= self.max_stale
+
+    def _listening(self) -> bool:
+        watch = self._watch
+        return watch is not None and getattr(watch, "is_active", True)
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+    def _replace(self, aggregates: Aggregates) -> None:
+        """集計の全件で写しを置き換える（消えたドキュメントは写しからも消える）"""
+        tops = {partition: list(entries) for partition, entries in aggregates}
+        with self._lock:
+            self._tops = tops
+            self._updated_at = self._clock()
+            self._version += 1
+
+    def update(self, partition: Partition, func: Callable[[Optional[List[Dict]]], Optional[List[Dict]]]) -> None:
+        """パーティションの上位リストを func(今のリスト or None) の結果にする（None なら変更なし）
+
+        この端末で保存したスコアを、リスナーからの通知を待たずに写しへ反映するのに使う。
+        """
+        with self._lock:
+            if self._updated_at is None:
+                return
+            updated = func(self._tops.get(partition))
+            if updated is not None:
+                self._tops[partition] = updated
+                self._version += 1
+
+    # ------------------------------------------------------------------
+    # リスナー・ポーリング
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-mirror", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._unsubscribe()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self._watch is not None and not self._listening():
+                print("Leaderboard listener disconnected; polling until it reconnects")
+                self._unsubscribe()
+                self._schedule_reconnect()
+            if self._watch is None:
+                self._poll()
+                if self._clock() >= self._next_subscribe:
+                    self._connect()
+            interval = MIRROR_CHECK_INTERVAL if self._watch is not None else self.poll_interval
+            self._stop.wait(interval)
+
+    def _connect(self) -> None:
+        try:
+            watch = self._subscribe(self._replace)
+            if watch is None:
+                raise RuntimeError("listener is not available")
+        except Exception as e:
+            print(f"Leaderboard listener error: {e}")
+            self._schedule_reconnect()
+            return
+        self._watch = watch
+        self._backoff = self.base_backoff
+
+    def _schedule_reconnect(self) -> None:
+        self._next_subscribe = self._clock() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _unsubscribe(self) -> None:
+        watch, self._watch = self._watch, None
+        if watch is None:
+            return
+        try:
+            watch.unsubscribe()
+        except Exception as e:
+            print(f"Leaderboard listener unsubscribe error: {e}")
+
+    def _poll(self) -> None:
+        try:
+            self._replace(self._fetch())
+        except Exception as e:
+            print(f"Leaderboard poll error: {e}")
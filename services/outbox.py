@@ -0,0 +1,244 @@
+"""
+Firestore へ送れなかった書き込みの送信待ち箱（アウトボックス）
+
+Firestore への書き込みに失敗した操作を SQLite に1件ずつ記録し、
+接続が戻ったらバックグラウンドのスレッドがまとめて再送する。
+各行には重複防止キー（idempotency key）を付け、同じキーの操作は1件だけ残す。
+再送側もキーを使って上書き保存するので、同じ操作を2回送っても結果は変わらない。
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+OUTBOX_FILE = "data/outbox.db"
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_INTERVAL = 5.0
+DEFAULT_BASE_BACKOFF = 2.0
+DEFAULT_MAX_BACKOFF = 300.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    op TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at, id);
+"""
+
+
+class OutboxItem(NamedTuple):
+    id: int
+    key: str
+    op: str
+    payload: Dict
+    attempts: int
+
+
+# 再送ハンドラは同じ操作の行をまとめて受け取り、失敗した行を返す
+OutboxHandler = Callable[[str, List[OutboxItem]], List[OutboxItem]]
+
+
+class Outbox:
+    """SQLite に保存する送信待ちの操作"""
+
+    def __init__(self, path: str = OUTBOX_FILE,
+                 base_backoff: float = DEFAULT_BASE_BACKOFF,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF):
+        self.path = path
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を返す"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # 記録した操作を失わないよう、コミットごとにディスクへ確定させる
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.executescript(_SCHEMA)
+                self._schema_ready = True
+        self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """現在のスレッドの接続を閉じる"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def add(self, op: str, items: List[tuple]) -> int:
+        """(重複防止キー, payload) の組を記録し、新しく追加した件数を返す"""
+        if not items:
+            return 0
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (key, op, payload, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(key, op, json.dumps(payload, ensure_ascii=False), now, now) for key, payload in items],
+            )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def due(self, limit: int = DEFAULT_BATCH_SIZE, now: Optional[float] = None) -> List[OutboxItem]:
+        """再送時刻を過ぎた行を古い順に返す"""
+        rows = self._connect().execute(
+            "SELECT id, key, op, payload, attempts FROM outbox "
+            "WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (time.time() if now is None else now, limit),
+        ).fetchall()
+        return [OutboxItem(row["id"], row["key"], row["op"], json.loads(row["payload"]), row["attempts"])
+                for row in rows]
+
+    def complete(self, items: List[OutboxItem]) -> None:
+        """送信できた行を消す"""
+        if items:
+            self._connect().executemany("DELETE FROM outbox WHERE id = ?", [(item.id,) for item in items])
+
+    def fail(self, items: List[OutboxItem], error: str = "") -> None:
+        """送信できなかった行の再送を指数バックオフで先送りする"""
+        now = time.time()
+        rows = []
+        for item in items:
+            delay = min(self.max_backoff, self.base_backoff * (2 ** item.attempts))
+            rows.append((now + delay * random.uniform(0.8, 1.2), error[:500], item.id))
+        if rows:
+            self._connect().executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                rows,
+            )
+
+    def retry_now(self) -> None:
+        """すべての行をすぐに再送対象にする"""
+        self._connect().execute("UPDATE outbox SET next_attempt_at = 0")
+
+    def size(self) -> int:
+        """送信待ちの件数"""
+        return self._connect().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def discard(self, op: str, predicate: Callable[[Dict], bool]) -> int:
+        """op の行のうち payload が predicate に当てはまるものを破棄し、件数を返す"""
+        conn = self._connect()
+        rows = conn.execute("SELECT id, payload FROM outbox WHERE op = ?", (op,)).fetchall()
+        ids = [(row["id"],) for row in rows if predicate(json.loads(row["payload"]))]
+        if ids:
+            conn.executemany("DELETE FROM outbox WHERE id = ?", ids)
+        return len(ids)
+
+    def clear(self, op: Optional[str] = None) -> None:
+        """送信待ちを破棄する（op を指定するとその操作だけ）"""
+        if op is None:
+            self._connect().execute("DELETE FROM outbox")
+        else:
+            self._connect().execute("DELETE FROM outbox WHERE op = ?", (op,))
+
+
+class OutboxReplayer:
+    """送信待ちを定期的にまとめて再送するワーカー"""
+
+    def __init__(self, outbox: Outbox, handler: OutboxHandler,
+                 interval: float = DEFAULT_INTERVAL,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.outbox = outbox
+        self.handler = handler
+        self.interval = interval
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox-replayer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self) -> None:
+        """待たずに次の再送を始める"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                while self.drain_once() and not self._stopping.is_set():
+                    pass
+            except Exception as e:
+                print(f"Outbox replay error: {e}")
+            finally:
+                self.outbox.close()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def drain_once(self) -> bool:
+        """再送時刻を過ぎた行を1バッチ分送る（1件でも送れたら True）"""
+        items = self.outbox.due(self.batch_size)
+        if not items:
+            return False
+        by_op: Dict[str, List[OutboxItem]] = {}
+        for item in items:
+            by_op.setdefault(item.op, []).append(item)
+        sent = 0
+        for op, op_items in by_op.items():
+            try:
+                failed = self.handler(op, op_items) or []
+                error = "rejected"
+            except Exception as e:
+                failed, error = op_items, str(e)
+            failed_ids = {item.id for item in failed}
+            done = [item for item in op_items if item.id not in failed_ids]
+            self.outbox.complete(done)
+            self.outbox.fail(failed, error)
+            sent += len(done)
+        if sent:
+            print(f"✓ Outbox replayed {sent} writes")
+        return sent > 0
+
+
+_outboxes: Dict[str, Outbox] = {}
+_outboxes_lock = threading.Lock()
+
+
+def get_outbox(path: str = OUTBOX_FILE) -> Outbox:
+    """パスごとの Outbox インスタンスを取得"""
+    with _outboxes_lock:
+        outbox = _outboxes.get(path)
+        if outbox is None:
+            outbox = _outboxes[path] = Outbox(path)
+        return outbox
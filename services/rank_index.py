@@ -0,0 +1,334 @@
+"""
+全ゴール済みゲームのスコア順位インデックス
+
+(スコア降順, 先着順) のキーをソート済み配列で保持し、
+二分探索で順位を求める。スコア履歴は JSON Lines に追記して永続化する。
+
+スコアは (event_id, age_group, day) のパーティションに属する。各項目を
+「すべて」に置き換えた8通りのパーティションそれぞれに上位K件と順位インデックスを
+持ち、スコア追加時にまとめて更新するので、どのパーティションの上位も O(K) で返せる。
+"""
+import bisect
+import itertools
+import os
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from services.leaderboard import LEADERBOARD_CAPACITY, TopKLeaderboard, rank_key
+from services.session_log import SessionLog
+
+SCORE_HISTORY_FILE = "data/score_history.jsonl"
+
+# event_id が記録されていない（イベント設定以前の）スコアの扱い
+DEFAULT_EVENT_ID = "default"
+
+
+def build_rank_info(rank: int, total: int) -> Dict:
+    """順位情報の辞書を作成（percentile は「上位何%」）"""
+    total = max(total, rank)
+    return {
+        "rank": rank,
+        "total": total,
+        "percentile": round(rank / total * 100, 1) if total else 100.0,
+    }
+
+
+class ScoreRankIndex:
+    """全スコアのソート済みキー配列"""
+
+    def __init__(self):
+        self._keys: List[Tuple[int, str]] = []
+        self._by_entry_id: Dict[str, Tuple[int, str]] = {}
+
+    def load(self, entries: Iterable[Dict]) -> None:
+        keys = []
+        by_id = {}
+        for entry in entries:
+            key = rank_key(entry)
+            keys.append(key)
+            if entry.get("entry_id"):
+                by_id[entry["entry_id"]] = key
+        keys.sort()
+        self._keys = keys
+        self._by_entry_id = by_id
+
+    def add(self, entry: Dict) -> None:
+        entry_id = entry.get("entry_id")
+        if entry_id and entry_id in self._by_entry_id:
+            return
+        key = rank_key(entry)
+        bisect.insort(self._keys, key)
+        if entry_id:
+            self._by_entry_id[entry_id] = key
+
+    def contains(self, entry_id: Optional[str]) -> bool:
+        return bool(entry_id) and entry_id in self._by_entry_id
+
+    def rank_of(self, score: int, timestamp: str) -> Dict:
+        """スコアと記録時刻から順位を求める（同点は先着が上位）"""
+        pos = bisect.bisect_left(self._keys, rank_key({"score": score, "timestamp": timestamp}))
+        return build_rank_info(pos + 1, len(self._keys))
+
+    def rank_by_entry_id(self, entry_id: str) -> Optional[Dict]:
+        key = self._by_entry_id.get(entry_id)
+        if key is None:
+            return None
+        pos = bisect.bisect_left(self._keys, key)
+        return build_rank_info(pos + 1, len(self._keys))
+
+    def clear(self) -> None:
+        self._keys = []
+        self._by_entry_id = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class Partition(NamedTuple):
+    """リーダーボードの区切り（None は「すべて」）"""
+
+    event_id: Optional[str] = None
+    age_group: Optional[str] = None
+    day: Optional[str] = None
+
+    @classmethod
+    def of(cls, entry: Dict) -> "Partition":
+        """スコアエントリが属する最も細かいパーティション"""
+        return cls(
+            entry.get("event_id") or DEFAULT_EVENT_ID,
+            entry.get("age_group") or "",
+            str(entry.get("timestamp", ""))[:10],
+        )
+
+    @property
+    def is_all(self) -> bool:
+        return self == ALL
+
+    def generalizations(self) -> List["Partition"]:
+        """自身を含み、各項目を「すべて」にした全パーティション（8通り）"""
+        return [
+            Partition(*(None if wildcard else value for value, wildcard in zip(self, mask)))
+            for mask in itertools.product((False, True), repeat=len(self))
+        ]
+
+    def matches(self, entry: Dict) -> bool:
+        """エントリがこのパーティションに含まれるか"""
+        own = Partition.of(entry)
+        return all(value is None or value == actual for value, actual in zip(self, own))
+
+
+ALL = Partition()
+
+
+class ScoreRange(NamedTuple):
+    """スコアを削除する範囲（None は「すべて」、日付は YYYY-MM-DD で両端を含む）"""
+
+    event_id: Optional[str] = None
+    start_day: Optional[str] = None
+    end_day: Optional[str] = None
+
+    @property
+    def is_all(self) -> bool:
+        return self == ALL_SCORES
+
+    def matches(self, entry: Dict) -> bool:
+        """エントリがこの範囲に含まれるか"""
+        event_id, _, day = Partition.of(entry)
+        if self.event_id is not None and event_id != self.event_id:
+            return False
+        if self.start_day is not None and day < self.start_day:
+            return False
+        if self.end_day is not None and day > self.end_day:
+            return False
+        return True
+
+
+ALL_SCORES = ScoreRange()
+
+
+class PartitionedLeaderboard:
+    """パーティションごとの上位K件と全件の順位インデックス"""
+
+    def __init__(self, capacity: int = LEADERBOARD_CAPACITY):
+        self.capacity = capacity
+        self._tops: Dict[Partition, TopKLeaderboard] = {}
+        self._ranks: Dict[Partition, ScoreRankIndex] = {}
+
+    def load(self, entries: Iterable[Dict]) -> None:
+        self.clear()
+        for entry in entries:
+            self.add(entry)
+
+    def contains(self, entry_id: Optional[str]) -> bool:
+        ranks = self._ranks.get(ALL)
+        return ranks is not None and ranks.contains(entry_id)
+
+    def add(self, entry: Dict) -> None:
+        if self.contains(entry.get("entry_id")):
+            return
+        for partition in Partition.of(entry).generalizations():
+            top = self._tops.get(partition)
+            if top is None:
+                top = self._tops[partition] = TopKLeaderboard(self.capacity)
+                self._ranks[partition] = ScoreRankIndex()
+            top.add(entry)
+            self._ranks[partition].add(entry)
+
+    def top(self, partition: Partition, n: int) -> List[Dict]:
+        top = self._tops.get(partition)
+        return top.top(n) if top is not None else []
+
+    def rank_of(self, partition: Partition, score: int, timestamp: str) -> Dict:
+        return self._ranks.get(partition, ScoreRankIndex()).rank_of(score, timestamp)
+
+    def rank_by_entry_id(self, partition: Partition, entry_id: str) -> Optional[Dict]:
+        ranks = self._ranks.get(partition)
+        return ranks.rank_by_entry_id(entry_id) if ranks is not None else None
+
+    def partitions(self) -> List[Partition]:
+        """スコアが1件以上あるパーティション"""
+        return list(self._tops)
+
+    def clear(self) -> None:
+        self._tops = {}
+        self._ranks = {}
+
+
+class PersistentRankIndex:
+    """スコア履歴ファイルと同期したパーティション別の順位インデックス（プロセス共有）
+
+    同じデータディレクトリを使う他のプロセスも履歴に追記するので、読み書きのたびに
+    履歴ファイルの (inode, mtime, サイズ) を確かめ、変わっていれば追記された分だけを読んで
+    インデックスに加える。ファイルが差し替えられた（削除による退避・ローテーション）場合は
+    全件を読み直す。
+    """
+
+    def __init__(self, path: str = SCORE_HISTORY_FILE,
+                 seed_loader: Optional[Callable[[], Iterable[Dict]]] = None):
+        self.path = path
+        self._log = SessionLog(path=path, legacy_path=None, rotate_daily=False)
+        self._seed_loader = seed_loader
+        self._index = PartitionedLeaderboard()
+        self._lock = threading.Lock()
+        self._loaded = False
+        # 最後に同期したときの履歴ファイルの (device, inode, mtime, size) と、読み終えた位置
+        self._file_sig: Optional[Tuple[int, int, int, int]] = None
+        self._offset = 0
+
+    def _stat_signature(self) -> Optional[Tuple[int, int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _ensure_loaded(self) -> None:
+        sig = self._stat_signature()
+        if self._loaded and sig == self._file_sig:
+            return
+        old = self._file_sig
+        if self._loaded and sig is not None and old is not None and sig[:2] == old[:2] and sig[3] >= self._offset:
+            # 同じファイルへの追記（自分の追記も含む）: 増えた分だけ読む
+            entries, self._offset = self._log.read_current(self._offset)
+            for entry in entries:
+                self._index.add(entry)
+            self._file_sig = sig
+            return
+        self._reload(seed=not self._loaded)
+
+    def _reload(self, seed: bool = False) -> None:
+        """履歴の全件でインデックスを作り直す"""
+        sig = self._stat_signature()
+        current, offset = self._log.read_current(0)
+        entries = list(self._log.iter_rotated_records()) + current
+        if not entries and seed and self._seed_loader:
+            # 履歴がまだ無い場合は既存のリーダーボードから作る
+            entries = [_history_record(entry) for entry in self._seed_loader()]
+            self._log.append_many(entries)
+            sig = self._stat_signature()
+            offset = sig[3] if sig is not None else 0
+        self._index.load(entries)
+        self._file_sig = sig
+        self._offset = offset
+        self._loaded = True
+
+    def add(self, entry: Dict) -> None:
+        """スコアを履歴に追記してインデックスに挿入"""
+        self.add_many([entry])
+
+    def add_many(self, entries: List[Dict]) -> List[Dict]:
+        """複数のスコアを1回の追記で履歴に書き、インデックスに挿入する
+
+        登録済みの entry_id は無視し、新たに追加したエントリを返す。
+        インデックスには履歴から読み戻して加えるので、他プロセスの追記と同じ順序・内容になる。
+        """
+        with self._lock:
+            self._ensure_loaded()
+            new_entries = [entry for entry in entries
+                           if not self._index.contains(entry.get("entry_id"))]
+            self._log.append_many([_history_record(entry) for entry in new_entries])
+            self._ensure_loaded()
+            return new_entries
+
+    def top(self, n: int, partition: Optional[Partition] = None) -> List[Dict]:
+        """パーティションの上位n件"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._index.top(partition or ALL, n)
+
+    def rank_of(self, score: int, timestamp: str, partition: Optional[Partition] = None) -> Dict:
+        with self._lock:
+            self._ensure_loaded()
+            return self._index.rank_of(partition or ALL, score, timestamp)
+
+    def rank_by_entry_id(self, entry_id: str, partition: Optional[Partition] = None) -> Optional[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._index.rank_by_entry_id(partition or ALL, entry_id)
+
+    def iter_records(self) -> Iterator[Dict]:
+        """スコア履歴を記録順に1件ずつ返す"""
+        with self._lock:
+            self._ensure_loaded()
+        return self._log.iter_records()
+
+    def partitions(self) -> List[Partition]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._index.partitions()
+
+    def clear(self, scope: ScoreRange = ALL_SCORES) -> None:
+        """履歴を退避してインデックスを空にする（scope 指定時は範囲外のスコアを書き戻す）"""
+        with self._lock:
+            # 範囲外のスコアの読み込み・退避・書き戻しは履歴のロックの中でまとめて行い、
+            # その間に他プロセスが保存したスコアを失わないようにする
+            self._log.archive(keep=None if scope.is_all else (lambda record: not scope.matches(record)))
+            self._reload()
+
+
+def _history_record(entry: Dict) -> Dict:
+    """履歴には順位計算とパーティション別ランキングの表示に必要な項目だけを残す"""
+    return {
+        "entry_id": entry.get("entry_id"),
+        "player_name": entry.get("player_name", "匿名"),
+        "teeth_count": entry.get("teeth_count", 0),
+        "tooth_coins": entry.get("tooth_coins", 0),
+        "score": entry.get("score", 0),
+        "timestamp": entry.get("timestamp", ""),
+        "age_group": entry.get("age_group", ""),
+        "event_id": entry.get("event_id") or DEFAULT_EVENT_ID,
+    }
+
+
+_rank_indexes: Dict[str, PersistentRankIndex] = {}
+_rank_indexes_lock = threading.Lock()
+
+
+def get_rank_index(path: str = SCORE_HISTORY_FILE,
+                   seed_loader: Optional[Callable[[], Iterable[Dict]]] = None) -> PersistentRankIndex:
+    """パスごとの順位インデックスを取得"""
+    with _rank_indexes_lock:
+        index = _rank_indexes.get(path)
+        if index is None:
+            index = _rank_indexes[path] = PersistentRankIndex(path, seed_loader)
+        return index
@@ -0,0 +1,275 @@
+"""
+体験セッションログ（JSON Lines 追記方式）
+
+1セッション = 1行で追記し、サイズまたは日付でファイルをローテーションする。
+ローテーション済みのセグメントは gzip 圧縮して保存する。
+"""
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.atomic_io import file_lock, fsync_directory
+
+SESSION_LOG_FILE = "data/game_sessions.jsonl"
+LEGACY_SESSIONS_FILE = "data/game_sessions.json"
+
+# 1セグメントの上限サイズ（超えたらローテーション）
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+
+
+class SessionLog:
+    """追記専用のセッションログ"""
+
+    def __init__(self, path: str = SESSION_LOG_FILE,
+                 legacy_path: Optional[str] = LEGACY_SESSIONS_FILE,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 rotate_daily: bool = True):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self._lock = threading.Lock()
+        self._migrated = False
+
+    # ------------------------------------------------------------------
+    # 書き込み
+    # ------------------------------------------------------------------
+    def append(self, record: Dict) -> None:
+        """1レコードを追記して fsync する"""
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict]) -> None:
+        """複数レコードを1回の書き込みと fsync で追記する"""
+        if not records:
+            return
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with self._lock, file_lock(self.path):
+            self._migrate_legacy()
+            if self._should_rotate(datetime.now()):
+                self._rotate()
+            if not self._ends_with_newline():
+                # 前回の書き込み途中で落ちた行に続けて書かないよう、先に改行で区切る
+                data = "\n" + data
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        """現在のセグメントが空か、改行で終わっているか"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return True
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) == b"\n"
+        except FileNotFoundError:
+            return True
+
+    def _should_rotate(self, now: datetime) -> bool:
+        """現在のセグメントをローテーションすべきか判定"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size == 0:
+            return False
+        if stat.st_size >= self.max_bytes:
+            return True
+        if self.rotate_daily:
+            segment_day = datetime.fromtimestamp(stat.st_mtime).date()
+            return segment_day != now.date()
+        return False
+
+    def _rotate(self) -> Optional[str]:
+        """現在のセグメントを gzip 圧縮して退避する"""
+        if not os.path.exists(self.path):
+            return None
+        stamp = datetime.fromtimestamp(os.stat(self.path).st_mtime).strftime("%Y%m%d-%H%M%S")
+        base, ext = os.path.splitext(self.path)
+        # 同一秒内のローテーションでも名前順 = 時系列順になるよう連番を付ける
+        seq = 0
+        rotated = f"{base}-{stamp}-{seq:04d}{ext}.gz"
+        while os.path.exists(rotated):
+            seq += 1
+            rotated = f"{base}-{stamp}-{seq:04d}{ext}.gz"
+
+        tmp_path = rotated + ".tmp"
+        with open(self.path, 'rb') as src, open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as dst:
+                while True:
+                    chunk = src.read(64 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, rotated)
+        fsync_directory(os.path.dirname(os.path.abspath(rotated)))
+        os.remove(self.path)
+        return rotated
+
+    def rotate(self) -> Optional[str]:
+        """手動ローテーション（スタッフ操作用）"""
+        with self._lock, file_lock(self.path):
+            return self._rotate()
+
+    def archive(self, keep: Optional[Callable[[Dict], bool]] = None) -> List[str]:
+        """全セグメントを読み込み対象外の名前に退避する（リセット用）
+
+        keep を渡すと、keep が真を返すレコードを新しい現在のセグメントに書き戻す。
+        読み込み・退避・書き戻しを1つのロックの中で行うので、その間に他プロセスが
+        追記したレコードは、退避前に読まれるか退避後のセグメントに書かれる。
+        """
+        with self._lock, file_lock(self.path):
+            segments = self.segments()
+            tmp_path = None
+            if keep is not None:
+                remaining = [record for segment in segments
+                             for record in iter_segment(segment) if keep(record)]
+                if remaining:
+                    tmp_path = self.path + ".tmp"
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        for record in remaining:
+                            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            archived = []
+            for segment in segments:
+                target = f"{segment}.archived-{stamp}"
+                os.replace(segment, target)
+                archived.append(target)
+            if tmp_path is not None:
+                os.replace(tmp_path, self.path)
+                fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+            return archived
+
+    # ------------------------------------------------------------------
+    # 旧形式（JSON配列）からの移行
+    # ------------------------------------------------------------------
+    def migrate_legacy(self) -> int:
+        """旧 game_sessions.json を JSON Lines に移行する（初回のみ）"""
+        if self._migrated:
+            return 0
+        with self._lock, file_lock(self.path):
+            return self._migrate_legacy()
+
+    def _migrate_legacy(self) -> int:
+        if self._migrated:
+            return 0
+        self._migrated = True
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return 0
+
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                sessions = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Legacy session log migration skipped: {e}")
+            return 0
+        if not isinstance(sessions, list):
+            sessions = []
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # 旧データは既存セグメントより前に並ぶように先頭へ書き込む
+        existing = b""
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                existing = f.read()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            for entry in sessions:
+                f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8'))
+            f.write(existing)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        os.replace(self.legacy_path, self.legacy_path + ".migrated")
+        print(f"✓ Migrated {len(sessions)} sessions to {self.path}")
+        return len(sessions)
+
+    # ------------------------------------------------------------------
+    # 読み込み
+    # ------------------------------------------------------------------
+    def segments(self) -> List[str]:
+        """古い順にセグメントファイルのパスを返す"""
+        directory = os.path.dirname(self.path) or "."
+        base, ext = os.path.splitext(os.path.basename(self.path))
+        prefix = f"{base}-"
+        rotated = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.startswith(prefix) and name.endswith(f"{ext}.gz")
+        ) if os.path.isdir(directory) else []
+        if os.path.exists(self.path):
+            rotated.append(self.path)
+        return rotated
+
+    def iter_records(self) -> Iterator[Dict]:
+        """全セグメントのレコードを1件ずつ遅延読み込みする"""
+        with self._lock, file_lock(self.path):
+            self._migrate_legacy()
+        for segment in self.segments():
+            yield from iter_segment(segment)
+
+    def iter_rotated_records(self) -> Iterator[Dict]:
+        """ローテーション済み（gzip 圧縮済み）のセグメントのレコードだけを古い順に返す"""
+        for segment in self.segments():
+            if segment != self.path:
+                yield from iter_segment(segment)
+
+    def read_current(self, offset: int = 0) -> Tuple[List[Dict], int]:
+        """現在のセグメントの offset バイト目以降を読み、(レコード, 読み終えた位置) を返す
+
+        ロックは取らない。他プロセスが書き込み中の、改行で終わっていない末尾は読まずに残す。
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b"\n") + 1
+        return list(_parse_lines(data[:end].decode('utf-8', errors='replace').splitlines())), offset + end
+
+
+def _parse_lines(lines: Iterable[str]) -> Iterator[Dict]:
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # 書き込み途中で落ちた行は読み飛ばす
+            continue
+
+
+def iter_segment(segment: str) -> Iterator[Dict]:
+    """1つのセグメント（gzip 圧縮済みも可）のレコードを1件ずつ返す"""
+    opener = gzip.open if segment.endswith(".gz") else open
+    try:
+        with opener(segment, 'rt', encoding='utf-8') as f:
+            yield from _parse_lines(f)
+    except FileNotFoundError:
+        # 読み込み中にローテーションされた場合
+        return
+
+
+# グローバルインスタンス（パスごと）
+_session_logs: Dict[str, SessionLog] = {SESSION_LOG_FILE: SessionLog()}
+_session_logs_lock = threading.Lock()
+
+
+def get_session_log(path: str = SESSION_LOG_FILE) -> SessionLog:
+    """セッションログインスタンスを取得"""
+    with _session_logs_lock:
+        log = _session_logs.get(path)
+        if log is None:
+            log = _session_logs[path] = SessionLog(path=path, legacy_path=None)
+        return log
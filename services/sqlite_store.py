@@ -0,0 +1,403 @@
+"""
+SQLite（WALモード）によるローカルデータ保存
+
+複数タブレットから同時に書き込んでも更新が失われないよう、
+スコア・参加者数・体験ログを1行単位の INSERT / UPSERT で保存する。
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from services.rank_index import (
+    ALL, ALL_SCORES, DEFAULT_EVENT_ID, Partition, ScoreRange, build_rank_info,
+)
+
+SQLITE_FILE = "data/oral_life_game.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_id TEXT,
+    player_name TEXT NOT NULL,
+    participant_age INTEGER,
+    age_group TEXT NOT NULL DEFAULT '',
+    teeth_count INTEGER NOT NULL DEFAULT 0,
+    tooth_coins INTEGER NOT NULL DEFAULT 0,
+    play_time TEXT,
+    score INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    event_id TEXT,
+    day TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_scores_rank ON scores (score DESC, timestamp ASC);
+
+CREATE TABLE IF NOT EXISTS participant_daily (
+    day TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    session_id TEXT,
+    age_group TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_timestamp ON sessions (timestamp);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# ローカルJSONの取り込みを済ませたことを示す meta のキー
+# （スコアをリセットして空になっても取り込み直さない）
+JSON_IMPORTED_KEY = "json_imported_at"
+
+# 旧スキーマ（entry_id / event_id / day 列なし）のDBに対する追加マイグレーション
+_MIGRATIONS = (
+    ("scores", "entry_id", "ALTER TABLE scores ADD COLUMN entry_id TEXT"),
+    ("scores", "event_id", "ALTER TABLE scores ADD COLUMN event_id TEXT"),
+    # パーティションの条件を式でなく列の比較にして索引で引けるよう、
+    # 日付を列に持ち、age_group の NULL を '' にそろえる
+    ("scores", "day", """
+        ALTER TABLE scores ADD COLUMN day TEXT NOT NULL DEFAULT '';
+        UPDATE scores SET day = substr(timestamp, 1, 10);
+        UPDATE scores SET age_group = '' WHERE age_group IS NULL;
+        DROP INDEX IF EXISTS idx_scores_partition;
+    """),
+)
+_POST_MIGRATION_SCHEMA = f"""
+UPDATE scores SET event_id = '{DEFAULT_EVENT_ID}' WHERE event_id IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_scores_entry_id ON scores (entry_id);
+CREATE INDEX IF NOT EXISTS idx_scores_partition_day ON scores (event_id, age_group, day, score DESC, timestamp ASC);
+CREATE INDEX IF NOT EXISTS idx_scores_day ON scores (day);
+"""
+
+_SCORE_COLUMNS = (
+    "entry_id", "player_name", "participant_age", "age_group", "teeth_count",
+    "tooth_coins", "play_time", "score", "timestamp", "event_id",
+)
+
+# day は timestamp から求めて保存する（読み出す列には含めない）
+_INSERT_COLUMNS = _SCORE_COLUMNS + ("day",)
+_INSERT_SCORE = (
+    f"INSERT INTO scores ({', '.join(_INSERT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _INSERT_COLUMNS)})"
+)
+_INSERT_SESSION = "INSERT INTO sessions (timestamp, session_id, age_group, payload) VALUES (?, ?, ?, ?)"
+
+
+def _score_row(entry: Dict) -> List:
+    row = dict(entry)
+    # パーティションの列は Partition.of と同じ形に正規化して保存する
+    partition = Partition.of(entry)
+    row["event_id"] = partition.event_id
+    row["age_group"] = partition.age_group
+    row["day"] = partition.day
+    return [row.get(col) for col in _INSERT_COLUMNS]
+
+
+def _legacy_score(entry: Dict) -> Optional[Dict]:
+    """旧形式のスコア（save_game_result の total_score）を score にそろえる（使えない行は None）"""
+    if entry.get("score") is None and entry.get("total_score") is not None:
+        entry = {**entry, "score": entry["total_score"]}
+    if entry.get("score") is None or not entry.get("timestamp"):
+        return None
+    if not entry.get("player_name"):
+        entry = {**entry, "player_name": entry.get("participant_name") or ""}
+    return entry
+
+
+def _partition_filter(partition: Partition) -> tuple:
+    """パーティションの WHERE 条件（AND でつなぐ断片）とパラメータ"""
+    clauses, params = [], []
+    if partition.event_id is not None:
+        clauses.append("event_id = ?")
+        params.append(partition.event_id)
+    if partition.age_group is not None:
+        clauses.append("age_group = ?")
+        params.append(partition.age_group)
+    if partition.day is not None:
+        clauses.append("day = ?")
+        params.append(partition.day)
+    return clauses, params
+
+
+def _execute_script(conn: sqlite3.Connection, script: str) -> None:
+    """「;」区切りの文を現在のトランザクションの中で順に実行する"""
+    for statement in script.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _session_row(entry: Dict) -> tuple:
+    return (
+        entry.get("timestamp", ""),
+        entry.get("session_id"),
+        entry.get("age_group"),
+        json.dumps(entry, ensure_ascii=False),
+    )
+
+
+class SQLiteStore:
+    """SQLiteバックエンド"""
+
+    def __init__(self, path: str = SQLITE_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を返す（sqlite3の接続はスレッド間で共有しない）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        with self._schema_lock:
+            if not self._schema_ready:
+                self._migrate(conn)
+                self._schema_ready = True
+        self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """スキーマの作成とマイグレーション
+
+        同じDBを同時に開いた他のプロセスと重ならないよう、BEGIN IMMEDIATE の中で
+        列の有無を確かめてから追加する（executescript は先にコミットしてしまうので使わない）。
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _execute_script(conn, _SCHEMA)
+            for table, column, statement in _MIGRATIONS:
+                columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    _execute_script(conn, statement)
+            _execute_script(conn, _POST_MIGRATION_SCHEMA)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        """現在のスレッドの接続を閉じる"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _executemany(self, statement: str, rows: List) -> None:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(statement, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ------------------------------------------------------------------
+    # スコア
+    # ------------------------------------------------------------------
+    def add_score(self, entry: Dict) -> None:
+        """スコアを1行追加"""
+        self._connect().execute(_INSERT_SCORE, _score_row(entry))
+
+    def add_scores(self, entries: List[Dict]) -> None:
+        """スコアをまとめて追加（1トランザクション、同じ entry_id は無視）"""
+        self._executemany(_INSERT_SCORE.replace("INSERT", "INSERT OR IGNORE", 1),
+                          [_score_row(entry) for entry in entries])
+
+    def top_scores(self, limit: int = 10, partition: Partition = ALL) -> List[Dict]:
+        """スコア上位を取得（同点は先着順）"""
+        clauses, params = _partition_filter(partition)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT {', '.join(_SCORE_COLUMNS)} FROM scores {where}"
+            "ORDER BY score DESC, timestamp ASC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def rank_of(self, score: int, timestamp: str, partition: Partition = ALL) -> Dict:
+        """スコアと記録時刻からパーティション内の順位を求める（同点は先着が上位）"""
+        conn = self._connect()
+        clauses, params = _partition_filter(partition)
+        # OR でつながず2つの範囲に分けて、どちらもパーティションの索引の範囲走査で数える
+        higher = " AND ".join(clauses + ["score > ?"])
+        tied = " AND ".join(clauses + ["score = ?", "timestamp < ?"])
+        ahead = conn.execute(
+            f"SELECT (SELECT COUNT(*) FROM scores WHERE {higher}) + (SELECT COUNT(*) FROM scores WHERE {tied})",
+            (*params, score, *params, score, timestamp),
+        ).fetchone()[0]
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        total = conn.execute(f"SELECT COUNT(*) FROM scores{where}", params).fetchone()[0]
+        return build_rank_info(ahead + 1, total)
+
+    def rank_by_entry_id(self, entry_id: str, partition: Partition = ALL) -> Optional[Dict]:
+        """保存済みエントリのパーティション内の順位を求める"""
+        row = self._connect().execute(
+            "SELECT score, timestamp FROM scores WHERE entry_id = ?", (entry_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self.rank_of(row["score"], row["timestamp"], partition)
+
+    def iter_scores(self) -> Iterator[Dict]:
+        """全スコアを記録順に1件ずつ返す"""
+        cursor = self._connect().execute(
+            f"SELECT {', '.join(_SCORE_COLUMNS)} FROM scores ORDER BY timestamp"
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def clear_scores(self, scope: ScoreRange = ALL_SCORES) -> int:
+        """範囲内（省略時は全件）のスコアを削除し、削除した件数を返す"""
+        clauses, params = [], []
+        if scope.event_id is not None:
+            clauses.append("event_id = ?")
+            params.append(scope.event_id)
+        if scope.start_day is not None:
+            clauses.append("day >= ?")
+            params.append(scope.start_day)
+        if scope.end_day is not None:
+            clauses.append("day <= ?")
+            params.append(scope.end_day)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._connect().execute("DELETE FROM scores" + where, params).rowcount
+
+    # ------------------------------------------------------------------
+    # 参加者数
+    # ------------------------------------------------------------------
+    def increment_participants(self, day: str, by: int = 1) -> int:
+        """指定日の参加者数を by だけ増やし、累計を返す"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO participant_daily (day, count) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET count = count + excluded.count",
+                (day, by),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(count), 0) FROM participant_daily").fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return int(total)
+
+    def participant_counts(self) -> Dict[str, int]:
+        """日別参加者数を返す"""
+        rows = self._connect().execute(
+            "SELECT day, count FROM participant_daily ORDER BY day"
+        ).fetchall()
+        return {row["day"]: row["count"] for row in rows}
+
+    def reset_participants(self) -> None:
+        """参加者数をリセット"""
+        self._connect().execute("DELETE FROM participant_daily")
+
+    # ------------------------------------------------------------------
+    # 体験ログ
+    # ------------------------------------------------------------------
+    def append_session(self, entry: Dict) -> None:
+        """体験ログを1行追加"""
+        self._connect().execute(_INSERT_SESSION, _session_row(entry))
+
+    def append_sessions(self, entries: List[Dict]) -> None:
+        """体験ログをまとめて追加（1トランザクション）"""
+        self._executemany(_INSERT_SESSION, [_session_row(entry) for entry in entries])
+
+    def iter_sessions(self) -> Iterator[Dict]:
+        """体験ログを古い順に1件ずつ返す"""
+        cursor = self._connect().execute("SELECT payload FROM sessions ORDER BY id")
+        for row in cursor:
+            yield json.loads(row["payload"])
+
+    # ------------------------------------------------------------------
+    # 既存JSONデータの取り込み
+    # ------------------------------------------------------------------
+    def is_empty(self) -> bool:
+        """スコア・参加者数・体験ログがすべて空かどうか"""
+        conn = self._connect()
+        for table in ("scores", "participant_daily", "sessions"):
+            if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    def json_imported(self) -> bool:
+        """ローカルJSONの取り込みを済ませたかどうか"""
+        row = self._connect().execute(
+            "SELECT 1 FROM meta WHERE key = ?", (JSON_IMPORTED_KEY,)
+        ).fetchone()
+        return row is not None
+
+    def mark_json_imported(self) -> None:
+        """取り込まずに取り込み済みとして記録する（以前の版で取り込み済みのDB向け）"""
+        self._connect().execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES (?, datetime('now'))", (JSON_IMPORTED_KEY,)
+        )
+
+    def import_json(self, leaderboard: Iterable[Dict], daily_counts: Dict[str, int],
+                    sessions: Optional[Iterator[Dict]] = None) -> int:
+        """ローカルJSONのデータを一括で取り込む（初回切り替え時）
+
+        旧形式のスコア（total_score）は score として取り込み、スコアか記録時刻の無い行は
+        飛ばす。同じ entry_id のスコアは1件だけ取り込む。飛ばした行の数を返す。
+        取り込みと同じトランザクションで取り込み済みを記録し、記録済みなら何もしない
+        （同時に起動した他のプロセスが先に取り込んだ場合も二重に加算しない）。
+        """
+        rows, skipped = [], 0
+        for entry in leaderboard:
+            entry = _legacy_score(entry)
+            if entry is None:
+                skipped += 1
+            else:
+                rows.append(_score_row(entry))
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (JSON_IMPORTED_KEY,)).fetchone():
+                conn.execute("ROLLBACK")
+                return 0
+            conn.executemany(_INSERT_SCORE.replace("INSERT", "INSERT OR IGNORE", 1), rows)
+            conn.executemany(
+                "INSERT INTO participant_daily (day, count) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET count = count + excluded.count",
+                list(daily_counts.items()),
+            )
+            conn.executemany(_INSERT_SESSION, (_session_row(entry) for entry in sessions or []))
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES (?, datetime('now'))", (JSON_IMPORTED_KEY,)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if skipped:
+            print(f"SQLite import: skipped {skipped} score rows without score/timestamp")
+        return skipped
+
+
+_sqlite_stores: Dict[str, SQLiteStore] = {}
+_sqlite_stores_lock = threading.Lock()
+
+
+def get_sqlite_store(path: str = SQLITE_FILE) -> SQLiteStore:
+    """パスごとのSQLiteStoreインスタンスを取得"""
+    with _sqlite_stores_lock:
+        store = _sqlite_stores.get(path)
+        if store is None:
+            store = _sqlite_stores[path] = SQLiteStore(path)
+        return store
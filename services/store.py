@@ -1,160 +1,182 @@
 """
 データ保存サービス（Firebase Firestore優先、ローカルJSON Fallback）
+
+実際の保存先は services.backends の StorageBackend で、
+data/settings.json の storage セクションに従って組み立てる。
 """
 import json
 import os
+import uuid
+from collections import Counter
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 import streamlit as st
-from services.firebase import get_firebase_service
+from services.atomic_io import ensure_json_file, update_json
+from services.config import get_config_service
+from services.backends import (
+    StorageBackend, build_backend,
+    LEADERBOARD_FILE, PARTICIPANTS_FILE, SETTINGS_FILE,
+    BACKEND_JSON, BACKEND_SQLITE, LOCAL_BACKENDS, get_outbox_replayer,
+)
+from services.session_log import get_session_log, SESSION_LOG_FILE
+from services.leaderboard import get_leaderboard_index
+from services.rank_index import DEFAULT_EVENT_ID, Partition, ScoreRange
+from services.write_queue import get_write_queue
+
+SESSIONS_FILE = SESSION_LOG_FILE
 
-# データファイルのパス
-LEADERBOARD_FILE = "data/leaderboard.json"
-PARTICIPANTS_FILE = "data/participants.json"
-SETTINGS_FILE = "data/settings.json"
-SESSIONS_FILE = "data/game_sessions.json"
+# 書き込みキューの種類
+WRITE_SCORE = "score"
+WRITE_PARTICIPANT = "participant"
+WRITE_SESSION = "session"
 
 def ensure_data_files():
     """データファイルが存在することを確認"""
     os.makedirs("data", exist_ok=True)
     
     # リーダーボードファイル
-    if not os.path.exists(LEADERBOARD_FILE):
-        with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
+    ensure_json_file(LEADERBOARD_FILE, list)
     
     # 参加者カウントファイル
-    if not os.path.exists(PARTICIPANTS_FILE):
-        with open(PARTICIPANTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"total_count": 0, "daily_counts": {}}, f, ensure_ascii=False, indent=2)
+    ensure_json_file(PARTICIPANTS_FILE, lambda: {"total_count": 0, "daily_counts": {}})
     
     # 設定ファイル
-    if not os.path.exists(SETTINGS_FILE):
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"staff_pin": "0418", "current_board": "5plus"}, f, ensure_ascii=False, indent=2)
+    ensure_json_file(SETTINGS_FILE, lambda: {"staff_pin": "0418", "current_board": "5plus"})
     
-    # セッションログファイル
-    if not os.path.exists(SESSIONS_FILE):
-        with open(SESSIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
+    # セッションログ（旧JSON配列形式からの移行も行う）
+    get_session_log().migrate_legacy()
+
+def _storage_settings() -> Dict:
+    """settings.json の storage セクションを取得（設定サービスの共有の解析結果）"""
+    return get_config_service().settings.get("storage", {}) or {}
+
+def get_local_backend_name() -> str:
+    """ローカル保存先の種類を返す（"json" / "sqlite" / "memory"）"""
+    backend = _storage_settings().get("backend", BACKEND_JSON)
+    return backend if backend in LOCAL_BACKENDS else BACKEND_JSON
+
+def _write_behind_enabled() -> bool:
+    """storage.write_behind が有効なら保存をバックグラウンドで行う"""
+    return bool(_storage_settings().get("write_behind", False))
+
+_backend: Optional[StorageBackend] = None
+_backend_config: Optional[str] = None
+_backend_storage: Optional[Dict] = None
+
+def get_storage_backend() -> StorageBackend:
+    """設定に従った保存先を返す（storage セクションが変わったら作り直す）"""
+    global _backend, _backend_config, _backend_storage
+    storage = _storage_settings()
+    if _backend is not None and storage is _backend_storage:
+        # 設定ファイルが読み直されていなければ同じ dict が返る
+        return _backend
+    config = json.dumps(storage, sort_keys=True)
+    if _backend is None or config != _backend_config:
+        if storage.get("backend", BACKEND_JSON) != BACKEND_SQLITE:
+            ensure_data_files()
+        _backend = build_backend(storage)
+        _backend_config = config
+    _backend_storage = storage
+    return _backend
+
+def get_local_backend() -> StorageBackend:
+    """ローカル保存先を返す（Firestore 優先の場合は複製先）"""
+    backend = get_storage_backend()
+    return getattr(backend, "mirror", backend)
+
+def _build_score_entry(player_data: Dict) -> Dict:
+    """リーダーボード用のスコアエントリを作成"""
+    teeth_count = player_data.get("teeth_count", 0)
+    tooth_coins = player_data.get("tooth_coins", 0)
+    return {
+        "entry_id": player_data.get("entry_id") or uuid.uuid4().hex,
+        "event_id": player_data.get("event_id") or DEFAULT_EVENT_ID,
+        "player_name": player_data.get("player_name", "匿名"),
+        "participant_age": player_data.get("participant_age"),
+        "age_group": player_data.get("age_group", ""),
+        "teeth_count": teeth_count,
+        "tooth_coins": tooth_coins,
+        "play_time": player_data.get("play_time", "0分0秒"),
+        "timestamp": player_data.get("timestamp") or datetime.now().isoformat(),
+        "score": teeth_count * 10 + tooth_coins  # 合計スコア
+    }
 
 def save_score(player_data: Dict) -> bool:
-    """スコアをリーダーボードに保存（Firebase優先、ローカルJSONフォールバック）"""
-    # Firebase に保存を試みる
-    firebase = get_firebase_service()
-    firebase_success = firebase.save_player_score(player_data)
+    """スコアをリーダーボードに保存（Firebase優先、ローカルJSON/SQLiteフォールバック）
     
-    # Firebase 保存に成功した場合は、ローカルにもバックアップ
-    # 失敗した場合は、ローカルのみ保存
-    if firebase_success:
-        print("✓ Score saved to Firebase")
-    else:
-        print("⚠ Firebase unavailable, using local JSON")
+    player_data に entry_id / timestamp が無ければここで採番し、
+    呼び出し元が順位を問い合わせられるよう player_data にも書き戻す。
+    """
+    player_data.setdefault("entry_id", uuid.uuid4().hex)
+    player_data.setdefault("timestamp", datetime.now().isoformat())
+    score_entry = _build_score_entry(player_data)
+    
+    if _write_behind_enabled():
+        # 保存はワーカースレッドに任せてすぐに戻る
+        get_write_queue().submit(WRITE_SCORE, score_entry)
+        return True
     
-    # ローカルJSONにも保存（バックアップ）
     try:
-        ensure_data_files()
-        
-        # 既存のデータを読み込み
-        with open(LEADERBOARD_FILE, 'r', encoding='utf-8') as f:
-            leaderboard = json.load(f)
-        
-        # 新しいスコアを追加
-        score_entry = {
-            "player_name": player_data.get("player_name", "匿名"),
-            "age_group": player_data.get("age_group", ""),
-            "teeth_count": player_data.get("teeth_count", 0),
-            "tooth_coins": player_data.get("tooth_coins", 0),
-            "play_time": player_data.get("play_time", "0分0秒"),
-            "timestamp": datetime.now().isoformat(),
-            "score": player_data.get("teeth_count", 0) * 10 + player_data.get("tooth_coins", 0)  # 合計スコア
-        }
-        
-        leaderboard.append(score_entry)
-        
-        # スコアでソート（降順）、同点の場合は先着順
-        leaderboard.sort(key=lambda x: (-x["score"], x["timestamp"]))
-        
-        # トップ100のみ保持
-        leaderboard = leaderboard[:100]
-        
-        # ファイルに保存
-        with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as f:
-            json.dump(leaderboard, f, ensure_ascii=False, indent=2)
-        
+        get_storage_backend().add_scores([score_entry])
         return True
     except Exception as e:
-        print(f"Local JSON save error: {e}")
-        return firebase_success
-
-def load_leaderboard(top_n: int = 5) -> List[Dict]:
-    """リーダーボードを読み込み（Firebase優先、ローカルJSONフォールバック）"""
-    # Firebase から読み込みを試みる
-    firebase = get_firebase_service()
-    leaderboard = firebase.get_leaderboard(limit=top_n)
-    
-    if leaderboard:
-        print(f"✓ Loaded {len(leaderboard)} scores from Firebase")
-        return leaderboard
+        print(f"Score save error: {e}")
+        return False
+
+def load_leaderboard(top_n: int = 5, event_id: Optional[str] = None,
+                     age_group: Optional[str] = None, day: Optional[str] = None) -> List[Dict]:
+    """リーダーボードを読み込み（Firebase優先、ローカルJSONフォールバック）
     
-    # Firebase から読み込めなかった場合、ローカルJSONを使用
-    print("⚠ Firebase unavailable, using local JSON")
+    event_id / age_group / day（YYYY-MM-DD）を指定するとその範囲のランキングになる。
+    """
     try:
-        ensure_data_files()
-        with open(LEADERBOARD_FILE, 'r', encoding='utf-8') as f:
-            local_data = json.load(f)
-        return local_data[:top_n]
+        return get_storage_backend().top_scores(top_n, Partition(event_id, age_group, day))
     except Exception as e:
-        print(f"Local JSON read error: {e}")
+        print(f"Leaderboard read error: {e}")
         return []
 
-def increment_participant_count() -> int:
-    """参加者数をインクリメント（Firebase優先、ローカルJSONフォールバック）"""
-    # Firebase に保存を試みる
-    firebase = get_firebase_service()
-    firebase_count = firebase.increment_participant_count()
-    
-    if firebase_count > 0:
-        print(f"✓ Participant count incremented to {firebase_count} (Firebase)")
+def get_player_rank(score: int, timestamp: str, event_id: Optional[str] = None,
+                    age_group: Optional[str] = None, day: Optional[str] = None) -> Optional[Dict]:
+    """スコアと記録時刻からゴール済みゲーム中の順位を取得（絞り込みは load_leaderboard と同じ）
     
-    # ローカルJSONにもバックアップ
+    Returns:
+        {"rank": 順位, "total": 総数, "percentile": 上位何%} または None
+    """
+    try:
+        return get_storage_backend().rank_of(score, timestamp, Partition(event_id, age_group, day))
+    except Exception as e:
+        print(f"Rank lookup error: {e}")
+        return None
+
+def get_rank_by_entry_id(entry_id: str, event_id: Optional[str] = None,
+                         age_group: Optional[str] = None, day: Optional[str] = None) -> Optional[Dict]:
+    """save_score で保存したエントリの順位を取得"""
+    try:
+        return get_storage_backend().rank_by_entry_id(entry_id, Partition(event_id, age_group, day))
+    except Exception as e:
+        print(f"Rank lookup error: {e}")
+        return None
+
+def increment_participant_count() -> int:
+    """参加者数をインクリメントして累計を返す（Firebase優先、ローカルJSONフォールバック）"""
     try:
-        ensure_data_files()
-        
-        with open(PARTICIPANTS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # 総数をインクリメント
-        data["total_count"] += 1
-        
-        # 日別カウント
         today = datetime.now().strftime("%Y-%m-%d")
-        if today not in data["daily_counts"]:
-            data["daily_counts"][today] = 0
-        data["daily_counts"][today] += 1
-        
-        with open(PARTICIPANTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        return firebase_count if firebase_count > 0 else data["total_count"]
+        total = get_storage_backend().add_participants({today: 1})
+        print(f"✓ Participant count incremented to {total}")
+        return total
     except Exception as e:
-        print(f"Local JSON increment error: {e}")
-        return firebase_count if firebase_count > 0 else 0
+        print(f"Participant increment error: {e}")
+        return 0
 
 def get_participant_stats() -> Dict:
     """参加者統計を取得"""
     try:
-        ensure_data_files()
-        with open(PARTICIPANTS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
+        daily_counts = get_storage_backend().participant_counts()
         today = datetime.now().strftime("%Y-%m-%d")
-        today_count = data["daily_counts"].get(today, 0)
-        
         return {
-            "total": data["total_count"],
-            "today": today_count,
-            "daily_counts": data["daily_counts"]
+            "total": sum(daily_counts.values()),
+            "today": daily_counts.get(today, 0),
+            "daily_counts": daily_counts
         }
     except Exception as e:
         st.error(f"統計取得エラー: {e}")
@@ -162,13 +184,12 @@ def get_participant_stats() -> Dict:
 
 def reset_all_data():
     """全データをリセット"""
+    # 積まれている保存要求がリセット後に書き込まれないよう先に反映する
+    flush_pending_writes()
     try:
-        # 空のファイルで上書き
-        with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-        
-        with open(PARTICIPANTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"total_count": 0, "daily_counts": {}}, f, ensure_ascii=False, indent=2)
+        backend = get_storage_backend()
+        backend.clear_scores()
+        backend.reset_participants()
         
         st.success("すべてのデータがリセットされました")
         return True
@@ -179,9 +200,7 @@ def reset_all_data():
 def get_settings() -> Dict:
     """設定を取得"""
     try:
-        ensure_data_files()
-        with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return get_storage_backend().load_settings()
     except Exception as e:
         st.error(f"設定読み込みエラー: {e}")
         return {"staff_pin": "0418", "current_board": "5plus"}
@@ -189,9 +208,8 @@ def get_settings() -> Dict:
 def save_settings(settings: Dict) -> bool:
     """設定を保存"""
     try:
-        ensure_data_files()
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
+        get_storage_backend().save_settings(settings)
+        get_config_service().settings_file.invalidate()
         return True
     except Exception as e:
         st.error(f"設定保存エラー: {e}")
@@ -219,20 +237,16 @@ def save_game_result(result_data: Dict) -> bool:
     """ゲーム結果をリーダーボードに保存"""
     try:
         ensure_data_files()
+        index = get_leaderboard_index(LEADERBOARD_FILE)
+        index.flush()
         
-        # リーダーボードを読み込み
-        with open(LEADERBOARD_FILE, 'r', encoding='utf-8') as f:
-            leaderboard = json.load(f)
-        
-        # 新しい結果を追加
-        leaderboard.append(result_data)
-        
-        # スコア順でソート（降順）
-        leaderboard.sort(key=lambda x: x['total_score'], reverse=True)
-        
-        # ファイルに保存
-        with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as f:
-            json.dump(leaderboard, f, ensure_ascii=False, indent=2)
+        # リーダーボードを読み込み、新しい結果を追加して保存
+        with update_json(LEADERBOARD_FILE, list) as leaderboard:
+            leaderboard.append(result_data)
+            
+            # スコア順でソート（降順）
+            leaderboard.sort(key=lambda x: x['total_score'], reverse=True)
+        index.reload()
         
         return True
     
@@ -244,6 +258,7 @@ def get_leaderboard(limit: int = 10) -> List[Dict]:
     """リーダーボードを取得"""
     try:
         ensure_data_files()
+        get_leaderboard_index(LEADERBOARD_FILE).flush()
         
         with open(LEADERBOARD_FILE, 'r', encoding='utf-8') as f:
             leaderboard = json.load(f)
@@ -257,32 +272,53 @@ def get_leaderboard(limit: int = 10) -> List[Dict]:
         st.error(f"リーダーボード読み込みエラー: {e}")
         return []
 
-def clear_leaderboard() -> bool:
-    """リーダーボードをクリア（Firebaseとローカル両方）"""
-    success = True
-    
-    # Firebaseのクリアを試みる
-    firebase = get_firebase_service()
-    if not firebase.clear_leaderboard():
-        print("⚠ Firebase leaderboard clear failed or skipped")
-        # Firebaseが失敗してもローカルはクリアするが、完全な成功とは言えないかも
-        # しかし、ユーザーの意図としては「消せるだけ消す」なので続行
+def clear_leaderboard(event_id: Optional[str] = None, start_day: Optional[str] = None,
+                      end_day: Optional[str] = None,
+                      progress: Optional[Callable[[int, Optional[int]], None]] = None) -> bool:
+    """リーダーボードをクリア（Firebaseとローカル両方）
     
+    event_id / start_day / end_day（YYYY-MM-DD、両端を含む）を指定すると、その範囲のスコアだけを削除する。
+    progress(削除済み件数, 全体の件数) は Firestore の削除の進み具合を受け取る。
+    """
+    flush_pending_writes()
     try:
-        with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-        print("✓ Local leaderboard cleared")
+        # Firebaseが失敗してもローカルはクリアする（「消せるだけ消す」）
+        get_storage_backend().clear_scores(ScoreRange(event_id, start_day, end_day), progress)
+        print("✓ Leaderboard cleared")
+        return True
     except Exception as e:
         st.error(f"リーダーボードクリアエラー: {e}")
-        success = False
-        
-    return success
+        return False
+
+def rebuild_leaderboard_aggregates() -> int:
+    """Firestore のランキング集計ドキュメントを scores から作り直し、件数を返す（失敗時は -1）"""
+    from services.firebase import get_firebase_service
+    return get_firebase_service().rebuild_leaderboard_aggregates()
+
+def get_leaderboard_mirror_status() -> Optional[Dict]:
+    """ランキングの写し（Firestore のリスナー）の状態（使っていなければ None）"""
+    from services.firebase import get_firebase_service
+    mirror = get_firebase_service().mirror
+    return mirror.status() if mirror is not None else None
+
+def import_offline_records(files: List[Tuple[str, bytes]], scores_from_sessions: bool = False,
+                           progress: Optional[Callable[[int, Optional[int]], None]] = None):
+    """端末ごとに記録したスコア・体験ログのファイルを Firestore に取り込み、IngestReport を返す
+    
+    files は (ファイル名, 中身) の列。Firestore に接続できなければ None を返す。
+    """
+    from services.firebase import get_firebase_service
+    from services.ingest import ingest_files
+    service = get_firebase_service()
+    if not service.initialize():
+        return None
+    return ingest_files(service, files, scores_from_sessions=scores_from_sessions, progress=progress)
 
 def reset_participant_count() -> bool:
     """参加者数をリセット"""
+    flush_pending_writes()
     try:
-        with open(PARTICIPANTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"total_count": 0, "daily_counts": {}}, f, ensure_ascii=False, indent=2)
+        get_storage_backend().reset_participants()
         return True
     except Exception as e:
         st.error(f"参加者数リセットエラー: {e}")
@@ -291,25 +327,12 @@ def reset_participant_count() -> bool:
 def update_participant_count() -> bool:
     """参加者数を更新"""
     try:
-        ensure_data_files()
-        
-        # 現在のデータを読み込み
-        with open(PARTICIPANTS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # 総数を増加
-        data['total_count'] += 1
-        
-        # 今日の日付で増加
         today = datetime.now().strftime('%Y-%m-%d')
-        if today not in data['daily_counts']:
-            data['daily_counts'][today] = 0
-        data['daily_counts'][today] += 1
-        
-        # ファイルに保存
-        with open(PARTICIPANTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        if _write_behind_enabled():
+            get_write_queue().submit(WRITE_PARTICIPANT, {"day": today})
+            return True
         
+        get_storage_backend().add_participants({today: 1})
         return True
     
     except Exception as e:
@@ -317,21 +340,72 @@ def update_participant_count() -> bool:
         return False
 
 def log_player_session(session_data: Dict) -> bool:
-    """参加者ごとの体験ログを保存"""
+    """参加者ごとの体験ログを保存（JSON Linesに1行追記）"""
     try:
-        ensure_data_files()
-        with open(SESSIONS_FILE, 'r', encoding='utf-8') as f:
-            sessions = json.load(f)
-        
         entry = {
             "timestamp": datetime.now().isoformat(),
             **session_data,
         }
-        sessions.append(entry)
-        
-        with open(SESSIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(sessions, f, ensure_ascii=False, indent=2)
+        if _write_behind_enabled():
+            get_write_queue().submit(WRITE_SESSION, entry)
+            return True
+        get_storage_backend().append_sessions([entry])
         return True
     except Exception as e:
         st.error(f"セッションログ保存エラー: {e}")
         return False
+
+def iter_player_sessions() -> Iterator[Dict]:
+    """体験ログを古い順に1件ずつ返す（ローテーション済みセグメントを含む）"""
+    return get_storage_backend().iter_sessions()
+
+# ----------------------------------------------------------------------
+# 書き込みキュー（storage.write_behind が有効なときに使用）
+# ----------------------------------------------------------------------
+def _write_scores(batch: List[Dict]) -> List[Dict]:
+    get_storage_backend().add_scores(batch)
+    return []
+
+def _write_participants(batch: List[Dict]) -> List[Dict]:
+    # 同じ日の加算はまとめて1回の書き込みにする
+    get_storage_backend().add_participants(dict(Counter(item["day"] for item in batch)))
+    return []
+
+def _write_sessions(batch: List[Dict]) -> List[Dict]:
+    get_storage_backend().append_sessions(batch)
+    return []
+
+def _register_write_handlers() -> None:
+    queue = get_write_queue()
+    queue.register_handler(WRITE_SCORE, _write_scores)
+    queue.register_handler(WRITE_PARTICIPANT, _write_participants)
+    queue.register_handler(WRITE_SESSION, _write_sessions)
+
+_register_write_handlers()
+
+def get_pending_write_count() -> int:
+    """書き込みキューに残っている保存要求の数（スタッフ画面表示用）"""
+    return get_write_queue().depth()
+
+def flush_pending_writes(timeout: float = 10.0) -> bool:
+    """書き込みキューの保存要求を反映し終えるまで待つ"""
+    return get_write_queue().flush(timeout)
+
+def get_outbox_size() -> int:
+    """Firestore に送れず Outbox に残っている書き込みの数（スタッフ画面表示用）"""
+    try:
+        outbox = getattr(get_storage_backend(), "outbox", None)
+        return outbox.size() if outbox is not None else 0
+    except Exception as e:
+        print(f"Outbox size error: {e}")
+        return 0
+
+def retry_outbox_now() -> None:
+    """Outbox の書き込みを待ち時間なしですぐに再送する"""
+    outbox = getattr(get_storage_backend(), "outbox", None)
+    if outbox is None:
+        return
+    outbox.retry_now()
+    replayer = get_outbox_replayer()
+    if replayer is not None:
+        replayer.wake()
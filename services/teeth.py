@@ -565,10 +565,9 @@ def load_teeth_json() -> dict:
 
 def save_teeth_json(teeth_data: dict):
     """data/teeth.jsonに保存"""
-    import json
+    from services.atomic_io import write_json
     teeth_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'teeth.json')
-    with open(teeth_file, 'w', encoding='utf-8') as f:
-        json.dump(teeth_data, f, ensure_ascii=False, indent=2)
+    write_json(teeth_file, teeth_data)
 
 
 def get_tooth_image_filename(section: str, number: int, status: str) -> str:
@@ -0,0 +1,152 @@
+"""
+有効期限付きキャッシュ（期限切れの値を返しながら裏で更新する）
+
+Firestore の読み込みのように遅くて回数に上限がある問い合わせを、
+全セッションで共有して使い回す。期限（ttl）を過ぎた値は max_stale 秒までは
+そのまま返し、バックグラウンドスレッドで読み直す。それより古い値や
+まだ無い値は呼び出し元で読み込む（同じキーの同時読み込みは1回にまとめる）。
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+DEFAULT_TTL_SECONDS = 10.0
+DEFAULT_MAX_STALE_SECONDS = 300.0
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "version", "refreshing")
+
+    def __init__(self, value: Any, fetched_at: float, version: int):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.version = version
+        self.refreshing = False
+
+
+class StaleWhileRevalidateCache:
+    """プロセス共有のキャッシュ"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS,
+                 max_stale: float = DEFAULT_MAX_STALE_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._clock = clock
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+
+    def configure(self, ttl: Optional[float] = None, max_stale: Optional[float] = None) -> None:
+        """期限を変更する（ttl <= 0 でキャッシュしない）"""
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if max_stale is not None:
+                self.max_stale = max_stale
+
+    def _next_version(self) -> int:
+        self._version += 1
+        return self._version
+
+    def _key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """キャッシュの値を返す（無い・古すぎる場合は loader で読み込む）
+
+        loader の例外は呼び出し元にそのまま送出し、キャッシュには入れない。
+        """
+        if self.ttl <= 0:
+            return loader()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = self._clock() - entry.fetched_at
+                if age < self.ttl:
+                    return entry.value
+                if age < self.ttl + self.max_stale:
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        self._start_refresh(key, loader, entry.version)
+                    return entry.value
+
+        # 同じキーを同時に読み込まないよう、キーごとのロックの中で再確認してから読む
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and self._clock() - entry.fetched_at < self.ttl:
+                    return entry.value
+                version = self._next_version()
+            value = loader()
+            with self._lock:
+                current = self._entries.get(key)
+                if current is None or current.version <= version:
+                    self._entries[key] = _Entry(value, self._clock(), self._next_version())
+            return value
+
+    def _start_refresh(self, key: Hashable, loader: Callable[[], Any], version: int) -> None:
+        thread = threading.Thread(
+            target=self._refresh, args=(key, loader, version),
+            name=f"cache-refresh-{key}", daemon=True,
+        )
+        thread.start()
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any], version: int) -> None:
+        try:
+            value = loader()
+        except Exception as e:
+            print(f"Cache refresh failed ({key}): {e}")
+            value = None
+            failed = True
+        else:
+            failed = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refreshing = False
+            # 読み込み中に書き込みで更新・削除された値は上書きしない（次回の取得で読み直す）
+            if failed or entry.version != version:
+                return
+            self._entries[key] = _Entry(value, self._clock(), self._next_version())
+
+    def peek(self, key: Hashable) -> Any:
+        """期限に関係なくキャッシュの値を返す（無ければ None）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """値を入れる（読み込み直後と同じ扱い）"""
+        with self._lock:
+            self._entries[key] = _Entry(value, self._clock(), self._next_version())
+
+    def update_all(self, updater: Callable[[Hashable, Any], Any]) -> None:
+        """全キーの値をその場で書き換える（書き込み後の反映用、期限は延ばさない）
+
+        updater(key, value) は新しい値を返す。同じ値（is）を返したキーは変更しない。
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                value = updater(key, entry.value)
+                if value is not entry.value:
+                    entry.value = value
+                    entry.version = self._next_version()
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """key（省略時はすべて）を削除する"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
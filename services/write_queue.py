@@ -0,0 +1,202 @@
+"""
+書き込みの後回しキュー（write-behind）
+
+Streamlit のスクリプトスレッドからは保存要求を積むだけにして、
+ワーカースレッドがまとめて保存する。種類ごとにハンドラを登録し、
+ハンドラが失敗を返した要求は指数バックオフで再試行する。
+"""
+import atexit
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+# ハンドラは同じ種類の要求をまとめて受け取り、再試行したい payload を返す
+BatchHandler = Callable[[List[Dict]], List[Dict]]
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+
+
+@dataclass
+class WriteJob:
+    kind: str
+    payload: Dict
+    attempts: int = 0
+    not_before: float = 0.0
+    seq: int = field(default=0, compare=False)
+
+
+class WriteBehindQueue:
+    """プロセス共有の書き込みキュー"""
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_backoff: float = DEFAULT_BASE_BACKOFF,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF):
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._handlers: Dict[str, BatchHandler] = {}
+        self._incoming: "queue.Queue[WriteJob]" = queue.Queue()
+        self._delayed: List = []  # (not_before, seq, job) のヒープ
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pending = 0  # 積まれてからまだ完了・破棄されていない要求数
+        self._stopping = False
+        self._worker: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    # ------------------------------------------------------------------
+    # 公開API
+    # ------------------------------------------------------------------
+    def register_handler(self, kind: str, handler: BatchHandler) -> None:
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, payload: Dict) -> None:
+        """保存要求を積む（すぐに戻る）"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown write kind: {kind}")
+        with self._cond:
+            self._pending += 1
+        self._incoming.put(WriteJob(kind, payload, seq=next(self._seq)))
+        self._ensure_worker()
+
+    def depth(self) -> int:
+        """未処理の要求数（再試行待ち・処理中を含む）"""
+        with self._cond:
+            return self._pending
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """再試行待ちを除く未処理の要求がなくなるまで待つ"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending - len(self._delayed) > 0:
+                if self._worker is None or not self._worker.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=0.05 if remaining is None else min(remaining, 0.05))
+        return True
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """残りを書き出してワーカーを止める（再試行待ちは即時に1回だけ試す）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        # ワーカーが動いていない場合もここで処理する
+        self._drain(final=True)
+
+    # ------------------------------------------------------------------
+    # ワーカー
+    # ------------------------------------------------------------------
+    def _ensure_worker(self) -> None:
+        with self._cond:
+            if self._stopping:
+                return
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopping:
+                    break
+                timeout = 0.5
+                if self._delayed:
+                    timeout = max(0.0, min(timeout, self._delayed[0][0] - time.monotonic()))
+            try:
+                job = self._incoming.get(timeout=timeout)
+                self._process([job] + self._take_incoming(self.batch_size - 1))
+            except queue.Empty:
+                self._process([])
+        self._drain(final=True)
+
+    def _take_incoming(self, limit: int) -> List[WriteJob]:
+        jobs = []
+        while len(jobs) < limit:
+            try:
+                jobs.append(self._incoming.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _take_ready_delayed(self, final: bool) -> List[WriteJob]:
+        now = time.monotonic()
+        jobs = []
+        with self._cond:
+            while self._delayed and (final or self._delayed[0][0] <= now):
+                jobs.append(heapq.heappop(self._delayed)[2])
+        return jobs
+
+    def _process(self, jobs: List[WriteJob], final: bool = False) -> None:
+        jobs = jobs + self._take_ready_delayed(final)
+        if not jobs:
+            return
+        by_kind: Dict[str, List[WriteJob]] = {}
+        for job in jobs:
+            by_kind.setdefault(job.kind, []).append(job)
+        for kind, kind_jobs in by_kind.items():
+            done = self._dispatch(kind, kind_jobs, final)
+            with self._cond:
+                self._pending -= done
+                self._cond.notify_all()
+
+    def _dispatch(self, kind: str, jobs: List[WriteJob], final: bool) -> int:
+        """ハンドラを呼び出し、完了（または破棄）した要求数を返す"""
+        handler = self._handlers[kind]
+        try:
+            failed = handler([job.payload for job in jobs]) or []
+        except Exception as e:
+            print(f"Write-behind handler error ({kind}): {e}")
+            failed = [job.payload for job in jobs]
+        failed_ids = {id(p) for p in failed}
+        done = 0
+        for job in jobs:
+            if id(job.payload) not in failed_ids:
+                done += 1
+                continue
+            job.attempts += 1
+            if final or job.attempts > self.max_retries:
+                self.dropped += 1
+                done += 1
+                print(f"Write-behind gave up ({kind}) after {job.attempts} attempts")
+                continue
+            delay = min(self.max_backoff, self.base_backoff * (2 ** (job.attempts - 1)))
+            job.not_before = time.monotonic() + delay * random.uniform(0.8, 1.2)
+            with self._cond:
+                heapq.heappush(self._delayed, (job.not_before, job.seq, job))
+        return done
+
+    def _drain(self, final: bool) -> None:
+        """キューに残っているものをすべて処理する"""
+        while True:
+            jobs = self._take_incoming(self.batch_size)
+            if not jobs and not self._delayed:
+                return
+            self._process(jobs, final=final)
+
+
+_write_queue = WriteBehindQueue()
+
+
+def get_write_queue() -> WriteBehindQueue:
+    """書き込みキューのインスタンスを取得"""
+    return _write_queue
+
+
+@atexit.register
+def _flush_on_shutdown() -> None:
+    """プロセス終了時に未処理の書き込みを反映する"""
+    _write_queue.shutdown()
@@ -7,3 +7,18 @@ import os
 
 # プロジェクトルートをパスに追加
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture
+def client():
+    """Firestore の代わりのインメモリクライアント"""
+    from services import fake_firestore
+    return fake_firestore.FakeFirestoreClient(seed=0)
+
+
+@pytest.fixture
+def service(client):
+    """client につないだ FirebaseService（キャッシュ設定などは各テストファイルで上書きする）"""
+    from services import fake_firestore
+    from services.firebase import FirebaseService
+    return FirebaseService(client=client, firestore_module=fake_firestore)
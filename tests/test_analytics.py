@@ -0,0 +1,176 @@
+"""
+Tests for services/analytics.py
+"""
+import json
+import pytest
+from services import analytics as analytics_module
+from services.analytics import (
+    SessionAnalytics, get_session_analytics, records_to_columns, hourly_throughput,
+)
+from services.backends import SQLiteBackend
+from services.session_log import SessionLog
+from services.sqlite_store import SQLiteStore
+
+
+def _session(n, age_group="5plus", hour=10, **kwargs):
+    record = {
+        "timestamp": f"2025-01-31T{hour:02d}:{n % 60:02d}:00",
+        "session_id": f"s{n}",
+        "age_group": age_group,
+        "participant_age": 3 if age_group == "under5" else 6,
+        "teeth_count": 20,
+        "tooth_coins": 100 * n,
+        "turn_count": 10,
+        "play_time": f"{n}分0秒",
+        "reached_goal": True,
+        "caries_correct": 1,
+        "perio_correct": 2,
+        "final_position": 30,
+    }
+    record.update(kwargs)
+    return record
+
+
+@pytest.fixture
+def quiz_file(tmp_path):
+    for quiz in ("caries", "perio"):
+        for group in ("under5", "5plus"):
+            with open(tmp_path / f"quiz_{quiz}_{group}.json", 'w', encoding='utf-8') as f:
+                json.dump({"questions": [{}, {}]}, f)
+    return str(tmp_path / "quiz_{quiz}_{age_group}.json")
+
+
+@pytest.fixture
+def log(tmp_path):
+    return SessionLog(path=str(tmp_path / "game_sessions.jsonl"), legacy_path=None, rotate_daily=False)
+
+
+def _analytics(tmp_path, log, quiz_file):
+    return SessionAnalytics(log, cache_path=str(tmp_path / "analytics.npz"), quiz_file=quiz_file)
+
+
+class TestIngest:
+    """取り込みのテスト"""
+
+    def test_only_new_rows_are_ingested(self, tmp_path, log, quiz_file):
+        """前回取り込んだ行は読み直さない"""
+        analytics = _analytics(tmp_path, log, quiz_file)
+        log.append_many([_session(1), _session(2)])
+        assert analytics.ingest() == 2
+        assert analytics.ingest() == 0
+        log.append(_session(3))
+        assert analytics.ingest() == 1
+        assert len(analytics) == 3
+
+    def test_cache_survives_restart(self, tmp_path, log, quiz_file):
+        """再起動後はキャッシュから読み、追記分だけ取り込む"""
+        log.append_many([_session(1), _session(2)])
+        _analytics(tmp_path, log, quiz_file).ingest()
+        log.append(_session(3))
+        analytics = _analytics(tmp_path, log, quiz_file)
+        assert analytics.ingest() == 1
+        assert analytics.columns(refresh=False)["tooth_coins"].tolist() == [100, 200, 300]
+
+    def test_rotation_does_not_duplicate_rows(self, tmp_path, log, quiz_file):
+        """ローテーションで圧縮されたセグメントの取り込み済み行は数えない"""
+        analytics = _analytics(tmp_path, log, quiz_file)
+        log.append_many([_session(1), _session(2)])
+        analytics.ingest()
+        log.append(_session(3))
+        log.rotate()
+        log.append(_session(4))
+        assert analytics.ingest() == 2
+        assert analytics.columns(refresh=False)["tooth_coins"].tolist() == [100, 200, 300, 400]
+
+    def test_reset_log_rebuilds_cache(self, tmp_path, log, quiz_file):
+        """ログが退避されたらキャッシュも作り直す"""
+        analytics = _analytics(tmp_path, log, quiz_file)
+        log.append_many([_session(1), _session(2)])
+        analytics.ingest()
+        log.archive()
+        log.append(_session(5))
+        analytics.ingest()
+        assert analytics.columns(refresh=False)["tooth_coins"].tolist() == [500]
+
+    def test_partial_line_is_left_for_next_time(self, tmp_path, log, quiz_file):
+        """改行で終わっていない書き込み途中の行は次回に回す"""
+        analytics = _analytics(tmp_path, log, quiz_file)
+        log.append(_session(1))
+        line = json.dumps(_session(2))
+        with open(log.path, 'a', encoding='utf-8') as f:
+            f.write(line[:10])
+        assert analytics.ingest() == 1
+        with open(log.path, 'a', encoding='utf-8') as f:
+            f.write(line[10:] + "\n")
+        assert analytics.ingest() == 1
+
+
+class TestBackendSource:
+    """SQLite など JSON 以外の保存先からの取り込みのテスト"""
+
+    @pytest.fixture
+    def backend(self, tmp_path):
+        store = SQLiteStore(str(tmp_path / "test.db"))
+        yield SQLiteBackend(store, settings_path=str(tmp_path / "settings.json"))
+        store.close()
+
+    def test_only_new_rows_are_ingested(self, tmp_path, backend, quiz_file):
+        """保存先の体験ログも、取り込み済みの件数から続きだけを読む"""
+        backend.append_sessions([_session(1), _session(2)])
+        analytics = SessionAnalytics(cache_path=str(tmp_path / "analytics.npz"),
+                                     quiz_file=quiz_file, source=backend)
+        assert analytics.ingest() == 2
+        assert analytics.ingest() == 0
+        backend.append_sessions([_session(3)])
+        restarted = SessionAnalytics(cache_path=str(tmp_path / "analytics.npz"),
+                                     quiz_file=quiz_file, source=backend)
+        assert restarted.ingest() == 1
+        assert restarted.summary(refresh=False)["sessions"] == 3
+
+    def test_follows_local_backend(self, tmp_path, backend, monkeypatch):
+        """ローカル保存先が SQLite ならセッションログではなく SQLite を集計する"""
+        monkeypatch.setattr(analytics_module, "BACKEND_CACHE_FILE", str(tmp_path / "analytics_{backend}.npz"))
+        monkeypatch.setattr(analytics_module, "_backend_analytics", {})
+        backend.append_sessions([_session(1)])
+        analytics = get_session_analytics(backend)
+        assert analytics is not analytics_module._analytics
+        assert analytics.summary()["sessions"] == 1
+
+
+class TestAggregates:
+    """集計のテスト"""
+
+    def test_summary(self, tmp_path, log, quiz_file):
+        """プレイ時間・正答率・時間帯別の集計"""
+        log.append_many([
+            _session(1, hour=10),
+            _session(2, hour=10, age_group="under5", caries_correct=2, perio_correct=0),
+            _session(3, hour=14, reached_goal=False),
+            _session(4, hour=15, timestamp="2025-02-01T15:00:00"),
+        ])
+        analytics = _analytics(tmp_path, log, quiz_file)
+        stats = analytics.summary()
+        assert stats["sessions"] == 4
+        assert stats["goal_rate"] == 0.75
+        assert stats["play_time"][50] == 150.0
+        assert stats["correctness"]["under5"] == {"sessions": 1, "caries": 1.0, "perio": 0.0}
+        assert stats["correctness"]["5plus"]["caries"] == 0.5
+        assert stats["hourly"][10] == 2
+        assert sum(stats["coins"]["counts"]) == 4
+        assert analytics.summary(day="2025-02-01")["sessions"] == 1
+
+    def test_play_time_from_start_time(self):
+        """プレイ時間が無い場合は開始・終了時刻から求める"""
+        columns = records_to_columns([{
+            "timestamp": "2025-01-31T10:05:30",
+            "start_time": "2025-01-31T10:00:00",
+            "play_time": "0分0秒",
+        }])
+        assert columns["play_seconds"].tolist() == [330]
+        assert columns["age_group"].tolist() == [-1]
+
+    def test_missing_timestamp_is_not_counted_per_hour(self):
+        """時刻の無いレコードは時間帯別の集計に含めない"""
+        columns = records_to_columns([{"timestamp": None}, {"timestamp": "2025-01-31T09:00:00"}])
+        assert hourly_throughput(columns)[9] == 1
+        assert sum(hourly_throughput(columns)) == 1
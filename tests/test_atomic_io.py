@@ -0,0 +1,107 @@
+"""
+Tests for services/atomic_io.py
+"""
+import json
+import multiprocessing
+import os
+import threading
+import pytest
+from services.atomic_io import (
+    FileLockTimeout, atomic_write_json, ensure_json_file, file_lock, update_json, write_json,
+)
+
+
+def _increment_many(path, times):
+    for _ in range(times):
+        with update_json(path, lambda: {"count": 0}) as data:
+            data["count"] += 1
+
+
+class TestAtomicWrite:
+    """アトミック書き込みのテスト"""
+
+    def test_write_leaves_no_temp_files(self, tmp_path):
+        """書き込み後に一時ファイルが残らない"""
+        path = tmp_path / "data.json"
+        write_json(str(path), {"a": 1})
+        atomic_write_json(str(path), {"a": 2})
+        assert json.loads(path.read_text(encoding='utf-8')) == {"a": 2}
+        assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+    def test_failed_serialization_keeps_old_file(self, tmp_path):
+        """書き込みに失敗しても元のファイルは壊れない"""
+        path = tmp_path / "data.json"
+        write_json(str(path), {"a": 1})
+        with pytest.raises(TypeError):
+            write_json(str(path), {"a": object()})
+        assert json.loads(path.read_text(encoding='utf-8')) == {"a": 1}
+
+    def test_ensure_json_file_does_not_overwrite(self, tmp_path):
+        """既存ファイルは初期値で上書きしない"""
+        path = tmp_path / "data.json"
+        write_json(str(path), {"a": 1})
+        ensure_json_file(str(path), dict)
+        assert json.loads(path.read_text(encoding='utf-8')) == {"a": 1}
+
+
+class TestUpdateJson:
+    """ロック付き更新のテスト"""
+
+    def test_corrupt_file_is_not_overwritten(self, tmp_path):
+        """壊れたファイルは例外を出して上書きしない"""
+        path = tmp_path / "data.json"
+        path.write_text("{broken", encoding='utf-8')
+        with pytest.raises(json.JSONDecodeError):
+            with update_json(str(path), dict):
+                pass
+        assert path.read_text(encoding='utf-8') == "{broken"
+
+    def test_concurrent_threads_do_not_lose_updates(self, tmp_path):
+        """複数スレッドからの更新を取りこぼさない"""
+        path = str(tmp_path / "count.json")
+        threads = [threading.Thread(target=_increment_many, args=(path, 20)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        with open(path, encoding='utf-8') as f:
+            assert json.load(f) == {"count": 80}
+
+    @pytest.mark.skipif(os.name != "posix", reason="fcntl が必要")
+    def test_concurrent_processes_do_not_lose_updates(self, tmp_path):
+        """複数プロセスからの更新を取りこぼさない"""
+        path = str(tmp_path / "count.json")
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=_increment_many, args=(path, 20)) for _ in range(3)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(30)
+        with open(path, encoding='utf-8') as f:
+            assert json.load(f) == {"count": 60}
+
+
+class TestFileLock:
+    """ロック待ちのテスト"""
+
+    def test_lock_wait_is_bounded(self, tmp_path):
+        """ロックが取れなければ上限時間で FileLockTimeout"""
+        path = str(tmp_path / "data.json")
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def holder():
+            with file_lock(path):
+                acquired.set()
+                release.wait(5)
+
+        t = threading.Thread(target=holder)
+        t.start()
+        acquired.wait(5)
+        try:
+            with pytest.raises(FileLockTimeout):
+                with file_lock(path, timeout=0.1):
+                    pass
+        finally:
+            release.set()
+            t.join()
@@ -0,0 +1,218 @@
+"""
+Tests for services/backends.py
+"""
+import pytest
+from services import backends
+from services.backends import (
+    BackendUnavailable, JSONBackend, MemoryBackend, MirroredBackend, SQLiteBackend, build_local_backend,
+)
+from services.rank_index import Partition, ScoreRange
+from services.sqlite_store import SQLiteStore
+from services.write_queue import WriteBehindQueue
+
+
+def _entry(name, score, timestamp):
+    return {"entry_id": f"{name}-{timestamp}", "player_name": name, "score": score,
+            "teeth_count": 0, "tooth_coins": score, "timestamp": timestamp}
+
+
+@pytest.fixture(params=["memory", "json", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryBackend()
+    elif request.param == "json":
+        yield _json_backend(tmp_path)
+    else:
+        store = SQLiteStore(str(tmp_path / "test.db"))
+        yield SQLiteBackend(store, settings_path=str(tmp_path / "settings.json"))
+        store.close()
+
+
+def _json_backend(tmp_path):
+    return JSONBackend(
+        leaderboard_path=str(tmp_path / "leaderboard.json"),
+        participants_path=str(tmp_path / "participants.json"),
+        sessions_path=str(tmp_path / "sessions.jsonl"),
+        history_path=str(tmp_path / "history.jsonl"),
+        settings_path=str(tmp_path / "settings.json"),
+    )
+
+
+class TestBackendContract:
+    """どの保存先でも同じように振る舞うことのテスト"""
+
+    def test_scores_and_ranks(self, backend):
+        """スコア順の取得と順位（同点は先着が上位、同じ entry_id は1件）"""
+        backend.add_scores([_entry("b", 100, "t2"), _entry("a", 100, "t1")])
+        backend.add_scores([_entry("c", 300, "t3"), _entry("a", 100, "t1")])
+        assert [e["player_name"] for e in backend.top_scores(10)] == ["c", "a", "b"]
+        assert backend.rank_by_entry_id("b-t2") == {"rank": 3, "total": 3, "percentile": 100.0}
+        assert backend.rank_of(200, "t9")["rank"] == 2
+        backend.clear_scores()
+        assert backend.top_scores(10) == []
+
+    def test_partitioned_scores(self, backend):
+        """イベント・年齢グループ・日ごとのランキング"""
+        backend.add_scores([
+            {**_entry("a", 300, "2025-01-31T10:00:00"), "event_id": "ev", "age_group": "5plus"},
+            {**_entry("b", 200, "2025-01-31T10:01:00"), "event_id": "ev", "age_group": "under5"},
+            {**_entry("c", 100, "2025-01-31T10:02:00"), "event_id": "ev", "age_group": "under5"},
+            {**_entry("d", 400, "2025-02-01T10:00:00"), "event_id": "ev", "age_group": "under5"},
+        ])
+        scope = Partition("ev", "under5", "2025-01-31")
+        assert [e["player_name"] for e in backend.top_scores(10, scope)] == ["b", "c"]
+        assert backend.rank_by_entry_id("c-2025-01-31T10:02:00", scope) == {"rank": 2, "total": 2, "percentile": 100.0}
+        assert backend.rank_of(150, "2025-01-31T11:00:00", scope)["rank"] == 2
+        assert backend.rank_by_entry_id("c-2025-01-31T10:02:00")["rank"] == 4
+        assert backend.top_scores(10, Partition(event_id="other")) == []
+
+    def test_scoped_clear_keeps_other_scores(self, backend):
+        """イベント・期間を指定したリセットでは範囲外のスコアが残る"""
+        backend.add_scores([
+            {**_entry("a", 300, "2025-01-31T10:00:00"), "event_id": "ev"},
+            {**_entry("b", 200, "2025-02-01T10:00:00"), "event_id": "ev"},
+            {**_entry("c", 100, "2025-01-31T10:00:00"), "event_id": "other"},
+        ])
+        backend.clear_scores(ScoreRange(event_id="ev", end_day="2025-01-31"))
+        assert [e["player_name"] for e in backend.top_scores(10)] == ["b", "c"]
+        assert backend.rank_by_entry_id("a-2025-01-31T10:00:00") is None
+        assert sorted(e["player_name"] for e in backend.iter_scores()) == ["b", "c"]
+
+    def test_iter_scores_returns_all_scores(self, backend):
+        """上位件数に関係なく全スコアを記録順に返す"""
+        backend.add_scores([_entry(f"p{i}", i, f"2025-01-31T10:{i // 60:02d}:{i % 60:02d}") for i in range(120)])
+        scores = list(backend.iter_scores())
+        assert len(scores) == 120
+        assert scores[0]["player_name"] == "p0"
+
+    def test_participants(self, backend):
+        """日別の加算と累計"""
+        assert backend.add_participants({"2025-01-01": 2}) == 2
+        assert backend.add_participants({"2025-01-01": 1, "2025-01-02": 1}) == 4
+        assert backend.participant_counts() == {"2025-01-01": 3, "2025-01-02": 1}
+        backend.reset_participants()
+        assert backend.participant_counts() == {}
+
+    def test_sessions(self, backend):
+        """追加した順に体験ログを読み出せる"""
+        backend.append_sessions([{"timestamp": "t1", "session_id": "a"},
+                                 {"timestamp": "t2", "session_id": "b"}])
+        assert [s["session_id"] for s in backend.iter_sessions()] == ["a", "b"]
+
+    def test_settings(self, backend):
+        """設定の保存と読み込み"""
+        settings = backend.load_settings()
+        settings["staff_pin"] = "9999"
+        backend.save_settings(settings)
+        assert backend.load_settings()["staff_pin"] == "9999"
+
+
+class _BrokenBackend(MemoryBackend):
+    """書き込みも読み込みも失敗する保存先"""
+
+    name = "broken"
+
+    def add_scores(self, entries):
+        raise BackendUnavailable("down")
+
+    def top_scores(self, limit, partition=None):
+        raise BackendUnavailable("down")
+
+    def iter_sessions(self):
+        raise BackendUnavailable("down")
+
+
+class TestMirroredBackend:
+    """優先先 + 複製先のテスト"""
+
+    def test_writes_are_mirrored(self):
+        """優先先に書いた内容が複製先にも反映される"""
+        primary, mirror = MemoryBackend(), MemoryBackend()
+        backend = MirroredBackend(primary, mirror)
+        backend.add_scores([_entry("a", 1, "t1")])
+        assert primary.top_scores(1) == mirror.top_scores(1)
+        assert backend.name == "memory+memory"
+
+    def test_async_mirror_via_queue(self):
+        """キューを渡すと複製は非同期で行われる"""
+        queue = WriteBehindQueue()
+        primary, mirror = MemoryBackend(), MemoryBackend()
+        backend = MirroredBackend(primary, mirror, queue)
+        backend.add_participants({"2025-01-01": 1})
+        assert queue.flush(timeout=2)
+        assert mirror.participant_counts() == {"2025-01-01": 1}
+        queue.shutdown(timeout=2)
+
+    def test_falls_back_to_mirror_when_primary_fails(self):
+        """優先先が落ちていれば複製先に書き、複製先から読む"""
+        queue = WriteBehindQueue(max_retries=0)
+        mirror = MemoryBackend()
+        backend = MirroredBackend(_BrokenBackend(), mirror, queue)
+        backend.add_scores([_entry("a", 1, "t1")])
+        assert [e["player_name"] for e in mirror.top_scores(1)] == ["a"]
+        assert [e["player_name"] for e in backend.top_scores(1)] == ["a"]
+        queue.shutdown(timeout=2)
+
+    def test_iter_sessions_reads_primary_then_mirror(self):
+        """全件読み出しは優先先から、優先先が使えなければ複製先から"""
+        primary, mirror = MemoryBackend(), MemoryBackend()
+        primary.append_sessions([{"session_id": "primary"}])
+        mirror.append_sessions([{"session_id": "mirror"}])
+        assert [s["session_id"] for s in MirroredBackend(primary, mirror).iter_sessions()] == ["primary"]
+        broken = MirroredBackend(_BrokenBackend(), mirror)
+        assert [s["session_id"] for s in broken.iter_sessions()] == ["mirror"]
+
+
+class TestJSONBackendProcesses:
+    """同じデータディレクトリを使う複数プロセスのテスト"""
+
+    @staticmethod
+    def _process(tmp_path, monkeypatch):
+        """別プロセスの JSONBackend（プロセス共有のインデックスを持たない状態から作る）"""
+        from services import leaderboard, rank_index, session_log
+        monkeypatch.setattr(leaderboard, "_leaderboards", {})
+        monkeypatch.setattr(rank_index, "_rank_indexes", {})
+        monkeypatch.setattr(session_log, "_session_logs", {})
+        return _json_backend(tmp_path)
+
+    def test_partition_ranking_sees_other_writers(self, tmp_path, monkeypatch):
+        """ゴール画面の範囲（イベント・年齢グループ・日）の順位に他プロセスのスコアが入る"""
+        scope = Partition("ev", "under5", "2025-01-31")
+        a = self._process(tmp_path, monkeypatch)
+        b = self._process(tmp_path, monkeypatch)
+        a.add_scores([{**_entry("a", 100, "2025-01-31T10:00:00"), "event_id": "ev", "age_group": "under5"}])
+        b.add_scores([{**_entry("b", 200, "2025-01-31T10:01:00"), "event_id": "ev", "age_group": "under5"}])
+        assert [e["player_name"] for e in a.top_scores(10, scope)] == ["b", "a"]
+        assert a.rank_by_entry_id("a-2025-01-31T10:00:00", scope) == {"rank": 2, "total": 2, "percentile": 100.0}
+        assert b.rank_of(150, "2025-01-31T11:00:00", scope)["rank"] == 2
+
+        a.clear_scores(ScoreRange(start_day="2025-01-31", end_day="2025-01-31"))
+        assert b.top_scores(10, scope) == []
+        assert b.rank_by_entry_id("b-2025-01-31T10:01:00", scope) is None
+
+
+class TestSQLiteImport:
+    """ローカルJSONからSQLiteへの切り替えのテスト"""
+
+    def test_imports_full_history(self, tmp_path):
+        """上位100件に入らないスコアも取り込む"""
+        source = _json_backend(tmp_path)
+        source.add_scores([_entry(f"p{i}", i, f"2025-01-01T10:{i // 60:02d}:{i % 60:02d}") for i in range(150)])
+        store = SQLiteStore(str(tmp_path / "test.db"))
+        SQLiteBackend(store).import_from(source)
+        assert len(list(store.iter_scores())) == 150
+        assert store.rank_by_entry_id("p0-2025-01-01T10:00:00")["rank"] == 150
+        store.close()
+
+    def test_cleared_scores_are_not_reimported(self, tmp_path, monkeypatch):
+        """取り込み後にリセットしたスコアは、作り直しても戻らない"""
+        source = _json_backend(tmp_path)
+        source.add_scores([_entry("a", 10, "2025-01-01T10:00:00")])
+        monkeypatch.setattr(backends, "JSONBackend", lambda: source)
+        storage = {"backend": "sqlite", "sqlite_path": str(tmp_path / "test.db")}
+        backend = build_local_backend(storage)
+        assert [e["player_name"] for e in backend.top_scores(10)] == ["a"]
+        backend.clear_scores()
+        backend.reset_participants()
+        assert build_local_backend(storage).top_scores(10) == []
+        backend.store.close()
@@ -0,0 +1,90 @@
+"""
+Tests for services/board_effects.py
+"""
+import json
+import pytest
+from services import board_effects
+from services import teeth as teeth_service
+from services.board_effects import apply_effects, compile_effects
+from services.board_schema import compile_cells
+
+
+@pytest.fixture
+def teeth_json(monkeypatch):
+    """data/teeth.json の代わりにメモリ上の dict を読み書きする"""
+    store = {"data": {side: {str(i): "N" for i in range(1, 8)} for side in ("UR", "UL", "LL", "LR")}}
+    monkeypatch.setattr(teeth_service, "load_teeth_json", lambda: json.loads(json.dumps(store["data"])))
+    monkeypatch.setattr(teeth_service, "save_teeth_json", lambda data: store.update(data=data))
+    monkeypatch.setattr(teeth_service, "update_tooth_status_random", lambda status, count=1: None)
+    monkeypatch.setattr(teeth_service, "restore_stained_teeth", lambda: None)
+    monkeypatch.setattr(teeth_service, "restore_damaged_teeth", lambda: None)
+    return store
+
+
+def _game_state():
+    game_state = {}
+    teeth_service.ensure_tooth_state(game_state)
+    teeth_service.upgrade_to_adult(game_state)
+    return game_state
+
+
+class TestCompileEffects:
+    """effects の変換のテスト"""
+
+    def test_errors(self):
+        """不明な op・引数・型の誤りをすべて返す"""
+        _, errors = compile_effects([{"op": "explode"}, {"op": "stain", "count": "3", "colour": 1}, "stain"])
+        assert len(errors) == 4
+        assert compile_effects({"op": "stain"})[1]
+
+    def test_custom_effect(self):
+        """登録した変化はコードを変えずにボードから使える"""
+        calls = []
+
+        @board_effects.effect("test_record", label=str)
+        def record(game_state, session, messages, label="x"):
+            calls.append(label)
+            return True
+
+        try:
+            effects, errors = compile_effects([{"op": "test_record", "label": "a"}, {"op": "test_record"}])
+            assert errors == []
+            assert apply_effects(effects, {}, {}, [])
+            assert calls == ["a", "x"]
+        finally:
+            board_effects._EFFECTS.pop("test_record")
+
+
+class TestApplyEffects:
+    """止まったときの変化のテスト"""
+
+    def test_lose_specific(self, teeth_json):
+        """指定した歯を失い、teeth.json にも反映する"""
+        game_state = _game_state()
+        session, messages = {}, []
+        effects, _ = compile_effects([{"op": "lose_specific", "ids": ["UL1", "UR1"], "message": "前歯"}])
+        assert apply_effects(effects, game_state, session, messages)
+        assert messages == [("error", "前歯")]
+        assert teeth_json["data"]["UL"]["1"] == "E" and teeth_json["data"]["UR"]["1"] == "E"
+        assert session["teeth_data"] is teeth_json["data"]
+
+    def test_checkup_always_applies(self, teeth_json):
+        """検診は変化が無くてもメッセージを出す"""
+        session, messages = {}, []
+        effects, _ = compile_effects([{"op": "checkup"}])
+        assert apply_effects(effects, _game_state(), session, messages)
+        assert messages == [("info", "🪥 お口をきれいにしてもらったよ！")]
+
+    def test_no_effects(self):
+        """effects の無いマスでは何もしない"""
+        assert not apply_effects(None, {}, {}, [])
+
+    @pytest.mark.parametrize("path", ["data/board_main.json", "data/board_saitama.json"])
+    def test_shipped_boards_declare_effects(self, path):
+        """同梱のボードのイベントマスは effects を持つ"""
+        with open(path, encoding='utf-8') as f:
+            cells = compile_cells(path, json.load(f))
+        by_title = {cell.title: cell for cell in cells}
+        assert len(by_title["バイク事故"].effects) == 1
+        assert by_title["バイク事故"].effects[0].keywords["ids"] == ("UL1", "UR1")
+        assert by_title["コップ飲み"].effects is None
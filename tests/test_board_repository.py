@@ -0,0 +1,71 @@
+"""
+Tests for services/board_repository.py
+"""
+import json
+import os
+import pytest
+from services.board_repository import BoardRepository
+
+
+def _cell(cell_id, cell_type, title):
+    return {"cell": cell_id, "type": cell_type, "title": title, "display_label": str(cell_id)}
+
+
+def _write(path, cells):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cells, f, ensure_ascii=False)
+
+
+@pytest.fixture
+def board_file(tmp_path):
+    path = tmp_path / "board.json"
+    _write(path, [_cell(0, "start", "スタート"), _cell(1, "stop", "虫歯クイズ"), _cell(2, "goal", "ゴール")])
+    return str(path)
+
+
+class TestBoardRepository:
+    """ボードの共有と読み直しのテスト"""
+
+    def test_parsed_once(self, board_file):
+        """変更が無ければ同じ Board を返す"""
+        repository = BoardRepository()
+        board = repository.get(board_file)
+        assert repository.get(board_file) is board
+        assert len(board) == 3
+        assert board.max_position == 2
+
+    def test_reloaded_when_file_changes(self, board_file):
+        """mtime・サイズが変わると読み直す"""
+        repository = BoardRepository()
+        board = repository.get(board_file)
+        _write(board_file, [_cell(0, "start", "スタート"), _cell(1, "goal", "ゴール")])
+        stat = os.stat(board_file)
+        os.utime(board_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        reloaded = repository.get(board_file)
+        assert reloaded is not board
+        assert len(reloaded) == 2
+
+    def test_cells_are_read_only(self, board_file):
+        """共有しているマスは変更できない"""
+        board = BoardRepository().get(board_file)
+        with pytest.raises(TypeError):
+            board[1]["title"] = "x"
+        with pytest.raises(AttributeError):
+            board[1].title = "x"
+        assert dict(board[1])["title"] == "虫歯クイズ"
+
+    def test_lookup(self, board_file):
+        """位置・マス番号でマスを引ける"""
+        board = BoardRepository().get(board_file)
+        assert board.cell_at(2)["title"] == "ゴール"
+        assert board.cell_at(3) is None
+        assert board.cell_by_id(1)["type"] == "stop"
+        assert board.cell_by_id(99) is None
+
+    def test_invalid_board(self, tmp_path):
+        """配列でないボードは ValueError"""
+        path = tmp_path / "bad.json"
+        _write(path, {"cell": 0})
+        with pytest.raises(ValueError):
+            BoardRepository().get(str(path))
+
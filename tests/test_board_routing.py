@@ -0,0 +1,77 @@
+"""
+Tests for services/board_routing.py
+"""
+import json
+import pytest
+from services.board_routing import RoutingIndex
+
+
+def _legacy_allowed(board, position):
+    """以前の app.py の compute_allowed_numbers（毎回ボードを走査する）"""
+    forced = [i for i, c in enumerate(board)
+              if c.get('type') == 'stop' or c.get('must_stop') or c.get('force_stop')
+              or c.get('title') in {"虫歯クイズ", "歯周病クイズ", "お仕事体験"}]
+    distance = max(0, len(board) - 1 - position)
+    if distance <= 0:
+        return [], None, distance
+    reachable = min(3, distance)
+    cell_type = board[position].get('type', 'normal')
+    if cell_type in ['branch_fail', 'branch_pass']:
+        return [o for o in range(1, reachable + 1) if board[position + o].get('type') == cell_type], None, distance
+    stop = next((p - position for p in forced if p > position), None)
+    limit = min(reachable, stop) if stop else reachable
+    return list(range(1, limit + 1)), stop, distance
+
+
+def _cells(*types):
+    return [{"cell": i, "type": t, "title": ""} for i, t in enumerate(types)]
+
+
+class TestRoutingIndex:
+    """移動ルール表のテスト"""
+
+    def test_stops_limit_moves(self):
+        """強制停止マスを飛び越えられない"""
+        index = RoutingIndex(_cells("start", "event", "stop", "event", "event", "event", "goal"))
+        assert index.allowed_moves(0) == (1, 2)
+        assert index.next_stop_distance(0) == 2
+        assert index.allowed_moves(1) == (1,)
+        assert index.allowed_moves(2) == (1, 2, 3)
+        assert index.next_stop_distance(2) is None
+        assert index.allowed_moves(4) == (1, 2)
+        assert index.allowed_moves(6) == ()
+        assert index.allowed_moves(99) == ()
+
+    def test_stop_flags_and_titles(self):
+        """must_stop・force_stop・タイトルでも止まる"""
+        cells = _cells("start", "event", "event", "event", "goal")
+        cells[1]["must_stop"] = True
+        cells[3]["title"] = "お仕事体験"
+        index = RoutingIndex(cells)
+        assert index.next_stop == (1, 3, 3, None, None)
+        assert index.allowed_moves(1) == (1, 2)
+
+    def test_branch_segments(self):
+        """分岐ルートでは同じタイプのマスにしか進めない"""
+        index = RoutingIndex(_cells("quiz", "branch_fail", "branch_fail", "branch_pass",
+                                    "branch_pass", "event", "goal"))
+        assert index.segment_id == (None, 0, 0, 1, 1, None, None)
+        assert index.segment_end == (None, 2, 2, 4, 4, None, None)
+        assert index.allowed_moves(1) == (1,)
+        assert index.allowed_moves(2) == ()
+        assert index.allowed_moves(3) == (1,)
+        assert index.next_stop_distance(1) is None
+        assert index.distance == (6, 5, 4, 3, 2, 1, 0)
+        assert index.is_allowed(3, 1) and not index.is_allowed(3, 2)
+
+    @pytest.mark.parametrize("path", ["data/board_main.json", "data/board_saitama.json"])
+    def test_matches_previous_rules(self, path):
+        """実際のボードで以前の計算と同じ結果になる"""
+        with open(path, encoding='utf-8') as f:
+            board = json.load(f)
+        index = RoutingIndex(board)
+        for position in range(len(board)):
+            allowed, stop, distance = _legacy_allowed(board, position)
+            assert list(index.allowed_moves(position)) == allowed
+            assert index.next_stop_distance(position) == stop
+            assert index.distance_to_goal(position) == distance
@@ -0,0 +1,67 @@
+"""
+Tests for services/board_schema.py
+"""
+import json
+import pytest
+from services.board_schema import (
+    BoardSchemaError, Cell, CellAction, CellType, compile_cells, validate_cells,
+)
+
+
+def _cell(cell_id, cell_type="event", **extra):
+    return {"cell": cell_id, "type": cell_type, "title": f"マス{cell_id}", "display_label": str(cell_id), **extra}
+
+
+class TestBoardSchema:
+    """マスの検証と Cell のテスト"""
+
+    @pytest.mark.parametrize("path", ["data/board_main.json", "data/board_saitama.json"])
+    def test_shipped_boards_are_valid(self, path):
+        """同梱のボードはスキーマに合う"""
+        with open(path, encoding='utf-8') as f:
+            cells = compile_cells(path, json.load(f))
+        assert cells[0].type is CellType.START
+        assert cells[-1].type is CellType.GOAL
+
+    def test_all_errors_are_reported(self):
+        """誤りは最初の1件で止めずにすべて報告する"""
+        data = [
+            {"cell": 0, "type": "begin", "titel": "x", "display_label": "S"},
+            _cell(1, action="dance", tooth_delta=True),
+            _cell(1, next_cell=9),
+        ]
+        with pytest.raises(BoardSchemaError) as raised:
+            compile_cells("board.json", data)
+        errors = raised.value.errors
+        assert len(errors) == 7
+        assert any("'titel'" in e for e in errors)
+        assert any("'title'" in e and "必須" in e for e in errors)
+        assert any("'begin'" in e for e in errors)
+        assert any("'dance'" in e for e in errors)
+        assert any("tooth_delta" in e for e in errors)
+        assert any("重複" in e for e in errors)
+        assert any("next_cell" in e for e in errors)
+
+    def test_not_a_list(self):
+        """配列でなければ誤り"""
+        assert validate_cells({"cell": 0})[1]
+
+    def test_cell_is_typed_and_frozen(self):
+        """属性は列挙型、Mapping として読むと JSON と同じ値"""
+        cell = compile_cells("board.json", [_cell(0, "stop", action="jump")])[0]
+        assert isinstance(cell, Cell)
+        assert cell.type is CellType.STOP and cell.action is CellAction.JUMP
+        assert cell.get('type') == 'stop' and cell['action'] == 'jump'
+        assert cell.tooth_delta is None and cell.get('tooth_delta', 0) == 0
+        assert 'tooth_delta' not in cell
+        assert dict(cell) == _cell(0, "stop", action="jump")
+        with pytest.raises(AttributeError):
+            cell.title = "x"
+        with pytest.raises(AttributeError):
+            cell.extra = 1
+
+    def test_empty_action_is_none(self):
+        """空のアクションは無い扱い"""
+        cell = compile_cells("board.json", [_cell(0, action="")])[0]
+        assert cell.action is None
+        assert 'action' not in cell
@@ -0,0 +1,85 @@
+"""
+Tests for services/bulk_write.py
+"""
+import threading
+import pytest
+from services.bulk_write import bulk_delete, bulk_set
+
+
+class _Doc:
+    def __init__(self, n):
+        self.reference = n
+
+
+class _Batch:
+    def __init__(self, db):
+        self.db = db
+        self.refs = []
+
+    def delete(self, ref):
+        self.refs.append(ref)
+
+    def set(self, ref, data):
+        self.refs.append(ref)
+        self.db.data[ref] = data
+
+    def commit(self):
+        if self.db.fail_on is not None and self.db.fail_on in self.refs:
+            raise RuntimeError("commit failed")
+        with self.db.lock:
+            self.db.deleted.extend(self.refs)
+            self.db.threads.add(threading.current_thread().name)
+
+
+class _FakeDB:
+    """batch / set / delete / commit だけを持つ Firestore クライアントの代わり"""
+
+    def __init__(self, fail_on=None):
+        self.deleted = []
+        self.data = {}
+        self.threads = set()
+        self.lock = threading.Lock()
+        self.fail_on = fail_on
+
+    def batch(self):
+        return _Batch(self)
+
+
+class TestBulkDelete:
+    """まとめて削除するテスト"""
+
+    def test_deletes_all_in_batches(self):
+        """page_size 件ずつのバッチで全件削除し、進み具合を知らせる"""
+        db = _FakeDB()
+        reports = []
+        deleted = bulk_delete(db, (_Doc(n) for n in range(25)), page_size=10, workers=2,
+                              progress=lambda done, total: reports.append((done, total)), total=25)
+        assert deleted == 25
+        assert sorted(db.deleted) == list(range(25))
+        assert reports[-1] == (25, 25)
+        assert all(name.startswith("bulk-delete") for name in db.threads)
+
+    def test_empty_input(self):
+        """削除対象が無ければ何もしない"""
+        db = _FakeDB()
+        assert bulk_delete(db, iter([])) == 0
+        assert db.deleted == []
+
+    def test_commit_failure_is_raised(self):
+        """コミットに失敗したら例外を送出する"""
+        db = _FakeDB(fail_on=15)
+        with pytest.raises(RuntimeError):
+            bulk_delete(db, (_Doc(n) for n in range(30)), page_size=10, workers=1)
+        assert 15 not in db.deleted
+
+
+class TestBulkSet:
+    """まとめて書き込むテスト"""
+
+    def test_sets_all_in_batches(self):
+        """page_size 件ずつのバッチで書き込み、同じIDへの書き込みは上書きになる"""
+        db = _FakeDB()
+        writes = [(n % 20, {"n": n}) for n in range(25)]
+        assert bulk_set(db, writes, page_size=10, workers=1) == 25
+        assert len(db.data) == 20
+        assert db.data[0] == {"n": 20}
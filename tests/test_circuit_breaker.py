@@ -0,0 +1,148 @@
+"""
+Tests for services/circuit_breaker.py
+"""
+import threading
+import time
+import pytest
+from services import firebase
+from services.backends import BackendNotConfigured, BackendUnavailable, FirestoreBackend
+from services.circuit_breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker,
+)
+from services.firebase import FirebaseService
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Probe:
+    """結果を指定でき、呼ばれたら done を立てる疎通確認"""
+
+    def __init__(self, ok):
+        self.ok = ok
+        self.done = threading.Event()
+
+    def __call__(self):
+        self.done.set()
+        if isinstance(self.ok, Exception):
+            raise self.ok
+        return self.ok
+
+
+def _wait_state(breaker, state, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while breaker.state != state and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return breaker.state == state
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+class TestCircuitBreaker:
+    """状態遷移のテスト"""
+
+    def test_opens_after_repeated_failures(self, clock):
+        """failure_window 秒以内に failure_threshold 回失敗すると開く"""
+        breaker = CircuitBreaker(failure_threshold=2, failure_window=10, clock=clock)
+        breaker.record_failure("e1")
+        clock.now = 20
+        breaker.record_failure("e2")
+        assert breaker.state == STATE_CLOSED
+        breaker.record_failure("e3")
+        assert breaker.state == STATE_OPEN
+        assert not breaker.allow()
+
+    def test_probe_success_closes(self, clock):
+        """待ち時間が過ぎると裏で疎通確認し、成功すれば閉じる"""
+        probe = _Probe(True)
+        breaker = CircuitBreaker(probe=probe, base_backoff=5, clock=clock)
+        breaker.trip("down")
+        clock.now = 1
+        assert not breaker.allow()
+        assert not probe.done.is_set()
+        clock.now = 10
+        assert not breaker.allow()
+        assert probe.done.wait(2)
+        assert _wait_state(breaker, STATE_CLOSED)
+        assert breaker.allow()
+
+    def test_probe_failure_backs_off(self, clock):
+        """疎通確認に失敗すると待ち時間を延ばして開き直す"""
+        probe = _Probe(RuntimeError("still down"))
+        breaker = CircuitBreaker(probe=probe, base_backoff=5, max_backoff=100, clock=clock)
+        breaker.trip("down")
+        first_retry = breaker.retry_at
+        clock.now = 10
+        breaker.allow()
+        assert probe.done.wait(2)
+        assert _wait_state(breaker, STATE_OPEN)
+        assert breaker.retry_at - clock.now > first_retry
+        assert breaker.last_error == "still down"
+
+    def test_half_open_starts_single_probe(self, clock):
+        """疎通確認中は次の確認を始めない"""
+        gate = threading.Event()
+        calls = []
+
+        def probe():
+            calls.append(1)
+            gate.wait(2)
+            return True
+
+        breaker = CircuitBreaker(probe=probe, base_backoff=1, clock=clock)
+        breaker.trip()
+        clock.now = 10
+        breaker.allow()
+        assert breaker.state == STATE_HALF_OPEN
+        breaker.allow()
+        gate.set()
+        assert _wait_state(breaker, STATE_CLOSED)
+        assert len(calls) == 1
+
+
+class TestFirebaseInitialize:
+    """FirebaseService.initialize とブレーカー"""
+
+    def test_open_breaker_skips_connection(self, monkeypatch):
+        """接続に失敗した後は接続を試みずにすぐ False を返す"""
+        monkeypatch.setattr(firebase, "FIREBASE_AVAILABLE", True)
+        service = FirebaseService()
+        calls = []
+
+        def connect():
+            calls.append(1)
+            service.configured = True
+            raise ConnectionError("offline")
+
+        service._connect = connect
+        assert not service.initialize()
+        assert not service.initialize()
+        assert len(calls) == 1
+        assert service.breaker.state == STATE_OPEN
+        # 設定はあるので一時的な失敗として Outbox 行きにする
+        with pytest.raises(BackendUnavailable) as excinfo:
+            FirestoreBackend(service=service).add_scores([])
+        assert not isinstance(excinfo.value, BackendNotConfigured)
+
+    def test_transient_errors_open_breaker(self):
+        """接続の問題による失敗が続くとブレーカーが開く"""
+        service = FirebaseService()
+        service._record_error(ValueError("bad data"))
+        for _ in range(3):
+            service._record_error(TimeoutError("slow"))
+        assert service.breaker.state == STATE_OPEN
+
+    def test_missing_firebase_is_not_configured(self, monkeypatch):
+        """firebase-admin が無ければ再試行しない扱い"""
+        monkeypatch.setattr(firebase, "FIREBASE_AVAILABLE", False)
+        service = FirebaseService()
+        with pytest.raises(BackendNotConfigured):
+            FirestoreBackend(service=service).add_scores([])
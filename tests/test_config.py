@@ -0,0 +1,108 @@
+"""
+Tests for services/config.py
+"""
+import json
+import os
+import pytest
+from services.config import ConfigFile, ConfigService, default_settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _write(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    # 同じ秒のうちに書き直しても変更として見えるように mtime を進める
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    settings = tmp_path / "settings.json"
+    events = tmp_path / "events.json"
+    _write(settings, {"staff_pin": "1234", "debug_mode": True, "game": {"job_experience_timer_seconds": 60}})
+    _write(events, {"active_event": "saitama", "events": [
+        {"id": "default", "board_file": "board_main.json"},
+        {"id": "saitama", "board_file": "board_saitama.json"},
+    ]})
+    return str(settings), str(events)
+
+
+class TestConfigFile:
+    """共有と読み直しのテスト"""
+
+    def test_reads_once_per_interval(self, paths, clock, monkeypatch):
+        """確認の間隔のうちはファイルを見ない"""
+        config = ConfigFile(paths[0], default_settings, check_interval=1.0, clock=clock)
+        first = config.get()
+        assert first["staff_pin"] == "1234"
+
+        stats = []
+        real_stat = os.stat
+        monkeypatch.setattr(os, "stat", lambda path: stats.append(path) or real_stat(path))
+        for _ in range(100):
+            assert config.get() is first
+        assert stats == []
+
+        clock.now = 1.5
+        assert config.get() is first
+        assert len(stats) == 1
+
+    def test_picks_up_changes(self, paths, clock):
+        """変更は次の確認で反映される"""
+        config = ConfigFile(paths[0], default_settings, check_interval=1.0, clock=clock)
+        config.get()
+        _write(paths[0], {"staff_pin": "9999"})
+        assert config.get()["staff_pin"] == "1234"
+        clock.now = 1.0
+        assert config.get()["staff_pin"] == "9999"
+
+    def test_invalidate(self, paths, clock):
+        """invalidate すると間隔を待たずに読み直す"""
+        config = ConfigFile(paths[0], default_settings, check_interval=1.0, clock=clock)
+        config.get()
+        _write(paths[0], {"staff_pin": "9999"})
+        config.invalidate()
+        assert config.get()["staff_pin"] == "9999"
+
+    def test_broken_file(self, paths, clock, tmp_path):
+        """読めない場合は前回の内容、一度も読めていなければ既定値"""
+        config = ConfigFile(paths[0], default_settings, check_interval=1.0, clock=clock)
+        config.get()
+        with open(paths[0], 'w', encoding='utf-8') as f:
+            f.write("{broken")
+        clock.now = 1.0
+        assert config.get()["staff_pin"] == "1234"
+        missing = ConfigFile(str(tmp_path / "missing.json"), default_settings, clock=clock)
+        assert missing.get() == default_settings()
+
+
+class TestConfigService:
+    """型付きの値のテスト"""
+
+    def test_accessors(self, paths, clock):
+        service = ConfigService(*paths, clock=clock)
+        assert service.staff_pin == "1234"
+        assert service.debug_mode is True
+        assert service.game["job_experience_timer_seconds"] == 60
+        assert service.active_event_id == "saitama"
+        assert service.board_file == "data/board_saitama.json"
+
+    def test_unknown_active_event(self, paths, clock):
+        """アクティブイベントが見つからなければ統一ボード"""
+        _write(paths[1], {"active_event": "gone", "events": []})
+        service = ConfigService(*paths, clock=clock)
+        assert service.active_event is None
+        assert service.board_file == "data/board_main.json"
@@ -0,0 +1,125 @@
+"""
+Tests for services/export.py
+"""
+import csv
+import io
+import json
+import pytest
+from services import export
+from services.backends import MemoryBackend
+from services.export import (
+    EXPORT_SCORES, EXPORT_SESSIONS, FORMAT_CSV, FORMAT_JSONL,
+    ExportFilter, iter_export, spool_export,
+)
+from services.firebase import FirebaseService
+
+
+def _session(n, day="2025-01-31", event_id="ev", age_group="5plus"):
+    return {"timestamp": f"{day}T10:00:{n:02d}", "session_id": f"s{n}", "event_id": event_id,
+            "participant_name": f"なまえ{n}", "age_group": age_group, "tooth_coins": n}
+
+
+@pytest.fixture
+def backend():
+    backend = MemoryBackend()
+    backend.append_sessions([
+        _session(1),
+        _session(2, age_group="under5"),
+        _session(3, day="2025-02-01"),
+        _session(4, event_id="other"),
+    ])
+    backend.add_scores([{"entry_id": "e1", "player_name": "a", "score": 10,
+                         "timestamp": "2025-01-31T10:00:00", "age_group": "5plus"}])
+    return backend
+
+
+class TestExportFilter:
+    """絞り込みのテスト"""
+
+    def test_date_range_is_inclusive(self):
+        """開始日・終了日を含む"""
+        filters = ExportFilter(start_day="2025-01-31", end_day="2025-02-01")
+        assert filters.matches(_session(1))
+        assert filters.matches(_session(1, day="2025-02-01"))
+        assert not filters.matches(_session(1, day="2025-02-02"))
+
+    def test_missing_event_id_is_default(self):
+        """event_id の無い古いレコードは default イベント扱い"""
+        assert ExportFilter(event_id="default").matches({"timestamp": "2025-01-31"})
+
+
+class TestExport:
+    """書き出しのテスト"""
+
+    def test_csv_with_filters(self, backend):
+        """CSVは決まった列で、絞り込んだ行だけを出力する"""
+        filters = ExportFilter(start_day="2025-01-31", end_day="2025-01-31", event_id="ev")
+        with spool_export(EXPORT_SESSIONS, FORMAT_CSV, filters, backend) as spool:
+            data = spool.read()
+        assert data.startswith(b"\xef\xbb\xbf")
+        rows = list(csv.DictReader(io.StringIO(data.decode("utf-8-sig"))))
+        assert [row["session_id"] for row in rows] == ["s1", "s2"]
+        assert rows[0]["participant_name"] == "なまえ1"
+        assert rows[0]["turn_count"] == ""
+
+    def test_jsonl_scores(self, backend):
+        """スコアを JSON Lines で書き出す"""
+        with spool_export(EXPORT_SCORES, FORMAT_JSONL, backend=backend) as spool:
+            lines = spool.read().decode("utf-8").splitlines()
+        assert [json.loads(line)["entry_id"] for line in lines] == ["e1"]
+
+    def test_output_is_chunked(self, monkeypatch):
+        """件数が多くても一定行数ずつ文字列にする"""
+        monkeypatch.setattr(export, "CHUNK_ROWS", 2)
+        records = [_session(n) for n in range(5)]
+        csv_chunks = list(iter_export(records, EXPORT_SESSIONS, FORMAT_CSV))
+        assert len(csv_chunks) == 3
+        assert "".join(csv_chunks).count("\n") == 6
+        assert len(list(iter_export(records, EXPORT_SESSIONS, FORMAT_JSONL))) == 3
+
+    def test_spool_is_accepted_by_download_button(self, backend):
+        """st.download_button が受け取れるファイルオブジェクトを返す"""
+        with spool_export(EXPORT_SESSIONS, FORMAT_CSV, backend=backend) as spool:
+            assert isinstance(spool, io.RawIOBase)
+
+    def test_unknown_kind_is_rejected(self):
+        """未知の種類はエラー"""
+        with pytest.raises(ValueError):
+            list(iter_export([], "unknown", FORMAT_CSV))
+
+
+class _FakeDoc:
+    def __init__(self, n):
+        self.n = n
+
+    def to_dict(self):
+        return {"n": self.n}
+
+
+class _FakeQuery:
+    """limit / start_after だけを持つ Firestore クエリの代わり"""
+
+    def __init__(self, docs, calls, start=0, size=None):
+        self.docs, self.calls, self.start, self.size = docs, calls, start, size
+
+    def limit(self, size):
+        return _FakeQuery(self.docs, self.calls, self.start, size)
+
+    def start_after(self, doc):
+        return _FakeQuery(self.docs, self.calls, doc.n + 1, self.size)
+
+    def stream(self):
+        self.calls.append(self.start)
+        return iter(self.docs[self.start:self.start + self.size])
+
+
+class TestFirestorePagination:
+    """Firestore の全件読み出しのテスト"""
+
+    def test_reads_page_by_page(self):
+        """page_size 件ずつ続きから読む"""
+        calls = []
+        query = _FakeQuery([_FakeDoc(n) for n in range(5)], calls)
+        docs = list(FirebaseService()._iter_pages(query, page_size=2))
+        assert [doc.n for doc in docs] == [0, 1, 2, 3, 4]
+        assert calls == [0, 2, 4]
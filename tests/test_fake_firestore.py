@@ -0,0 +1,157 @@
+"""
+Tests for services/fake_firestore.py
+"""
+import threading
+import pytest
+from services import fake_firestore
+from services.fake_firestore import (
+    Aborted, FakeFirestoreClient, Increment, Query, ServiceUnavailable,
+)
+
+
+@pytest.fixture
+def client():
+    return FakeFirestoreClient(seed=0)
+
+
+class TestQueries:
+    """クエリのテスト"""
+
+    def test_where_order_limit_and_cursor(self, client):
+        """絞り込み・並べ替え・件数制限・続きからの読み込み"""
+        scores = client.collection("scores")
+        for n, score in enumerate([30, 10, 20, 20]):
+            scores.document(f"d{n}").set({"score": score, "event_id": "ev" if n else "other"})
+        query = scores.where("event_id", "==", "ev").order_by("score", direction=Query.DESCENDING)
+        first = list(query.limit(2).stream())
+        # 同点は最後の並べ替えと同じ向きのドキュメント名順（本物と同じ）
+        assert [doc.id for doc in first] == ["d3", "d2"]
+        rest = list(query.limit(2).start_after(first[-1]).stream())
+        assert [doc.id for doc in rest] == ["d1"]
+        assert query.count().get()[0][0].value == 3
+
+    def test_missing_order_field_is_excluded(self, client):
+        """並べ替える項目が無いドキュメントは結果に含まれない"""
+        client.collection("c").document("a").set({"x": 1})
+        client.collection("c").document("b").set({})
+        assert [doc.id for doc in client.collection("c").order_by("x").stream()] == ["a"]
+
+    def test_select_and_collection_group(self, client):
+        """select した項目だけを読み、collection_group は同じ名前のサブコレクションをまとめて読む"""
+        client.collection("days").document("d1").collection("shards").document("0").set({"count": 1, "day": "d1"})
+        client.collection("days").document("d2").collection("shards").document("0").set({"count": 2, "day": "d2"})
+        docs = list(client.collection_group("shards").order_by("__name__").select(["count"]).stream())
+        assert [doc.to_dict() for doc in docs] == [{"count": 1}, {"count": 2}]
+
+
+class TestWrites:
+    """書き込みのテスト"""
+
+    def test_increment_and_merge(self, client):
+        """Increment はサーバー側で加算し、merge は他の項目を残す"""
+        ref = client.collection("c").document("a")
+        ref.set({"count": Increment(2), "day": "d"}, merge=True)
+        ref.set({"count": Increment(3)}, merge=True)
+        assert ref.get().to_dict() == {"count": 5, "day": "d"}
+
+    def test_server_timestamp(self, client):
+        """SERVER_TIMESTAMP は書き込み時刻になる"""
+        ref = client.collection("c").document("a")
+        ref.set({"at": fake_firestore.SERVER_TIMESTAMP})
+        assert hasattr(ref.get().get("at"), "isoformat")
+
+    def test_batch_limit(self, client):
+        """バッチは500件まで"""
+        batch = client.batch()
+        for n in range(500):
+            batch.delete(client.collection("c").document(str(n)))
+        with pytest.raises(ValueError):
+            batch.delete(client.collection("c").document("over"))
+
+
+class TestTransactions:
+    """トランザクションのテスト"""
+
+    def test_concurrent_increments_are_serialized(self):
+        """同じドキュメントを同時に更新しても加算を取りこぼさない（競合時はやり直す）"""
+        client = FakeFirestoreClient(latency=0.001, seed=0)
+        ref = client.collection("c").document("counter")
+
+        @fake_firestore.transactional
+        def bump(transaction):
+            snapshot = ref.get(transaction=transaction)
+            value = (snapshot.to_dict() or {}).get("n", 0)
+            transaction.set(ref, {"n": value + 1})
+
+        succeeded = []
+
+        def worker():
+            for _ in range(5):
+                try:
+                    bump(client.transaction())
+                    succeeded.append(1)
+                except Aborted:
+                    pass
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert ref.get().to_dict()["n"] == len(succeeded)
+        assert client.stats["aborted"] > 0
+
+    def test_read_after_write_is_rejected(self, client):
+        """トランザクションでは書き込みの後に読めない"""
+        ref = client.collection("c").document("a")
+
+        @fake_firestore.transactional
+        def bad(transaction):
+            transaction.set(ref, {"n": 1})
+            ref.get(transaction=transaction)
+
+        with pytest.raises(fake_firestore.ReadAfterWriteError):
+            bad(client.transaction())
+
+
+class TestFailureInjection:
+    """障害注入のテスト"""
+
+    def test_fail_next_and_offline(self, client):
+        """指定した回数・オフラインの間は ServiceUnavailable"""
+        ref = client.collection("c").document("a")
+        client.fail_next(1)
+        with pytest.raises(ServiceUnavailable):
+            ref.set({"n": 1})
+        ref.set({"n": 1})
+        client.offline = True
+        with pytest.raises(ServiceUnavailable):
+            ref.get()
+        assert client.stats["failures"] == 2
+
+
+class TestSnapshotListener:
+    """on_snapshot のテスト"""
+
+    def test_delivers_initial_and_changes(self, client):
+        """最初に全件、以降は書き込みのたびに全件を届け、オフラインで購読が切れる"""
+        received = []
+        changed = threading.Event()
+
+        def callback(docs, changes, read_time):
+            received.append(sorted(doc.id for doc in docs))
+            changed.set()
+
+        client.collection("c").document("a").set({"n": 1})
+        watch = client.collection("c").on_snapshot(callback)
+        assert changed.wait(2)
+        changed.clear()
+        client.collection("c").document("b").set({"n": 2})
+        client.collection("other").document("x").set({"n": 3})
+        assert changed.wait(2)
+        assert received[0] == ["a"]
+        assert received[-1] == ["a", "b"]
+
+        client.offline = True
+        watch._thread.join(2)
+        assert not watch.is_active
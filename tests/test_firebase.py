@@ -0,0 +1,178 @@
+"""
+Tests for services/firebase.py
+"""
+import os
+import subprocess
+import sys
+import pytest
+from services.backends import FirestoreBackend, MemoryBackend, MirroredBackend
+from services.firebase import _aggregate_doc_id, _aggregate_partitions, _is_aggregated, _merge_top
+from services.outbox import Outbox, OutboxReplayer
+from services.rank_index import ALL, Partition, ScoreRange
+
+
+def _score(entry_id, score, timestamp="2025-01-31T10:00:00"):
+    return {"entry_id": entry_id, "score": score, "client_timestamp": timestamp}
+
+
+class TestLeaderboardAggregate:
+    """ランキング集計ドキュメントのテスト"""
+
+    def test_partitions_per_event_and_age_group(self):
+        """イベント・年齢グループ全体と、その日別の集計に反映する"""
+        entry = {"event_id": "ev", "age_group": "5plus", "day": "2025-01-31"}
+        assert _aggregate_partitions(entry) == [
+            Partition("ev", "5plus"), Partition("ev", "5plus", "2025-01-31"),
+        ]
+        assert _aggregate_partitions({"day": "2025-01-31"})[0] == Partition("default", "")
+
+    def test_only_event_and_age_group_partitions_are_aggregated(self):
+        """イベントと年齢グループを指定した範囲だけ集計を読む"""
+        assert _is_aggregated(Partition("ev", "under5", "2025-01-31"))
+        assert not _is_aggregated(Partition(event_id="ev"))
+        assert not _is_aggregated(ALL)
+
+    def test_doc_ids_are_distinct(self):
+        """範囲ごとに別のドキュメントになる"""
+        ids = {
+            _aggregate_doc_id(Partition("ev", "5plus")),
+            _aggregate_doc_id(Partition("ev", "5plus", "2025-01-31")),
+            _aggregate_doc_id(Partition("ev", "under5")),
+            _aggregate_doc_id(Partition("ev/2", "")),
+        }
+        assert len(ids) == 4
+        assert all("/" not in doc_id for doc_id in ids)
+
+    def test_merge_keeps_order_and_size(self):
+        """スコア順（同点は先着）に並べ、上限件数で切る"""
+        top = [_score("a", 300), _score("b", 100, "2025-01-31T09:00:00")]
+        merged = _merge_top(top, _score("c", 100, "2025-01-31T08:00:00"), size=2)
+        assert [e["entry_id"] for e in merged] == ["a", "c"]
+
+    def test_merge_ignores_duplicates_and_low_scores(self):
+        """同じ entry_id や上位に入らないスコアでは None"""
+        top = [_score("a", 300), _score("b", 100)]
+        assert _merge_top(top, _score("a", 300)) is None
+        assert _merge_top(top, _score("z", 1), size=2) is None
+
+
+@pytest.fixture
+def service(service):
+    # キャッシュを使わず毎回 Firestore（の代わり）から読む
+    service.leaderboard_cache.configure(ttl=0)
+    service.participant_cache.configure(ttl=0)
+    return service
+
+
+def _player(entry_id, teeth, coins, timestamp, event_id="ev", age_group="5plus"):
+    return {"entry_id": entry_id, "player_name": entry_id, "teeth_count": teeth, "tooth_coins": coins,
+            "timestamp": timestamp, "event_id": event_id, "age_group": age_group}
+
+
+class TestFirebaseServiceWithFake:
+    """FirebaseService を Firestore の代わりで動かすテスト"""
+
+    def test_scores_and_aggregate_leaderboard(self, service, client):
+        """保存したスコアが集計ドキュメント1件から読める"""
+        assert service.save_player_score(_player("a", 20, 5, "2025-01-31T10:00:00"))
+        assert service.save_player_score(_player("b", 25, 0, "2025-01-31T10:01:00"))
+        assert service.save_player_score(_player("c", 10, 0, "2025-01-31T10:02:00", age_group="under5"))
+        scope = Partition("ev", "5plus", "2025-01-31")
+        reads = client.stats["reads"]
+        assert [e["entry_id"] for e in service.get_leaderboard(10, scope)] == ["b", "a"]
+        assert client.stats["reads"] - reads == 1
+        assert [e["entry_id"] for e in service.get_leaderboard(10)] == ["b", "a", "c"]
+        assert service.get_rank_by_entry_id("a", scope) == {"rank": 2, "total": 2, "percentile": 100.0}
+
+    def test_rebuild_aggregates(self, service, client):
+        """集計ドキュメントを消しても scores から作り直せる"""
+        service.save_player_score(_player("a", 20, 5, "2025-01-31T10:00:00"))
+        for doc in client.collection("leaderboard").stream():
+            doc.reference.delete()
+        assert service.rebuild_leaderboard_aggregates() == 2
+        assert [e["entry_id"] for e in service.get_leaderboard(10, Partition("ev", "5plus"))] == ["a"]
+
+    def test_scoped_clear(self, service):
+        """イベントを指定したリセットでは他のイベントのスコアが残る"""
+        service.save_player_score(_player("a", 20, 0, "2025-01-31T10:00:00"))
+        service.save_player_score(_player("b", 10, 0, "2025-01-31T10:00:00", event_id="other"))
+        reports = []
+        assert service.clear_leaderboard(ScoreRange(event_id="ev"),
+                                         progress=lambda done, total: reports.append((done, total)))
+        assert reports[-1] == (1, 1)
+        assert [e["entry_id"] for e in service.get_leaderboard(10)] == ["b"]
+        assert service.get_leaderboard(10, Partition("ev", "5plus")) == []
+
+    def test_backend_writes_several_scores_in_batches(self, service, client):
+        """まとめて届いたスコアはトランザクション1件ずつではなくバッチで書く"""
+        entries = [{**_player(f"e{i}", i, 0, f"2025-01-31T10:00:{i:02d}"), "score": i * 10} for i in range(5)]
+        FirestoreBackend(service=service).add_scores(entries)
+        assert client.stats["aborted"] == 0
+        top = service.get_leaderboard(3, Partition("ev", "5plus"))
+        assert [e["entry_id"] for e in top] == ["e4", "e3", "e2"]
+
+    def test_participant_shards(self, service):
+        """シャードに分けた加算の合計と、キー付きの加算の重複防止"""
+        for _ in range(5):
+            service.increment_participant_count("2025-01-31")
+        service.increment_participant_count("2025-01-31", by=2, idempotency_key="k1")
+        service.increment_participant_count("2025-01-31", by=2, idempotency_key="k1")
+        assert service.get_participant_stats()["daily_counts"] == {"2025-01-31": 7}
+        assert service.reset_participant_count()
+        assert service.get_participant_stats()["daily_counts"] == {}
+
+    def test_participant_total_read_failure_is_not_a_failed_write(self, service, monkeypatch):
+        """加算後の累計が読めなくても加算は成功として扱い、再送で二重に数えない"""
+        def fail():
+            raise RuntimeError("read failed")
+        monkeypatch.setattr(service, "_fetch_participant_counts", fail)
+        assert service.increment_participant_count("2025-01-31", by=2) == 2
+        monkeypatch.undo()
+        assert service.get_participant_stats()["daily_counts"] == {"2025-01-31": 2}
+
+    def test_sessions_are_paginated(self, service):
+        """体験ログを保存し、ページ単位で全件読める"""
+        sessions = [{"session_id": f"s{i}", "timestamp": f"2025-01-31T10:00:{i:02d}"} for i in range(7)]
+        assert service.append_sessions(sessions)
+        assert service.append_sessions(sessions[:2])
+        assert [s["session_id"] for s in service.iter_sessions(page_size=3)] == [f"s{i}" for i in range(7)]
+
+    def test_injected_failures_open_breaker(self, service, client):
+        """通信エラーが続くとブレーカーが開き、以降は Firestore に触れない"""
+        client.offline = True
+        for _ in range(3):
+            assert not service.save_player_score(_player("a", 1, 0, "2025-01-31T10:00:00"))
+        rpcs = client.stats["rpcs"]
+        assert not service.save_player_score(_player("a", 1, 0, "2025-01-31T10:00:00"))
+        assert client.stats["rpcs"] == rpcs
+
+
+class TestFallbackWithFake:
+    """ローカル保存先への切り替えと再送"""
+
+    def test_outbox_replays_after_outage(self, service, client, tmp_path):
+        """Firestore が落ちている間の書き込みはローカルに保存し、復旧後に再送する"""
+        outbox = Outbox(str(tmp_path / "outbox.db"))
+        local = MemoryBackend()
+        backend = MirroredBackend(FirestoreBackend(service=service), local, outbox=outbox)
+        client.fail_next(1)
+        backend.add_scores([{**_player("a", 20, 0, "2025-01-31T10:00:00"), "score": 200}])
+        assert [e["entry_id"] for e in local.top_scores(10)] == ["a"]
+        assert outbox.size() == 1
+
+        assert OutboxReplayer(outbox, backend.replay_outbox).drain_once()
+        assert [e["entry_id"] for e in service.get_leaderboard(10)] == ["a"]
+        outbox.close()
+
+
+class TestLazyImport:
+    """firebase_admin の遅延読み込み"""
+
+    def test_firebase_admin_is_not_imported_at_startup(self):
+        """起動時に読み込むモジュールを import しても firebase_admin・grpc は読み込まない"""
+        code = ("import sys, services.store, services.firebase, services.backends; "
+                "print([m for m in ('firebase_admin', 'grpc') if m in sys.modules])")
+        root = os.path.join(os.path.dirname(__file__), "..")
+        output = subprocess.run([sys.executable, "-c", code], cwd=root,
+                                capture_output=True, text=True, check=True).stdout
+        assert output.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,92 @@
+"""
+Tests for services/ingest.py
+"""
+import gzip
+import json
+import pytest
+from services.ingest import (
+    KIND_SCORE, KIND_SESSION, classify, ingest_files, iter_file_records,
+    session_entry_id, split_records,
+)
+from services.rank_index import Partition
+
+
+def _session(session_id, teeth=20, coins=5, timestamp="2025-01-31T10:00:00"):
+    return {"session_id": session_id, "timestamp": timestamp, "event_id": "ev",
+            "participant_name": session_id, "age_group": "5plus",
+            "teeth_count": teeth, "tooth_coins": coins}
+
+
+def _jsonl(records):
+    return "\n".join(json.dumps(r, ensure_ascii=False) for r in records).encode("utf-8")
+
+
+@pytest.fixture
+def service(service):
+    service.leaderboard_cache.configure(ttl=0)
+    return service
+
+
+class TestReadRecords:
+    """ファイルの読み込みと振り分けのテスト"""
+
+    def test_formats(self):
+        """JSON Lines（gzip 圧縮を含む）・配列・scores/sessions の形を読める"""
+        sessions = [_session("s1"), _session("s2")]
+        assert list(iter_file_records("a.jsonl", _jsonl(sessions) + b"\n{broken")) == sessions
+        assert list(iter_file_records("a.jsonl.gz", gzip.compress(_jsonl(sessions)))) == sessions
+        assert list(iter_file_records("a.json", json.dumps(sessions).encode())) == sessions
+        wrapped = {"scores": [{"entry_id": "e1"}], "sessions": sessions[:1]}
+        assert list(iter_file_records("a.json", json.dumps(wrapped).encode())) == [{"entry_id": "e1"}, sessions[0]]
+
+    def test_classify(self):
+        """スコアか体験ログかを項目で判定する"""
+        assert classify({"entry_id": "e", "score": 1}) == KIND_SCORE
+        assert classify(_session("s1")) == KIND_SESSION
+        assert classify({"foo": 1}) is None
+
+    def test_ids_are_deterministic(self):
+        """ID の無いレコードにも毎回同じ ID を付ける"""
+        records = [{"player_name": "a", "score": 1}, {"participant_name": "b"}, _session("s1")]
+        first = split_records(records, scores_from_sessions=True)
+        second = split_records(records, scores_from_sessions=True)
+        assert first == second
+        scores, sessions, skipped = first
+        assert skipped == 0
+        assert all(score["entry_id"] for score in scores)
+        assert all(session["session_id"] for session in sessions)
+        assert scores[-1]["entry_id"] == session_entry_id("s1")
+
+
+class TestIngest:
+    """Firestore（の代わり）への取り込みのテスト"""
+
+    def test_ingest_is_idempotent(self, service, client):
+        """同じファイルを2回取り込んでもドキュメントは増えない"""
+        files = [("game_sessions.jsonl", _jsonl([_session(f"s{i}", teeth=i) for i in range(30)]))]
+        reports = []
+        report = ingest_files(service, files, scores_from_sessions=True, chunk_size=7,
+                              progress=lambda done, total: reports.append((done, total)))
+        assert (report.scores, report.sessions, report.failed) == (30, 30, 0)
+        assert reports[-1] == (60, 60)
+        assert report.per_second > 0
+
+        ingest_files(service, files, scores_from_sessions=True)
+        assert len(list(client.collection("scores").stream())) == 30
+        assert len(list(client.collection("sessions").stream())) == 30
+
+    def test_aggregates_are_updated(self, service):
+        """取り込んだスコアが集計ドキュメントのランキングに入る"""
+        service.save_player_score({"entry_id": "live", "teeth_count": 15, "tooth_coins": 0,
+                                   "timestamp": "2025-01-31T09:00:00", "event_id": "ev", "age_group": "5plus"})
+        files = [("tablet.jsonl", _jsonl([_session("s1", teeth=20), _session("s2", teeth=10)]))]
+        ingest_files(service, files, scores_from_sessions=True)
+        top = service.get_leaderboard(10, Partition("ev", "5plus", "2025-01-31"))
+        assert [e["entry_id"] for e in top] == [session_entry_id("s1"), "live", session_entry_id("s2")]
+
+    def test_failed_chunks_are_counted(self, service, client):
+        """書き込めなかった分は failed に数える"""
+        client.offline = True
+        report = ingest_files(service, [("a.jsonl", _jsonl([_session("s1")]))])
+        assert report.failed == 1
+        assert report.sessions == 0
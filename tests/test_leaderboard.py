@@ -0,0 +1,89 @@
+"""
+Tests for services/leaderboard.py
+"""
+import json
+from services.leaderboard import TopKLeaderboard, PersistentLeaderboard
+
+
+def _entry(name, score, timestamp):
+    return {"player_name": name, "score": score, "timestamp": timestamp}
+
+
+class TestTopKLeaderboard:
+    """上位K件インデックスのテスト"""
+
+    def test_add_keeps_order(self):
+        """スコア降順、同点は先着順に並ぶ"""
+        board = TopKLeaderboard(capacity=10)
+        board.add(_entry("b", 100, "2025-01-01T10:00:02"))
+        board.add(_entry("a", 100, "2025-01-01T10:00:01"))
+        board.add(_entry("c", 300, "2025-01-01T10:00:03"))
+        assert [e["player_name"] for e in board.top(10)] == ["c", "a", "b"]
+
+    def test_add_returns_position(self):
+        """挿入位置（0始まり）を返す"""
+        board = TopKLeaderboard(capacity=10)
+        assert board.add(_entry("a", 10, "t1")) == 0
+        assert board.add(_entry("b", 20, "t2")) == 0
+        assert board.add(_entry("c", 5, "t3")) == 2
+
+    def test_capacity_is_bounded(self):
+        """上限を超えると最下位が押し出される"""
+        board = TopKLeaderboard(capacity=3)
+        for i in range(5):
+            board.add(_entry(f"p{i}", i, f"t{i}"))
+        assert len(board) == 3
+        assert [e["score"] for e in board.top(3)] == [4, 3, 2]
+        assert board.add(_entry("low", 0, "t9")) is None
+
+    def test_top_returns_copies(self):
+        """返した辞書を書き換えても内部状態は変わらない"""
+        board = TopKLeaderboard()
+        board.add(_entry("a", 1, "t1"))
+        board.top(1)[0]["score"] = 999
+        assert board.top(1)[0]["score"] == 1
+
+
+class TestPersistentLeaderboard:
+    """遅延書き出しのテスト"""
+
+    def test_loads_existing_file_once(self, tmp_path):
+        """既存ファイルを読み込んで上位を返す"""
+        path = tmp_path / "leaderboard.json"
+        path.write_text(json.dumps([_entry("a", 1, "t1"), _entry("b", 2, "t2")]), encoding='utf-8')
+        board = PersistentLeaderboard(str(path))
+        assert [e["player_name"] for e in board.top(5)] == ["b", "a"]
+        path.unlink()
+        assert len(board.top(5)) == 2
+
+    def test_writes_are_coalesced(self, tmp_path):
+        """複数回の追加は flush でまとめて書き出される"""
+        path = tmp_path / "leaderboard.json"
+        board = PersistentLeaderboard(str(path), flush_delay=60)
+        for i in range(3):
+            board.add(_entry(f"p{i}", i, f"t{i}"))
+        assert not path.exists()
+        board.flush()
+        saved = json.loads(path.read_text(encoding='utf-8'))
+        assert [e["score"] for e in saved] == [2, 1, 0]
+
+    def test_clear_writes_immediately(self, tmp_path):
+        """クリアはすぐにファイルへ反映される"""
+        path = tmp_path / "leaderboard.json"
+        board = PersistentLeaderboard(str(path), flush_delay=60)
+        board.add(_entry("a", 1, "t1"))
+        board.clear()
+        assert json.loads(path.read_text(encoding='utf-8')) == []
+
+    def test_flush_merges_changes_from_other_process(self, tmp_path):
+        """他プロセスが書き換えたファイルに未書き出し分を重ねて保存する"""
+        path = tmp_path / "leaderboard.json"
+        mine = PersistentLeaderboard(str(path), flush_delay=60)
+        other = PersistentLeaderboard(str(path), flush_delay=60)
+        mine.add(_entry("a", 1, "t1"))
+        other.add(_entry("b", 2, "t2"))
+        other.flush()
+        mine.flush()
+        saved = json.loads(path.read_text(encoding='utf-8'))
+        assert [e["player_name"] for e in saved] == ["b", "a"]
+        assert [e["player_name"] for e in other.top(5)] == ["b", "a"]
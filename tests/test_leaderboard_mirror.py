@@ -0,0 +1,83 @@
+"""
+Tests for services/leaderboard_mirror.py
+"""
+import time
+import pytest
+from services import fake_firestore
+from services.firebase import FirebaseService
+from services.leaderboard_mirror import MODE_LISTENING, MODE_POLLING, LeaderboardMirror
+from services.rank_index import Partition
+
+SCOPE = Partition("ev", "5plus", "2025-01-31")
+
+
+def _player(entry_id, teeth):
+    return {"entry_id": entry_id, "player_name": entry_id, "teeth_count": teeth, "tooth_coins": 0,
+            "timestamp": "2025-01-31T10:00:00", "event_id": "ev", "age_group": "5plus"}
+
+
+def _wait(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def service(service):
+    service.leaderboard_cache.configure(ttl=0)
+    yield service
+    if service.mirror is not None:
+        service.mirror.stop(timeout=2)
+
+
+class TestLeaderboardMirror:
+    """ランキングの写しのテスト"""
+
+    def test_reads_from_mirror_without_round_trips(self, service, client):
+        """他の端末が保存したスコアも写しに届き、ランキングの読み込みで通信しない"""
+        other = FirebaseService(client=client, firestore_module=fake_firestore)
+        mirror = service.start_leaderboard_mirror(poll_interval=0.05)
+        assert _wait(lambda: mirror.mode == MODE_LISTENING)
+        other.save_player_score(_player("a", 20))
+        assert _wait(lambda: mirror.top(SCOPE, 10) is not None)
+
+        rpcs = client.stats["rpcs"]
+        assert [e["entry_id"] for e in service.get_leaderboard(10, SCOPE)] == ["a"]
+        assert client.stats["rpcs"] == rpcs
+
+    def test_own_scores_are_visible_immediately(self, service):
+        """この端末で保存したスコアはリスナーの通知を待たずに写しに入る"""
+        mirror = service.start_leaderboard_mirror(poll_interval=0.05)
+        assert _wait(lambda: mirror.status()["version"] > 0)
+        # リスナーを止めても、保存したスコアは写しに入る
+        mirror.stop(timeout=2)
+        service.save_player_score(_player("b", 25))
+        assert [e["entry_id"] for e in mirror.top(SCOPE, 10)] == ["b"]
+
+    def test_falls_back_to_polling_and_reconnects(self, service, client):
+        """接続が切れるとポーリングに切り替え、戻ればリスナーをつなぎ直す"""
+        mirror = service.start_leaderboard_mirror(poll_interval=0.05, base_backoff=0.05)
+        assert _wait(lambda: mirror.mode == MODE_LISTENING)
+        client.offline = True
+        assert _wait(lambda: mirror.mode == MODE_POLLING)
+        client.offline = False
+        # 通信エラーで開いたブレーカーは疎通確認を待たずに閉じる
+        service.breaker.record_success()
+        assert _wait(lambda: mirror.mode == MODE_LISTENING)
+
+    def test_stale_mirror_is_not_used(self):
+        """ポーリングが失敗し続けて古くなった写しは使わない"""
+        now = [0.0]
+
+        def fetch():
+            if now[0] > 0:
+                raise ConnectionError("offline")
+            return [(SCOPE, [{"entry_id": "a"}])]
+
+        mirror = LeaderboardMirror(lambda callback: None, fetch, max_stale=10, clock=lambda: now[0])
+        mirror._poll()
+        assert mirror.top(SCOPE, 10) == [{"entry_id": "a"}]
+        now[0] = 20
+        mirror._poll()
+        assert mirror.top(SCOPE, 10) is None
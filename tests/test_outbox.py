@@ -0,0 +1,133 @@
+"""
+Tests for services/outbox.py
+"""
+import time
+import pytest
+from services.backends import BackendUnavailable, MemoryBackend, MirroredBackend
+from services.outbox import Outbox, OutboxReplayer
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), base_backoff=10.0)
+    yield outbox
+    outbox.close()
+
+
+class _FlakyBackend(MemoryBackend):
+    """down が True の間は書き込みに失敗する保存先"""
+
+    name = "flaky"
+
+    def __init__(self):
+        super().__init__()
+        self.down = True
+        self.participant_keys = []
+
+    def add_scores(self, entries):
+        if self.down:
+            raise BackendUnavailable("down")
+        super().add_scores(entries)
+
+    def append_sessions(self, entries):
+        if self.down:
+            raise BackendUnavailable("down")
+        super().append_sessions(entries)
+
+    def add_participants(self, day_counts, idempotency_key=None):
+        if self.down:
+            raise BackendUnavailable("down")
+        # Firestore と同じく、同じキーの加算は1回分として数える
+        if idempotency_key in self.participant_keys:
+            return sum(self.participant_counts().values())
+        self.participant_keys.append(idempotency_key)
+        return super().add_participants(day_counts)
+
+
+class TestOutbox:
+    """送信待ち箱のテスト"""
+
+    def test_same_key_is_recorded_once(self, outbox):
+        """同じキーの操作は1件だけ残る"""
+        assert outbox.add("add_scores", [("k1", {"n": 1}), ("k2", {"n": 2})]) == 2
+        assert outbox.add("add_scores", [("k1", {"n": 1})]) == 0
+        assert outbox.size() == 2
+        assert [item.payload for item in outbox.due()] == [{"n": 1}, {"n": 2}]
+
+    def test_failed_items_are_backed_off(self, outbox):
+        """失敗した行は時間をおいてから再送対象に戻る"""
+        outbox.add("add_scores", [("k1", {"n": 1})])
+        outbox.fail(outbox.due(), "offline")
+        assert outbox.due() == []
+        later = outbox.due(now=time.time() + 60)
+        assert [item.attempts for item in later] == [1]
+        outbox.retry_now()
+        assert len(outbox.due()) == 1
+
+    def test_records_survive_reopen(self, tmp_path):
+        """プロセスを再起動しても送信待ちが残る"""
+        path = str(tmp_path / "outbox.db")
+        first = Outbox(path)
+        first.add("append_sessions", [("s1", {"session_id": "s1"})])
+        first.close()
+        second = Outbox(path)
+        assert [item.key for item in second.due()] == ["s1"]
+        second.complete(second.due())
+        assert second.size() == 0
+        second.close()
+
+    def test_replayer_completes_and_retries(self, outbox):
+        """送れた行は消し、ハンドラが返した行は残す"""
+        outbox.add("op", [("ok", {}), ("ng", {})])
+        replayer = OutboxReplayer(outbox, lambda op, items: [i for i in items if i.key == "ng"])
+        assert replayer.drain_once()
+        assert outbox.size() == 1
+        assert outbox.due() == []
+
+    def test_handler_error_keeps_all_items(self, outbox):
+        """ハンドラが例外を出した場合はすべて残す"""
+        outbox.add("op", [("a", {}), ("b", {})])
+
+        def broken(op, items):
+            raise RuntimeError("offline")
+
+        assert not OutboxReplayer(outbox, broken).drain_once()
+        assert outbox.size() == 2
+
+
+class TestMirroredOutbox:
+    """MirroredBackend からの記録と再送"""
+
+    def test_failed_writes_are_replayed_once(self, outbox):
+        """優先先が戻ったら Outbox の書き込みを1回だけ反映する"""
+        primary, mirror = _FlakyBackend(), MemoryBackend()
+        backend = MirroredBackend(primary, mirror, outbox=outbox)
+        backend.add_scores([{"entry_id": "e1", "player_name": "a", "score": 5,
+                             "timestamp": "2025-01-31T10:00:00"}])
+        backend.append_sessions([{"session_id": "s1"}])
+        backend.add_participants({"2025-01-31": 1})
+        assert outbox.size() == 3
+        assert mirror.participant_counts() == {"2025-01-31": 1}
+
+        primary.down = False
+        replayer = OutboxReplayer(outbox, backend.replay_outbox)
+        outbox.retry_now()
+        assert replayer.drain_once()
+        assert outbox.size() == 0
+        assert [e["entry_id"] for e in primary.top_scores(5)] == ["e1"]
+        assert [s["session_id"] for s in primary.iter_sessions()] == ["s1"]
+        assert primary.participant_counts() == {"2025-01-31": 1}
+
+        # 同じ行をもう一度送っても人数は増えない
+        key = primary.participant_keys[0]
+        primary.add_participants({"2025-01-31": 1}, idempotency_key=key)
+        assert primary.participant_counts() == {"2025-01-31": 1}
+
+    def test_clear_scores_discards_pending_scores(self, outbox):
+        """ランキングのリセットで未送信のスコアも捨てる"""
+        primary = _FlakyBackend()
+        backend = MirroredBackend(primary, MemoryBackend(), outbox=outbox)
+        backend.add_scores([{"entry_id": "e1", "score": 1, "timestamp": "t"}])
+        backend.add_participants({"2025-01-31": 1})
+        backend.clear_scores()
+        assert [item.op for item in outbox.due()] == ["add_participants"]
@@ -0,0 +1,248 @@
+"""
+Tests for services/rank_index.py
+"""
+import threading
+from services.rank_index import (
+    ALL, ALL_SCORES, Partition, PartitionedLeaderboard, PersistentRankIndex, ScoreRange,
+    ScoreRankIndex,
+)
+
+
+def _entry(entry_id, score, timestamp):
+    return {"entry_id": entry_id, "score": score, "timestamp": timestamp}
+
+
+class TestScoreRankIndex:
+    """順位インデックスのテスト"""
+
+    def test_rank_by_entry_id(self):
+        """保存済みエントリの順位と総数を返す"""
+        index = ScoreRankIndex()
+        index.load([_entry("a", 100, "t1"), _entry("b", 300, "t2"), _entry("c", 200, "t3")])
+        assert index.rank_by_entry_id("b")["rank"] == 1
+        assert index.rank_by_entry_id("a") == {"rank": 3, "total": 3, "percentile": 100.0}
+        assert index.rank_by_entry_id("missing") is None
+
+    def test_same_name_same_score_distinguished_by_time(self):
+        """同名・同点でも先着が上位になる"""
+        index = ScoreRankIndex()
+        index.add(_entry("first", 100, "2025-01-01T10:00:00"))
+        index.add(_entry("second", 100, "2025-01-01T10:05:00"))
+        assert index.rank_by_entry_id("first")["rank"] == 1
+        assert index.rank_by_entry_id("second")["rank"] == 2
+
+    def test_rank_of_outside_top_ten(self):
+        """上位10位の外でも正確な順位を返す"""
+        index = ScoreRankIndex()
+        for i in range(50):
+            index.add(_entry(f"p{i}", 1000 - i, f"t{i:02d}"))
+        info = index.rank_of(1000 - 30, "t30")
+        assert info["rank"] == 31
+        assert info["total"] == 50
+        assert info["percentile"] == 62.0
+
+    def test_add_is_idempotent_per_entry_id(self):
+        """同じ entry_id は二重に数えない"""
+        index = ScoreRankIndex()
+        index.add(_entry("a", 1, "t1"))
+        index.add(_entry("a", 1, "t1"))
+        assert len(index) == 1
+
+
+def _scoped(entry_id, score, timestamp, event_id="default", age_group="5plus"):
+    return {**_entry(entry_id, score, timestamp), "event_id": event_id, "age_group": age_group}
+
+
+class TestPartition:
+    """パーティションのテスト"""
+
+    def test_of_fills_defaults(self):
+        """event_id が無いエントリは default イベント扱い"""
+        partition = Partition.of({"timestamp": "2025-01-31T10:00:00"})
+        assert partition == Partition("default", "", "2025-01-31")
+
+    def test_generalizations_cover_all_combinations(self):
+        """どの項目を「すべて」にしても集計先に含まれる"""
+        partition = Partition("ev", "under5", "2025-01-31")
+        generalized = partition.generalizations()
+        assert len(generalized) == 8
+        assert ALL in generalized
+        assert Partition("ev", None, "2025-01-31") in generalized
+        assert all(p.matches(_scoped("a", 1, "2025-01-31T10:00:00", "ev", "under5")) for p in generalized)
+
+    def test_matches(self):
+        """指定した項目だけで絞り込む"""
+        entry = _scoped("a", 1, "2025-01-31T10:00:00", "ev", "5plus")
+        assert Partition(age_group="5plus").matches(entry)
+        assert not Partition(event_id="other").matches(entry)
+        assert not Partition(day="2025-02-01").matches(entry)
+
+
+class TestScoreRange:
+    """削除範囲のテスト"""
+
+    def test_matches_event_and_days(self):
+        """イベントと日付範囲（両端を含む）で判定する"""
+        scope = ScoreRange(event_id="ev", start_day="2025-01-31", end_day="2025-02-01")
+        assert scope.matches(_scoped("a", 1, "2025-02-01T23:59:59", event_id="ev"))
+        assert not scope.matches(_scoped("a", 1, "2025-02-02T00:00:00", event_id="ev"))
+        assert not scope.matches(_scoped("a", 1, "2025-01-31T10:00:00", event_id="other"))
+
+    def test_missing_event_id_is_default(self):
+        """event_id の無い古いスコアは default イベント扱い"""
+        assert ScoreRange(event_id="default").matches(_entry("a", 1, "2025-01-31"))
+        assert ALL_SCORES.is_all
+
+
+class TestPartitionedLeaderboard:
+    """パーティション別ランキングのテスト"""
+
+    def test_top_and_rank_per_partition(self):
+        """年齢グループ・日ごとに別々の順位になる"""
+        board = PartitionedLeaderboard()
+        board.load([
+            _scoped("a", 300, "2025-01-31T10:00:00", age_group="5plus"),
+            _scoped("b", 200, "2025-01-31T10:01:00", age_group="under5"),
+            _scoped("c", 100, "2025-01-31T10:02:00", age_group="under5"),
+            _scoped("d", 400, "2025-02-01T10:00:00", age_group="under5"),
+        ])
+        under5_day1 = Partition("default", "under5", "2025-01-31")
+        assert [e["entry_id"] for e in board.top(under5_day1, 10)] == ["b", "c"]
+        assert board.rank_by_entry_id(under5_day1, "c") == {"rank": 2, "total": 2, "percentile": 100.0}
+        assert board.rank_by_entry_id(ALL, "c")["rank"] == 4
+        assert board.rank_by_entry_id(Partition(age_group="under5"), "b")["rank"] == 2
+        assert board.rank_of(Partition(day="2025-01-31"), 250, "2025-01-31T11:00:00")["rank"] == 2
+
+    def test_unknown_partition_is_empty(self):
+        """スコアの無いパーティションは空"""
+        board = PartitionedLeaderboard()
+        board.add(_scoped("a", 1, "2025-01-31T10:00:00"))
+        missing = Partition(event_id="other")
+        assert board.top(missing, 10) == []
+        assert board.rank_by_entry_id(missing, "a") is None
+        assert board.rank_of(missing, 1, "t")["rank"] == 1
+
+    def test_add_is_idempotent_per_entry_id(self):
+        """同じ entry_id はどのパーティションでも二重に数えない"""
+        board = PartitionedLeaderboard()
+        board.add(_scoped("a", 1, "2025-01-31T10:00:00"))
+        board.add(_scoped("a", 1, "2025-01-31T10:00:00"))
+        assert len(board.top(ALL, 10)) == 1
+        assert len(board.partitions()) == 8
+
+
+class TestPersistentRankIndex:
+    """履歴ファイルとの同期テスト"""
+
+    def test_history_survives_restart(self, tmp_path):
+        """再起動後も履歴から順位を復元できる"""
+        path = str(tmp_path / "score_history.jsonl")
+        PersistentRankIndex(path).add(_entry("a", 10, "t1"))
+        PersistentRankIndex(path).add(_entry("b", 20, "t2"))
+        assert PersistentRankIndex(path).rank_by_entry_id("a") == {"rank": 2, "total": 2, "percentile": 100.0}
+
+    def test_seeds_from_leaderboard_when_empty(self, tmp_path):
+        """履歴が無ければ既存リーダーボードから作る"""
+        path = str(tmp_path / "score_history.jsonl")
+        index = PersistentRankIndex(path, seed_loader=lambda: [_entry("old", 500, "t0")])
+        assert index.rank_of(100, "t9")["rank"] == 2
+
+    def test_clear_archives_history(self, tmp_path):
+        """リセット後は再起動しても履歴が戻らない"""
+        path = str(tmp_path / "score_history.jsonl")
+        index = PersistentRankIndex(path)
+        index.add(_entry("a", 10, "t1"))
+        index.clear()
+        assert PersistentRankIndex(path).rank_by_entry_id("a") is None
+
+    def test_scoped_clear_keeps_other_scores(self, tmp_path):
+        """範囲を指定したリセットでは範囲外のスコアが再起動後も残る"""
+        path = str(tmp_path / "score_history.jsonl")
+        index = PersistentRankIndex(path)
+        index.add_many([
+            _scoped("a", 10, "2025-01-31T10:00:00", event_id="ev"),
+            _scoped("b", 20, "2025-01-31T10:01:00", event_id="other"),
+        ])
+        index.clear(ScoreRange(event_id="ev"))
+        assert index.rank_by_entry_id("a") is None
+        assert [e["entry_id"] for e in PersistentRankIndex(path).top(10)] == ["b"]
+
+    def test_scoped_clear_keeps_concurrent_writes(self, tmp_path, monkeypatch):
+        """範囲を指定したリセットの途中で他プロセスが保存したスコアも失わない"""
+        path = str(tmp_path / "score_history.jsonl")
+        a, b = PersistentRankIndex(path), PersistentRankIndex(path)
+        a.add_many([
+            _scoped("old", 10, "2025-01-30T10:00:00"),
+            _scoped("cleared", 20, "2025-01-31T10:00:00"),
+        ])
+        writers = [
+            threading.Thread(target=b.add, args=(_scoped(entry_id, 30, "2025-02-01T10:00:00"),))
+            for entry_id in ("before", "during")
+        ]
+
+        def write(writer):
+            # 他プロセスの保存（ロック待ちになる場合は待たずに先へ進む）
+            if writer.ident is None:
+                writer.start()
+                writer.join(timeout=0.5)
+
+        archive = a._log.archive
+
+        def archive_after_write(keep=None):
+            write(writers[0])
+            return archive(keep)
+
+        monkeypatch.setattr(a._log, "archive", archive_after_write)
+
+        class _WriteWhileClearing(ScoreRange):
+            def matches(self, entry):
+                write(writers[1])
+                return super().matches(entry)
+
+        a.clear(_WriteWhileClearing(start_day="2025-01-31", end_day="2025-01-31"))
+        for writer in writers:
+            writer.join()
+        expected = ["before", "during", "old"]
+        assert sorted(e["entry_id"] for e in PersistentRankIndex(path).top(10)) == expected
+        assert sorted(e["entry_id"] for e in a.top(10)) == expected
+
+    def test_partitions_survive_restart(self, tmp_path):
+        """履歴から再起動後もパーティション別の順位を復元できる"""
+        path = str(tmp_path / "score_history.jsonl")
+        PersistentRankIndex(path).add_many([
+            _scoped("a", 10, "2025-01-31T10:00:00", event_id="ev"),
+            _scoped("b", 20, "2025-01-31T10:01:00"),
+        ])
+        index = PersistentRankIndex(path)
+        ev = Partition(event_id="ev")
+        assert index.rank_by_entry_id("a", ev) == {"rank": 1, "total": 1, "percentile": 100.0}
+        assert [e["entry_id"] for e in index.top(10, ev)] == ["a"]
+        assert index.rank_by_entry_id("a")["rank"] == 2
+
+    def test_two_instances_share_history(self, tmp_path):
+        """同じ履歴を使う2つのプロセス（インスタンス）が互いの追記・リセットを反映する"""
+        path = str(tmp_path / "score_history.jsonl")
+        a, b = PersistentRankIndex(path), PersistentRankIndex(path)
+        a.add(_entry("x", 10, "t1"))
+        b.add(_entry("y", 20, "t2"))
+        assert [e["entry_id"] for e in a.top(10)] == ["y", "x"]
+        assert [e["entry_id"] for e in b.top(10)] == ["y", "x"]
+        assert b.rank_by_entry_id("y") == {"rank": 1, "total": 2, "percentile": 50.0}
+        assert a.rank_by_entry_id("x")["rank"] == 2
+
+        a.clear()
+        assert b.top(10) == []
+        assert b.rank_by_entry_id("y") is None
+
+    def test_reads_only_appended_records(self, tmp_path):
+        """他のインスタンスの追記は、書き込み途中の末尾を除いて差分だけ読む"""
+        path = str(tmp_path / "score_history.jsonl")
+        a, b = PersistentRankIndex(path), PersistentRankIndex(path)
+        a.add(_entry("x", 10, "t1"))
+        assert len(b.top(10)) == 1
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"entry_id": "z", "score": 5')
+        assert len(b.top(10)) == 1
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(', "timestamp": "t3"}\n')
+        assert [e["entry_id"] for e in b.top(10)] == ["x", "z"]
@@ -0,0 +1,97 @@
+"""
+Tests for services/session_log.py
+"""
+import gzip
+import json
+import os
+from services.session_log import SessionLog
+
+
+def _make_log(tmp_path, **kwargs):
+    return SessionLog(
+        path=str(tmp_path / "game_sessions.jsonl"),
+        legacy_path=str(tmp_path / "game_sessions.json"),
+        **kwargs,
+    )
+
+
+class TestAppend:
+    """追記テスト"""
+
+    def test_append_writes_one_line_per_record(self, tmp_path):
+        """1レコード = 1行で追記される"""
+        log = _make_log(tmp_path)
+        log.append({"session_id": "a"})
+        log.append({"session_id": "b"})
+        with open(log.path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert [json.loads(line)["session_id"] for line in lines] == ["a", "b"]
+
+    def test_keeps_japanese_text(self, tmp_path):
+        """日本語はエスケープせずに保存される"""
+        log = _make_log(tmp_path)
+        log.append({"participant_name": "テスト"})
+        with open(log.path, encoding='utf-8') as f:
+            assert "テスト" in f.read()
+
+
+class TestRotation:
+    """ローテーションテスト"""
+
+    def test_rotates_by_size_and_compresses(self, tmp_path):
+        """サイズ上限を超えると gzip セグメントに退避される"""
+        log = _make_log(tmp_path, max_bytes=10, rotate_daily=False)
+        log.append({"session_id": "first"})
+        log.append({"session_id": "second"})
+        segments = log.segments()
+        assert len(segments) == 2
+        assert segments[0].endswith(".jsonl.gz")
+        with gzip.open(segments[0], 'rt', encoding='utf-8') as f:
+            assert json.loads(f.readline())["session_id"] == "first"
+
+    def test_rotates_on_day_change(self, tmp_path):
+        """日付が変わると新しいセグメントになる"""
+        log = _make_log(tmp_path)
+        log.append({"session_id": "yesterday"})
+        old = os.stat(log.path).st_mtime - 2 * 24 * 3600
+        os.utime(log.path, (old, old))
+        log.append({"session_id": "today"})
+        assert len(log.segments()) == 2
+
+    def test_iter_records_spans_segments_in_order(self, tmp_path):
+        """ローテーション済みセグメントも含めて古い順に読める"""
+        log = _make_log(tmp_path, max_bytes=10, rotate_daily=False)
+        for i in range(5):
+            log.append({"n": i})
+        assert [r["n"] for r in log.iter_records()] == [0, 1, 2, 3, 4]
+
+
+class TestLegacyMigration:
+    """旧形式からの移行テスト"""
+
+    def test_migrates_json_array(self, tmp_path):
+        """JSON配列の旧ログが JSON Lines に移行される"""
+        legacy = tmp_path / "game_sessions.json"
+        legacy.write_text(json.dumps([{"n": 1}, {"n": 2}]), encoding='utf-8')
+        log = _make_log(tmp_path)
+        log.append({"n": 3})
+        assert [r["n"] for r in log.iter_records()] == [1, 2, 3]
+        assert not legacy.exists()
+        assert (tmp_path / "game_sessions.json.migrated").exists()
+
+    def test_skips_broken_lines(self, tmp_path):
+        """書き込み途中の壊れた行は読み飛ばす"""
+        log = _make_log(tmp_path)
+        log.append({"n": 1})
+        with open(log.path, 'a', encoding='utf-8') as f:
+            f.write('{"n": 2')
+        assert [r["n"] for r in log.iter_records()] == [1]
+
+    def test_append_after_torn_line(self, tmp_path):
+        """途中で落ちた行の後に追記しても、新しいレコードは読める"""
+        log = _make_log(tmp_path)
+        log.append({"n": 1})
+        with open(log.path, 'a', encoding='utf-8') as f:
+            f.write('{"n": 2')
+        log.append({"n": 3})
+        assert [r["n"] for r in log.iter_records()] == [1, 3]
@@ -0,0 +1,218 @@
+"""
+Tests for services/sqlite_store.py
+"""
+import threading
+import pytest
+from services.rank_index import Partition
+from services.sqlite_store import SQLiteStore, _partition_filter
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    store = SQLiteStore(str(tmp_path / "test.db"))
+    yield store
+    store.close()
+
+
+def _entry(name, score, timestamp):
+    return {
+        "entry_id": f"{name}-{timestamp}",
+        "player_name": name,
+        "age_group": "5plus",
+        "teeth_count": 0,
+        "tooth_coins": score,
+        "play_time": "0分0秒",
+        "score": score,
+        "timestamp": timestamp,
+    }
+
+
+class TestScores:
+    """スコア保存テスト"""
+
+    def test_top_scores_ordered_by_score_then_time(self, sqlite):
+        """スコア降順、同点は先着順"""
+        sqlite.add_score(_entry("b", 100, "2025-01-01T10:00:02"))
+        sqlite.add_score(_entry("a", 100, "2025-01-01T10:00:01"))
+        sqlite.add_score(_entry("c", 300, "2025-01-01T10:00:03"))
+        names = [row["player_name"] for row in sqlite.top_scores(10)]
+        assert names == ["c", "a", "b"]
+
+    def test_top_scores_limit(self, sqlite):
+        """件数制限が効く"""
+        for i in range(20):
+            sqlite.add_score(_entry(f"p{i}", i, f"2025-01-01T10:00:{i:02d}"))
+        assert len(sqlite.top_scores(5)) == 5
+
+    def test_clear_scores(self, sqlite):
+        """全スコア削除"""
+        sqlite.add_score(_entry("a", 1, "2025-01-01T10:00:00"))
+        sqlite.clear_scores()
+        assert sqlite.top_scores(10) == []
+
+    def test_rank_lookup(self, sqlite):
+        """全スコア中の順位を返す（同点は先着が上位）"""
+        sqlite.add_score(_entry("a", 100, "2025-01-01T10:00:01"))
+        sqlite.add_score(_entry("b", 100, "2025-01-01T10:00:02"))
+        sqlite.add_score(_entry("c", 300, "2025-01-01T10:00:03"))
+        assert sqlite.rank_by_entry_id("b-2025-01-01T10:00:02") == {"rank": 3, "total": 3, "percentile": 100.0}
+        assert sqlite.rank_of(200, "2025-01-01T11:00:00")["rank"] == 2
+        assert sqlite.rank_by_entry_id("missing") is None
+
+    def test_partitioned_queries(self, sqlite):
+        """イベント・年齢グループ・日で絞り込んだ順位"""
+        sqlite.add_scores([
+            {**_entry("a", 300, "2025-01-31T10:00:00"), "event_id": "ev"},
+            {**_entry("b", 200, "2025-01-31T10:01:00"), "event_id": "ev", "age_group": "under5"},
+            {**_entry("c", 100, "2025-02-01T10:00:00"), "event_id": "ev", "age_group": "under5"},
+            _entry("d", 400, "2025-01-31T10:02:00"),
+        ])
+        under5 = Partition("ev", "under5", None)
+        assert [row["player_name"] for row in sqlite.top_scores(10, under5)] == ["b", "c"]
+        assert sqlite.rank_by_entry_id("c-2025-02-01T10:00:00", under5)["rank"] == 2
+        day = Partition(event_id="ev", day="2025-01-31")
+        assert sqlite.rank_of(250, "2025-01-31T11:00:00", day) == {"rank": 2, "total": 2, "percentile": 100.0}
+        assert [row["player_name"] for row in sqlite.top_scores(10, Partition(event_id="default"))] == ["d"]
+
+    def test_migrates_old_schema(self, tmp_path):
+        """entry_id 列の無い旧DBにも列を追加して開ける"""
+        import sqlite3
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE scores (id INTEGER PRIMARY KEY AUTOINCREMENT, player_name TEXT NOT NULL, "
+            "participant_age INTEGER, age_group TEXT, teeth_count INTEGER NOT NULL DEFAULT 0, "
+            "tooth_coins INTEGER NOT NULL DEFAULT 0, play_time TEXT, score INTEGER NOT NULL, "
+            "timestamp TEXT NOT NULL)"
+        )
+        conn.execute("INSERT INTO scores (player_name, age_group, score, timestamp) "
+                     "VALUES ('old', NULL, 5, '2025-01-31T09:00:00')")
+        conn.commit()
+        conn.close()
+        store = SQLiteStore(path)
+        store.add_score(_entry("a", 1, "t1"))
+        assert store.rank_by_entry_id("a-t1")["rank"] == 2
+        # 旧データも日付・年齢グループの列で絞り込める
+        assert [row["player_name"] for row in store.top_scores(10, Partition("default", "", "2025-01-31"))] == ["old"]
+        store.close()
+
+    def test_concurrent_migrations(self, tmp_path):
+        """複数のプロセスが同時に旧DBを開いても、列の追加が重複して失敗しない"""
+        import sqlite3
+        for round_ in range(5):
+            path = str(tmp_path / f"old{round_}.db")
+            conn = sqlite3.connect(path)
+            conn.execute(
+                "CREATE TABLE scores (id INTEGER PRIMARY KEY AUTOINCREMENT, player_name TEXT NOT NULL, "
+                "participant_age INTEGER, age_group TEXT, teeth_count INTEGER NOT NULL DEFAULT 0, "
+                "tooth_coins INTEGER NOT NULL DEFAULT 0, play_time TEXT, score INTEGER NOT NULL, "
+                "timestamp TEXT NOT NULL)"
+            )
+            conn.commit()
+            conn.close()
+            # SQLiteStore ごとにスキーマのロックは別なので、別プロセスと同じ状況になる
+            stores = [SQLiteStore(path) for _ in range(4)]
+            barrier = threading.Barrier(len(stores))
+            errors = []
+
+            def open_store(store):
+                barrier.wait()
+                try:
+                    store.top_scores(1)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    store.close()
+
+            threads = [threading.Thread(target=open_store, args=(store,)) for store in stores]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert errors == []
+
+    def test_partition_queries_use_index(self, sqlite):
+        """パーティションの絞り込みは索引で引く（全件走査しない）"""
+        clauses, params = _partition_filter(Partition("ev", "5plus", "2025-01-31"))
+        plan = " ".join(row[-1] for row in sqlite._connect().execute(
+            f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM scores WHERE {' AND '.join(clauses)} AND score > ?",
+            (*params, 10),
+        ))
+        assert "idx_scores_partition_day" in plan
+        assert "SCAN scores" not in plan
+
+    def test_uses_wal_mode(self, sqlite):
+        """WALモードで開かれる"""
+        mode = sqlite._connect().execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+
+class TestParticipants:
+    """参加者数テスト"""
+
+    def test_increment_returns_total(self, sqlite):
+        """累計参加者数を返す"""
+        assert sqlite.increment_participants("2025-01-01") == 1
+        assert sqlite.increment_participants("2025-01-02") == 2
+        assert sqlite.participant_counts() == {"2025-01-01": 1, "2025-01-02": 1}
+
+    def test_concurrent_increments_are_not_lost(self, tmp_path):
+        """複数スレッドから同時に増やしても取りこぼさない"""
+        path = str(tmp_path / "concurrent.db")
+
+        def worker():
+            store = SQLiteStore(path)
+            for _ in range(25):
+                store.increment_participants("2025-01-01")
+            store.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert SQLiteStore(path).participant_counts() == {"2025-01-01": 100}
+
+
+class TestSessions:
+    """体験ログテスト"""
+
+    def test_append_and_iterate(self, sqlite):
+        """追加した順に読み出せる"""
+        sqlite.append_session({"timestamp": "t1", "session_id": "a", "participant_name": "テスト"})
+        sqlite.append_session({"timestamp": "t2", "session_id": "b"})
+        sessions = list(sqlite.iter_sessions())
+        assert [s["session_id"] for s in sessions] == ["a", "b"]
+        assert sessions[0]["participant_name"] == "テスト"
+
+    def test_import_json(self, sqlite):
+        """既存JSONデータを取り込める"""
+        assert sqlite.is_empty()
+        sqlite.import_json(
+            [_entry("a", 10, "2025-01-01T10:00:00")],
+            {"2025-01-01": 3},
+            iter([{"timestamp": "t", "session_id": "x"}]),
+        )
+        assert not sqlite.is_empty()
+        assert sqlite.participant_counts() == {"2025-01-01": 3}
+        assert len(list(sqlite.iter_sessions())) == 1
+
+    def test_import_json_only_once(self, sqlite):
+        """取り込み済みを記録し、二度目の取り込みでは何も加算しない"""
+        assert not sqlite.json_imported()
+        sqlite.import_json([_entry("a", 10, "2025-01-01T10:00:00")], {"2025-01-01": 3})
+        assert sqlite.json_imported()
+        sqlite.clear_scores()
+        sqlite.import_json([_entry("a", 10, "2025-01-01T10:00:00")], {"2025-01-01": 3})
+        assert sqlite.top_scores(10) == []
+        assert sqlite.participant_counts() == {"2025-01-01": 3}
+
+    def test_import_legacy_scores(self, sqlite):
+        """旧形式（total_score）のスコアも取り込み、使えない行だけ飛ばす"""
+        legacy = {"player_name": "old", "total_score": 42, "teeth_count": 20,
+                  "tooth_coins": 22, "timestamp": "2024-12-01T10:00:00"}
+        skipped = sqlite.import_json(
+            [legacy, _entry("a", 10, "2025-01-01T10:00:00"), {"player_name": "broken"}], {},
+        )
+        assert skipped == 1
+        assert [(row["player_name"], row["score"]) for row in sqlite.top_scores(10)] == [("old", 42), ("a", 10)]
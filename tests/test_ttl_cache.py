@@ -0,0 +1,154 @@
+"""
+Tests for services/ttl_cache.py
+"""
+import threading
+import time
+import pytest
+from services.firebase import FirebaseService
+from services.rank_index import ALL, Partition
+from services.ttl_cache import StaleWhileRevalidateCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+class TestStaleWhileRevalidateCache:
+    """キャッシュのテスト"""
+
+    def test_fresh_value_is_reused(self, clock):
+        """期限内は読み込まない"""
+        cache = StaleWhileRevalidateCache(ttl=10, max_stale=60, clock=clock)
+        calls = []
+        assert cache.get("k", lambda: calls.append(1) or "v1") == "v1"
+        clock.now = 5
+        assert cache.get("k", lambda: calls.append(1) or "v2") == "v1"
+        assert len(calls) == 1
+
+    def test_stale_value_is_served_while_refreshing(self, clock):
+        """期限切れの値を返しつつ裏で読み直す"""
+        cache = StaleWhileRevalidateCache(ttl=10, max_stale=60, clock=clock)
+        cache.get("k", lambda: "old")
+        clock.now = 20
+        gate = threading.Event()
+
+        def slow_loader():
+            gate.wait(2)
+            return "new"
+
+        assert cache.get("k", slow_loader) == "old"
+        # 読み直し中は何度呼んでもスレッドを増やさない
+        assert cache.get("k", slow_loader) == "old"
+        gate.set()
+        assert _wait_for(lambda: cache.peek("k") == "new")
+
+    def test_too_stale_value_is_loaded_synchronously(self, clock):
+        """古すぎる値は返さずに読み込む"""
+        cache = StaleWhileRevalidateCache(ttl=10, max_stale=60, clock=clock)
+        cache.get("k", lambda: "old")
+        clock.now = 100
+        assert cache.get("k", lambda: "new") == "new"
+
+    def test_loader_error_is_not_cached(self, clock):
+        """読み込みに失敗した場合は例外を送出し、次回また読む"""
+        cache = StaleWhileRevalidateCache(ttl=10, clock=clock)
+
+        def broken():
+            raise RuntimeError("offline")
+
+        with pytest.raises(RuntimeError):
+            cache.get("k", broken)
+        assert cache.get("k", lambda: "v") == "v"
+
+    def test_failed_refresh_keeps_stale_value(self, clock):
+        """裏での読み直しに失敗しても古い値を使い続ける"""
+        cache = StaleWhileRevalidateCache(ttl=10, max_stale=60, clock=clock)
+        cache.get("k", lambda: "old")
+        clock.now = 20
+        done = threading.Event()
+
+        def broken():
+            done.set()
+            raise RuntimeError("offline")
+
+        assert cache.get("k", broken) == "old"
+        assert done.wait(2)
+        assert _wait_for(lambda: cache.get("k", lambda: "old") == "old")
+
+    def test_refresh_does_not_overwrite_newer_write(self, clock):
+        """読み直し中に書き込みで更新された値は上書きしない"""
+        cache = StaleWhileRevalidateCache(ttl=10, max_stale=60, clock=clock)
+        cache.get("k", lambda: ["a"])
+        clock.now = 20
+        gate, finished = threading.Event(), threading.Event()
+
+        def slow_loader():
+            gate.wait(2)
+            finished.set()
+            return ["a"]
+
+        cache.get("k", slow_loader)
+        cache.update_all(lambda key, value: value + ["b"])
+        gate.set()
+        assert finished.wait(2)
+        time.sleep(0.05)
+        assert cache.peek("k") == ["a", "b"]
+
+    def test_zero_ttl_disables_cache(self, clock):
+        """ttl が 0 なら毎回読み込む"""
+        cache = StaleWhileRevalidateCache(ttl=0, clock=clock)
+        calls = []
+        cache.get("k", lambda: calls.append(1))
+        cache.get("k", lambda: calls.append(1))
+        assert len(calls) == 2
+        assert len(cache) == 0
+
+
+class TestLeaderboardWriteThrough:
+    """保存したスコアのキャッシュへの反映"""
+
+    def _service(self, clock):
+        service = FirebaseService()
+        service.leaderboard_cache = StaleWhileRevalidateCache(ttl=10, clock=clock)
+        return service
+
+    def _score(self, entry_id, score, age_group="5plus"):
+        return {"entry_id": entry_id, "score": score, "age_group": age_group, "event_id": "ev",
+                "client_timestamp": f"2025-01-31T10:00:0{len(entry_id)}",
+                "timestamp": "2025-01-31T10:00:00"}
+
+    def test_saved_score_is_inserted_in_matching_leaderboards(self, clock):
+        """該当するリーダーボードにだけ順位どおりに挿入される"""
+        service = self._service(clock)
+        cache = service.leaderboard_cache
+        cache.put((2, ALL), [self._score("a", 300), self._score("b", 100)])
+        cache.put((2, Partition(age_group="under5")), [])
+        service._add_to_cached_leaderboards(self._score("c", 200))
+        assert [e["entry_id"] for e in cache.peek((2, ALL))] == ["a", "c"]
+        assert cache.peek((2, Partition(age_group="under5"))) == []
+
+    def test_duplicate_and_low_scores_do_not_change_cache(self, clock):
+        """同じ entry_id や上位に入らないスコアでは変わらない"""
+        service = self._service(clock)
+        cache = service.leaderboard_cache
+        top = [self._score("a", 300), self._score("b", 100)]
+        cache.put((2, ALL), top)
+        service._add_to_cached_leaderboards(self._score("a", 300))
+        service._add_to_cached_leaderboards(self._score("z", 1))
+        assert cache.peek((2, ALL)) is top
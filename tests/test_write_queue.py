@@ -0,0 +1,99 @@
+"""
+Tests for services/write_queue.py
+"""
+import threading
+import time
+import pytest
+from services.write_queue import WriteBehindQueue
+
+
+def _wait_until_empty(queue, timeout=2.0):
+    """再試行待ちも含めて要求がなくなるまで待つ"""
+    deadline = time.monotonic() + timeout
+    while queue.depth() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def write_queue():
+    queue = WriteBehindQueue(batch_size=10, max_retries=3, base_backoff=0.01, max_backoff=0.05)
+    yield queue
+    queue.shutdown(timeout=2)
+
+
+class TestWriteBehindQueue:
+    """書き込みキューのテスト"""
+
+    def test_unknown_kind_is_rejected(self, write_queue):
+        """未登録の種類は積めない"""
+        with pytest.raises(ValueError):
+            write_queue.submit("missing", {})
+
+    def test_writes_are_batched(self, write_queue):
+        """同じ種類の要求はまとめてハンドラに渡される"""
+        batches = []
+        gate = threading.Event()
+
+        def handler(batch):
+            gate.wait(2)
+            batches.append([item["n"] for item in batch])
+            return []
+
+        write_queue.register_handler("score", handler)
+        write_queue.submit("score", {"n": 0})
+        for n in range(1, 5):
+            write_queue.submit("score", {"n": n})
+        gate.set()
+        assert write_queue.flush(timeout=2)
+        assert sorted(n for batch in batches for n in batch) == [0, 1, 2, 3, 4]
+        assert len(batches) <= 2
+        assert write_queue.depth() == 0
+
+    def test_failed_writes_are_retried(self, write_queue):
+        """失敗として返した要求はバックオフ後に再試行される"""
+        attempts = []
+
+        def handler(batch):
+            attempts.append(len(batch))
+            return batch if len(attempts) < 3 else []
+
+        write_queue.register_handler("firebase", handler)
+        write_queue.submit("firebase", {"id": "a"})
+        _wait_until_empty(write_queue)
+        assert write_queue.depth() == 0
+        assert len(attempts) == 3
+        assert write_queue.dropped == 0
+
+    def test_gives_up_after_max_retries(self, write_queue):
+        """再試行上限を超えた要求は破棄される"""
+        write_queue.register_handler("broken", lambda batch: batch)
+        write_queue.submit("broken", {"id": "a"})
+        _wait_until_empty(write_queue)
+        assert write_queue.depth() == 0
+        assert write_queue.dropped == 1
+
+    def test_handler_exception_counts_as_failure(self, write_queue):
+        """ハンドラの例外は全件失敗として扱われる"""
+        calls = []
+
+        def handler(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            return []
+
+        write_queue.register_handler("local", handler)
+        write_queue.submit("local", {"id": "a"})
+        _wait_until_empty(write_queue)
+        assert len(calls) == 2
+
+    def test_shutdown_drains_pending_writes(self):
+        """終了時に残っている要求を書き出す"""
+        written = []
+        queue = WriteBehindQueue()
+        queue.register_handler("session", lambda batch: written.extend(batch) or [])
+        for n in range(3):
+            queue.submit("session", {"n": n})
+        queue.shutdown(timeout=2)
+        assert [item["n"] for item in written] == [0, 1, 2]
+        assert queue.depth() == 0